@@ -0,0 +1,217 @@
+'''
+Benchmark the parsers on the bundled device files, and check the results
+against a stored baseline.
+
+    python benchmarks/parsers.py [-n REPEAT] [-o RESULTS] [--save BASELINE [--nodes]]
+                                 [--baseline BASELINE] [--tolerance TOL] [file ...]
+
+Each file is parsed in a fresh process, which reports:
+
+    time         the best of `REPEAT` parse times, in seconds
+    peak_memory  the growth of the peak resident set size over the parse, in MB
+    nodes        the number of blocks in the parsed device
+    phases       the time spent, in a profiled parse, in each phase: 'load'
+                 (XML or JSON decoding), 'wrap' (SVDNode wrapping), 'parse'
+                 (the rest of the parser), 'build' (block construction) and
+                 'bind' (binding subblocks as attributes)
+
+The results can be written as JSON with -o, or saved as a baseline with
+--save. With --baseline, a file whose node count changed, or that got slower
+or bigger than its baseline by more than the tolerance, is a regression and
+the script exits with status 1. Only what the baseline holds is compared.
+
+Times and memory depend on the machine, so the bundled baseline.json only
+holds the node counts (saved with --save --nodes). To also gate on times, CI
+should keep the full results of the previous commit on the same machine and
+check against those, e.g.
+
+    python benchmarks/parsers.py --baseline cache/bench.json -o bench.json
+
+then cache bench.json for the next commit.
+'''
+import subprocess
+import argparse
+import cProfile
+import inspect
+import pstats
+import resource
+import json
+import time
+import os
+import sys
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+
+# run from a checkout, without mmdev installed
+sys.path.insert(0, os.path.join(BENCHDIR, os.pardir))
+from mmdev import utils, blocks
+from mmdev.parsers import svd_parse
+DATADIR = os.path.join(BENCHDIR, os.pardir, 'data')
+DEVFILES = ('ARM_Sample.svd', 'STM32F20x.svd', 'LPC178x_7x.svd', 'armv7m.json', 'dap.json')
+BASELINE = os.path.join(BENCHDIR, 'baseline.json')
+PHASES = 'load', 'wrap', 'parse', 'build', 'bind'
+
+# Differences too small to be told from noise, whatever the tolerance
+SLACK = {'time': 0.01, 'peak_memory': 1.0}
+
+MMDEV = os.path.dirname(os.path.abspath(blocks.__file__))
+
+
+def _lines(obj):
+    lines, start = inspect.getsourcelines(obj)
+    return start, start + len(lines)
+
+
+def _classifier():
+    # Maps a profiled function to its phase
+    wrap = [_lines(svd_parse.SVDNode), _lines(svd_parse._metadata)]
+    bind = _lines(blocks.Block.__new__)
+    blockfiles = set(os.path.join(MMDEV, f) for f in ('blocks.py', 'components.py',
+                                                      'arrays.py', 'utils.py'))
+
+    def classify(func):
+        filename, lineno, name = func
+        filename = os.path.abspath(filename.replace('.pyc', '.py'))
+        if filename in blockfiles:
+            if filename.endswith('blocks.py') and bind[0] <= lineno < bind[1]:
+                return 'bind'
+            return 'build'
+        if filename == os.path.abspath(svd_parse.__file__.replace('.pyc', '.py')):
+            if any(start <= lineno < end for start, end in wrap):
+                return 'wrap'
+            return 'parse'
+        if filename.startswith(MMDEV):
+            return 'parse'
+        return 'load'
+    return classify
+
+
+def phases(devfile):
+    """
+    Profile a parse of `devfile` and return the time spent in each phase.
+    Built-in functions are counted in the phase of their caller.
+    """
+    profile = cProfile.Profile()
+    profile.runcall(utils.from_devfile, devfile, raiseErr=False)
+    stats = pstats.Stats(profile).stats
+    classify = _classifier()
+
+    totals = dict.fromkeys(PHASES, 0.0)
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        if func[0] != '~':
+            totals[classify(func)] += tt
+            continue
+        # a built-in: split its time between its callers
+        for caller, edge in callers.iteritems():
+            phase = 'load' if caller[0] == '~' else classify(caller)
+            totals[phase] += edge[2]
+    return dict((phase, round(t, 6)) for phase, t in totals.iteritems())
+
+
+def _maxrss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on OS X
+    return rss / float(1 << 20) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def measure(devfile, repeat=3):
+    """
+    Measure the parse of `devfile` in this process.
+    """
+    start = _maxrss()
+    best, nodes = None, None
+    for i in xrange(repeat):
+        t = time.time()
+        dev = utils.from_devfile(devfile, raiseErr=False)
+        elapsed = time.time() - t
+        if i == 0:
+            peak = _maxrss() - start
+            nodes = sum(1 for blk in dev.walk())
+        best = elapsed if best is None else min(best, elapsed)
+        del dev
+    return dict(time=best, peak_memory=peak, nodes=nodes, phases=phases(devfile))
+
+
+def run(devfile, repeat=3):
+    """
+    Measure the parse of `devfile` in a fresh process.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', '-n', str(repeat), devfile]
+    with open(os.devnull, 'w') as devnull:
+        out = subprocess.check_output(cmd, stderr=devnull)
+    return json.loads(out)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of the regressions of `results` against `baseline`.
+    """
+    regressions = []
+    for name, result in sorted(results.iteritems()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['nodes'] != base['nodes']:
+            regressions.append("%s: %d nodes, expected %d" % (name, result['nodes'], base['nodes']))
+        for key, unit in (('time', 's'), ('peak_memory', 'MB')):
+            if key in base and result[key] > base[key] * (1 + tolerance) + SLACK[key]:
+                regressions.append("%s: %s %.3f%s, baseline %.3f%s (+%.0f%%)"
+                                   % (name, key, result[key], unit, base[key], unit,
+                                      100.0 * (result[key] / (base[key] or 1) - 1)))
+    return regressions
+
+
+def report(results):
+    print '%-16s %9s %9s %7s' % ('file', 'time', 'memory', 'nodes') + \
+          ''.join('%8s' % p for p in PHASES)
+    for name, r in sorted(results.iteritems()):
+        total = sum(r['phases'].values()) or 1
+        print '%-16s %8.3fs %7.1fMB %7d' % (name, r['time'], r['peak_memory'], r['nodes']) + \
+              ''.join('%7.0f%%' % (100 * r['phases'][p] / total) for p in PHASES)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the device file parsers")
+    parser.add_argument('files', nargs='*', help="device files (default: the bundled files)")
+    parser.add_argument('-n', dest='repeat', type=int, default=3, help="parses per file")
+    parser.add_argument('-o', dest='output', help="write the results to this file as JSON")
+    parser.add_argument('--save', metavar='BASELINE', nargs='?', const=BASELINE,
+                        help="save the results as the baseline")
+    parser.add_argument('--nodes', action='store_true',
+                        help="only save the node counts, which don't depend on the machine")
+    parser.add_argument('--baseline', metavar='BASELINE', nargs='?', const=BASELINE,
+                        help="check the results against the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="the allowed slowdown or growth, as a fraction")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print json.dumps(measure(args.files[0], args.repeat))
+        return 0
+
+    devfiles = args.files or [os.path.join(DATADIR, f) for f in DEVFILES]
+    results = dict((os.path.basename(f), run(f, args.repeat)) for f in devfiles)
+    report(results)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+    if args.save:
+        saved = results
+        if args.nodes:
+            saved = dict((name, {'nodes': r['nodes']}) for name, r in results.iteritems())
+        with open(args.save, 'w') as fh:
+            json.dump(saved, fh, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for r in regressions:
+            print 'REGRESSION', r
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,73 @@
+'''
+Compare the XML backends of the SVD parser on the bundled device files.
+
+    python benchmarks/svd_backends.py [-n REPEAT] [file.svd ...]
+
+Each file is parsed `REPEAT` times with every backend that is installed and
+the best time is reported, along with the speedup over the pure Python
+ElementTree backend.
+'''
+import os
+import sys
+import time
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+DATADIR = os.path.join(BENCHDIR, os.pardir, 'data')
+
+# run from a checkout, without mmdev installed
+sys.path.insert(0, os.path.join(BENCHDIR, os.pardir))
+from mmdev.parsers import SVDParser
+from mmdev.parsers.svd_parse import BACKENDS, get_backend
+DEVFILES = ('ARM_Sample.svd', 'LPC178x_7x.svd', 'STM32F20x.svd')
+
+
+def available():
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def bench(devfile, backend, repeat=3):
+    """
+    Return the best of `repeat` parse times of `devfile` with `backend`, and
+    the number of blocks in the parsed device.
+    """
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        dev = SVDParser(devfile, raiseErr=False, backend=backend)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, sum(1 for blk in dev.walk())
+
+
+def main(argv):
+    repeat = 3
+    if argv[:1] == ['-n']:
+        repeat, argv = int(argv[1]), argv[2:]
+    devfiles = argv or [os.path.join(DATADIR, f) for f in DEVFILES]
+    backends = available()
+
+    # parse errors in the bundled files are reported by the parser on stderr
+    stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+    try:
+        results = [(devfile, [bench(devfile, b, repeat) for b in backends]) for devfile in devfiles]
+    finally:
+        sys.stderr = stderr
+
+    print '%-20s' % 'file' + ''.join('%16s' % b for b in backends)
+    for devfile, times in results:
+        base = times[backends.index('ElementTree')][0]
+        print '%-20s' % os.path.basename(devfile) + \
+              ''.join('%9.3fs %4.1fx' % (t, base / t) for t, n in times)
+        if len(set(n for t, n in times)) > 1:
+            print '    block counts differ between backends: %s' % [n for t, n in times]
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
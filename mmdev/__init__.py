@@ -12,6 +12,15 @@ import transport
 import devicelink
 import cables
 
+import memview
+import sequence
+import scheduler
+import sampler
+import watch
+import catalog
+import aio
+import session
+
 import target
 
 import parsers
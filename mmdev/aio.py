@@ -0,0 +1,304 @@
+'''
+Asynchronous access to a target.
+
+All link I/O is blocking, so it is handed to a LinkWorker: a single thread
+that owns the device link and acts as its executor. Memory transfers submitted
+while the worker is busy are coalesced: everything pending is queued on the
+link and sent as one shared transfer. Any other blocking call (e.g. a register
+access through the block API) can be run on the worker with ``call``, which
+keeps all use of the link on one thread.
+
+Submitting work returns a Future. If trollius (the asyncio port for Python 2)
+is installed, the futures returned by the Target ``a*`` methods are wrapped as
+event loop futures so they can be waited on from coroutines:
+
+>>> @asyncio.coroutine
+... def blink(target):
+...     odr = yield From(target.GPIOA.ODR.aget())
+...     yield From(target.GPIOA.ODR.aset(odr ^ 1))
+
+Without trollius, they are plain Futures which can be waited on from any
+thread with ``result()``.
+'''
+from mmdev.transport import Transport
+import collections
+import threading
+import logging
+
+try:
+    import trollius as asyncio
+except ImportError:
+    asyncio = None
+
+logger = logging.getLogger(__name__)
+
+
+class Future(object):
+    """
+    The result of work submitted to a LinkWorker.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for and return the result, raising the exception the work failed
+        with, if any.
+        """
+        if not self._done.wait(timeout):
+            raise LinkWorker.Timeout("Timed out waiting for result")
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise LinkWorker.Timeout("Timed out waiting for result")
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """
+        Call `fn` with this future once it is done. Callbacks are run on the
+        worker thread.
+        """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                logger.exception("Exception in future callback")
+
+
+def chain(future, fn):
+    """
+    Return a Future for `fn` applied to the result of `future`.
+    """
+    chained = Future()
+
+    def apply(f):
+        if f._exception is not None:
+            chained.set_exception(f._exception)
+            return
+        try:
+            chained.set_result(fn(f._result))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(apply)
+    return chained
+
+
+def wrap_future(future, loop=None):
+    """
+    Wrap a Future as an event loop future if trollius is available, otherwise
+    return it as is.
+    """
+    if asyncio is None:
+        return future
+
+    loop = loop or asyncio.get_event_loop()
+    wrapped = asyncio.Future(loop=loop)
+
+    def copy(f):
+        if wrapped.cancelled():
+            return
+        if f._exception is not None:
+            wrapped.set_exception(f._exception)
+        else:
+            wrapped.set_result(f._result)
+
+    future.add_done_callback(lambda f: loop.call_soon_threadsafe(copy, f))
+    return wrapped
+
+
+class LinkWorker(object):
+    """
+    Runs the I/O of a device link on a background thread, coalescing memory
+    transfers that are submitted together into shared link transfers.
+
+    If any transfer in a shared batch fails, all of the writes in the batch
+    fail with the first error, since the link only reports errors per batch.
+    Reads that were cancelled by the failure also report the first error.
+
+    Parameters
+    ----------
+    link : mmdev.devicelink.DeviceLink
+        The link to run transfers on.
+    maxBatch : int
+        The most submissions coalesced into a single link transfer.
+    lock : threading.RLock
+        A lock held while each batch is sent, for links that are also used
+        directly from other threads (see ``mmdev.scheduler.Scheduler``).
+        Without one, the link should not be used from other threads while the
+        worker is running.
+    """
+    class WorkerException(Exception):
+        pass
+
+    class Timeout(WorkerException):
+        pass
+
+    class Closed(WorkerException):
+        pass
+
+    def __init__(self, link, maxBatch=256, lock=None):
+        self.link = link
+        self.maxBatch = maxBatch
+        self.lock = lock
+        self.batches = 0
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='LinkWorker')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def read(self, address, count=1, accessSize=32):
+        """
+        Submit a read of `count` values from consecutive, aligned addresses.
+        The future's result is the list of values.
+        """
+        return self._submit(('read', address, count, accessSize))
+
+    def write(self, address, data, accessSize=32):
+        """
+        Submit a write of a sequence of values to consecutive, aligned
+        addresses.
+        """
+        return self._submit(('write', address, list(data), accessSize))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Submit any blocking call to be run on the worker thread.
+        """
+        return self._submit(('call', fn, args, kwargs))
+
+    def close(self, wait=True):
+        """
+        Stop the worker once the work already submitted is done.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _submit(self, request):
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise self.Closed("The worker has been closed")
+            self._pending.append((request, future))
+            self._cond.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = [self._pending.popleft()
+                         for i in xrange(min(len(self._pending), self.maxBatch))]
+
+            transfers = []
+            for request, future in batch:
+                if request[0] != 'call':
+                    transfers.append((request, future))
+                    continue
+
+                # calls are run in order with respect to the transfers around them
+                self._transfer(transfers)
+                transfers = []
+                fn, args, kwargs = request[1:]
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+            self._transfer(transfers)
+
+    def _transfer(self, transfers):
+        if not transfers:
+            return
+        self.batches += 1
+        if self.lock is None:
+            transfer(self.link, transfers)
+        else:
+            with self.lock:
+                transfer(self.link, transfers)
+
+
+def transfer(link, transfers):
+    """
+    Queue a list of (request, future) memory transfers on `link`, send them as
+    one batch and complete the futures.
+
+    If any transfer in the batch fails, all of the writes fail with the first
+    error, since the link only reports errors per batch. Reads that were
+    cancelled by the failure also report the first error.
+    """
+    reads = []
+    error = None
+    try:
+        for request, future in transfers:
+            kind, address, data, accessSize = request
+            if kind == 'read':
+                reads.append((link.queueMemRead(address, data, accessSize), future))
+            else:
+                link.queueMemWrite(address, data, accessSize)
+    except Exception as e:
+        error = e
+
+    # send whatever was queued even if queueing failed part way, so that
+    # nothing is left on the link for the next batch
+    try:
+        link.sync()
+    except Exception as e:
+        error = error or e
+
+    for request, future in transfers:
+        if request[0] != 'write':
+            continue
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    for values, future in reads:
+        try:
+            future.set_result(list(values))
+        except Transport.CancelledRequest as e:
+            # report what went wrong rather than the cancellation
+            future.set_exception(error or e)
+        except Exception as e:
+            future.set_exception(e)
+
+    # reads that were never queued
+    for request, future in transfers:
+        if not future.done():
+            future.set_exception(error)
@@ -30,6 +30,11 @@ class RegisterArray(blocks.IOBlockArray):
                                          template.address + self._intindex[i]*self._elementSize, 
                                          template.size, 
                                          access=template.access,
+                                         resetMask=template.resetMask,
+                                         resetValue=template.resetValue,
+                                         modifiedWriteValues=template.modifiedWriteValues,
+                                         readAction=template.readAction,
+                                         writeConstraint=template.writeConstraint,
                                          bind=True, 
                                          displayName=(template.displayName + self._suffix) % i,
                                          description=template.description, kwattrs=template._kwattrs)
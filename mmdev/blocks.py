@@ -6,6 +6,7 @@ import json
 import collections
 import copy
 import itertools
+import contextlib
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +14,35 @@ logger = logging.getLogger(__name__)
 __allblocks__ = [] # Register of all Block types
 
 
+class _BlockDoc(object):
+    """
+    The docstring of a block class, which for an instance of the class is
+    its description. Wrapping the description is left until it is asked for,
+    since it is rarely needed and takes a good part of the time to build a
+    device.
+    """
+    def __init__(self, doc):
+        self.doc = doc
+
+    def __get__(self, blk, cls=None):
+        if blk is None:
+            return self.doc
+        return textwrap.fill(blk.description, width=70)
+
+
+class _LazyNodes(object):
+    """
+    The subblocks of a block that are only built, by the block's
+    ``_buildnodes``, when they are first accessed. Until then they are not in
+    the block's __dict__, which is how ``Block.walk`` tells them apart.
+    """
+    def __get__(self, blk, cls=None):
+        if blk is None:
+            return self
+        nodes = blk.__dict__['_nodes'] = blk._buildnodes()
+        return nodes
+
+
 class MetaBlock(type):
     def __new__(cls, name, bases, attrs):
         clsattrs = attrs.get('_attrs', ())
@@ -37,6 +67,8 @@ class MetaBlock(type):
         attrs['_attrs'] = clsattrs
         if '_typename' not in attrs:
             attrs['_typename'] = name
+        if not isinstance(attrs.get('__doc__'), _BlockDoc):
+            attrs['__doc__'] = _BlockDoc(attrs.get('__doc__'))
 
         # __allblocks__.append(newcls.__module__ + '.' + name)
 
@@ -76,7 +108,6 @@ class LeafBlock(object):
         self.root = self
 
         self._kwattrs = kwattrs
-        self.__doc__ = textwrap.fill(self.description, width=70)
 
     @property
     def _macrovalue(self):
@@ -146,6 +177,18 @@ class LeafBlock(object):
 
         return blk
 
+    # Blocks are pickled detached from their parent, like a copy, so that a
+    # subtree can be sent between processes on its own
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['parent'], state['root']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parent = None
+        self.root = self
+
     def __repr__(self):
         return "<{:s} '{:s}'>".format(self._typename, self.mnemonic)
 
@@ -240,6 +283,10 @@ class BlockArray(LeafBlock):
         raise NotImplementedError
 
 
+def _newblock(cls, mnemonic, subblocks, bind):
+    return cls.__new__(cls, mnemonic, subblocks, bind=bind)
+
+
 class ValueIndex(object):
     """\
     Indexer for that allows for writing/reading values from a block array using
@@ -390,13 +437,30 @@ class Block(LeafBlock):
 
     def __copy__(self):
         cls = self.__class__.__base__ if self._dynamicBinding else self.__class__
-        blk = cls.__new__(cls, self.mnemonic, self._nodes, bind=self._bound)
+        blk = cls.__new__(cls, self.mnemonic, self.__dict__.get('_nodes', ()), bind=self._bound)
         blk.__dict__.update(self.__dict__)
         blk.parent = None
         blk.root = blk
 
         return blk
 
+    def __reduce__(self):
+        # rebuild through __new__, which creates the class a dynamically bound
+        # block needs
+        cls = self.__class__.__base__ if self._dynamicBinding else self.__class__
+        return (_newblock, (cls, self.mnemonic, self.__dict__.get('_nodes', ()), self._bound),
+                self.__getstate__())
+
+    def __setstate__(self, state):
+        super(Block, self).__setstate__(state)
+        for blk in self.__dict__.get('_nodes', ()):
+            blk.parent = self
+            if isinstance(blk, BlockArray):
+                # the elements built so far have the array's parent
+                for elem in blk._index.itervalues():
+                    if elem is not None:
+                        elem.parent = self
+
     # def __deepcopy__(self, memo):
     #     blk = self.__copy__()
     #     memo[id(self)] = blk
@@ -450,21 +514,31 @@ class Block(LeafBlock):
     def itervalues(self):
         return iter(self._nodes)
 
-    def walk(self, d=-1, l=1):
+    def walk(self, d=-1, l=1, build=True):
+        """
+        Iterate breadth first over the blocks from `l` levels below this one,
+        down through `d` levels (or to the bottom if `d` is negative). If
+        `build` is False, subblocks that are built on access (see
+        ``BitField``) and have not been built yet are left out.
+        """
         n = 1
-        blocks = [self]
+        blocks = collections.deque([self])
 
         while blocks and d != 0:
-            blk = blocks.pop(0)
+            blk = blocks.popleft()
             n -= 1
 
             if l == 0:
                 yield blk
 
-            if isinstance(blk, BlockArray):
+            if l == 0 and d == 1:
+                pass # the last level, whose subblocks are not walked
+            elif isinstance(blk, BlockArray):
                 blocks.extend(list(blk))
-            else:
+            elif build:
                 blocks.extend(getattr(blk, '_nodes', []))
+            else:
+                blocks.extend(blk.__dict__.get('_nodes', []))
             if n == 0:
                 n = len(blocks)
                 if l == 0:
@@ -518,11 +592,25 @@ class IOBlock(Block):
                                       description=description, kwattrs=kwattrs)
         self.size = size
         self.access = access
+        self._bindaccess()
+
+    def _bindaccess(self):
         if Access[self.access] & WRACC:
             self.__write = self._write
         if Access[self.access] & RDACC:
             self.__read = self._read
 
+    def __getstate__(self):
+        state = super(IOBlock, self).__getstate__()
+        # bound methods can't be pickled; they are bound again on unpickling
+        state.pop('_IOBlock__read', None)
+        state.pop('_IOBlock__write', None)
+        return state
+
+    def __setstate__(self, state):
+        super(IOBlock, self).__setstate__(state)
+        self._bindaccess()
+
     def __read(self):
         return 0
 
@@ -539,6 +627,22 @@ class IOBlock(Block):
     def value(self):
         return utils.HexValue(self.__read(), self.size)
 
+    def aget(self):
+        """
+        Read the value asynchronously through the root's ``acall``. Returns a
+        future.
+        """
+        return self.root.acall(lambda: self.value)
+
+    def aset(self, value):
+        """
+        Write the value asynchronously through the root's ``acall``. Returns a
+        future.
+        """
+        def write():
+            self.value = value
+        return self.root.acall(write)
+
     @value.setter
     def value(self, value):
         self.__write(value)
@@ -618,19 +722,35 @@ class DeviceBlock(Block):
         self.laneWidth = laneWidth
         self.busWidth = busWidth
 
-        for blk in self.walk():
+        for blk in self.walk(build=False):
             if isinstance(blk, DeviceBlock):
                 # We'll assume that if there is a device block on this level that
                 # all other nodes on this level are also device block types
                 break
             blk.root = self
 
+    def __setstate__(self, state):
+        super(DeviceBlock, self).__setstate__(state)
+        for blk in self.walk(build=False):
+            if isinstance(blk, DeviceBlock):
+                break
+            blk.root = self
+
     def _read(self, *args, **kwargs):
         raise IOError("No I/O interface has been bound to this block")
 
     def _write(self, *args, **kwargs):
         raise IOError("No I/O interface has been bound to this block")
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Group the I/O in a with block so that it is not interleaved with I/O
+        from other threads. Blocks that are bound to an I/O interface override
+        this.
+        """
+        yield
+
     def find(self, key):
         try:
             return (blk for blk in self.walk() if key == blk.mnemonic).next()
@@ -0,0 +1,288 @@
+'''
+An index of the devices described by a directory of SVD files.
+
+Finding the device that has a given peripheral, or the file that describes a
+device, would otherwise mean parsing every file. A Catalog instead reads just
+the header of each file - the device's name, vendor and cpu, and the name and
+base address of each peripheral - with a streaming parser that skips over the
+registers, and keeps them in an SQLite database. Files are scanned in a pool
+of processes, and rescanning only reads the files that have changed since.
+
+Example
+-------
+>>> catalog = Catalog('devices.db')
+>>> catalog.scan('/path/to/svd', processes=True)
+>>> catalog.find('USART*', address=0x40011000)
+[(u'STM32F20x', u'USART1', 1073811456)]
+>>> dev = catalog.from_devfile('STM32F20x')
+'''
+from mmdev import utils
+import multiprocessing
+import sqlite3
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = '.svd',
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    vendor TEXT,
+    cpu TEXT,
+    description TEXT,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS peripherals (
+    device INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    groupName TEXT,
+    baseAddress INTEGER
+);
+CREATE INDEX IF NOT EXISTS devices_name ON devices (name);
+CREATE INDEX IF NOT EXISTS peripherals_device ON peripherals (device);
+CREATE INDEX IF NOT EXISTS peripherals_name ON peripherals (name);
+CREATE INDEX IF NOT EXISTS peripherals_address ON peripherals (baseAddress);
+'''
+
+
+def read_header(devfile, backend=None):
+    """
+    Read the header of an SVD file without parsing its registers.
+
+    Returns
+    -------
+    header : dict
+        The device's 'name', 'vendor', 'cpu' and 'description', and its
+        'peripherals' as a list of (name, groupName, baseAddress) tuples. A
+        derived peripheral without a groupName of its own has its parent's.
+    """
+    from mmdev.parsers.svd_parse import get_backend, _parseint
+    etree = get_backend(backend)
+
+    header = dict(name=None, vendor=None, cpu=None, description=None, peripherals=[])
+    pphs = header['peripherals']
+    derived = {}
+    depth = 0
+    for event, elem in etree.iterparse(devfile, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            continue
+        depth -= 1
+
+        if depth == 2 and elem.tag == 'peripheral':
+            address = elem.findtext('baseAddress')
+            pphs.append((elem.findtext('name'), elem.findtext('groupName'),
+                         None if address is None else _parseint(address)))
+            if elem.get('derivedFrom') is not None:
+                derived[pphs[-1][0]] = elem.get('derivedFrom')
+            elem.clear()
+        elif depth != 1:
+            continue
+        elif elem.tag in ('name', 'vendor', 'description'):
+            header[elem.tag] = (elem.text or '').strip()
+        elif elem.tag == 'cpu':
+            header['cpu'] = elem.findtext('name')
+        elif elem.tag == 'peripherals':
+            # nothing after the peripherals is of interest
+            break
+
+    # a parent may come after the peripherals derived from it, so inherited
+    # group names are resolved once they have all been read
+    groups = dict((name, group) for name, group, address in pphs)
+    for i, (name, group, address) in enumerate(pphs):
+        parent, seen = derived.get(name), set([name])
+        while group is None and parent in groups and parent not in seen:
+            seen.add(parent)
+            group, parent = groups[parent], derived.get(parent)
+        pphs[i] = name, group, address
+    return header
+
+
+def _scanfile(args):
+    # Runs in a worker process when scanning in parallel
+    path, backend = args
+    try:
+        return path, read_header(path, backend)
+    except Exception as e:
+        logger.warning("Failed to read the header of '%s': %s" % (path, e))
+        return path, None
+
+
+class Catalog(object):
+    """
+    An index of the devices described by the SVD files in one or more
+    directories, stored in an SQLite database.
+
+    Parameters
+    ----------
+    filename : str
+        The database file. The default keeps the index in memory.
+
+    Attributes
+    ----------
+    db : sqlite3.Connection
+        The database connection.
+    """
+    def __init__(self, filename=':memory:'):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(_SCHEMA)
+
+    def scan(self, directory, processes=None, backend=None):
+        """
+        Index the SVD files in `directory` and its subdirectories. Files that
+        have not changed since they were last indexed are skipped, and files
+        that are gone are dropped from the index. If `processes` is given,
+        files are read in a pool of that many processes (or one per core, if
+        True).
+
+        Returns
+        -------
+        indexed, removed : int
+            The number of files that were (re)indexed, and that were dropped.
+        """
+        directory = os.path.abspath(directory)
+        found = {}
+        for dirpath, dirnames, filenames in os.walk(directory):
+            for fn in filenames:
+                if os.path.splitext(fn)[1].lower() in EXTENSIONS:
+                    path = os.path.join(dirpath, fn)
+                    st = os.stat(path)
+                    found[path] = st.st_mtime, st.st_size
+
+        known = dict((path, (mtime, size)) for path, mtime, size in
+                     self.db.execute("SELECT path, mtime, size FROM devices"))
+        prefix = os.path.join(directory, '')
+        removed = [path for path in known if path.startswith(prefix) and path not in found]
+        stale = sorted(path for path, stat in found.iteritems() if known.get(path) != stat)
+
+        jobs = [(path, backend) for path in stale]
+        pool = None
+        if processes and len(jobs) > 1:
+            pool = multiprocessing.Pool(None if processes is True else processes)
+        try:
+            headers = pool.imap_unordered(_scanfile, jobs) if pool else map(_scanfile, jobs)
+            indexed = 0
+            with self.db:
+                for path in removed:
+                    self._remove(path)
+                for path, header in headers:
+                    self._remove(path)
+                    # files that can't be read are kept without a name, so
+                    # that they are only read again once they change
+                    self._add(path, found[path], header or {})
+                    indexed += header is not None and header['name'] is not None
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return indexed, len(removed)
+
+    def _remove(self, path):
+        row = self.db.execute("SELECT id FROM devices WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM peripherals WHERE device = ?", row)
+            self.db.execute("DELETE FROM devices WHERE id = ?", row)
+
+    def _add(self, path, stat, header):
+        cursor = self.db.execute(
+            "INSERT INTO devices (name, vendor, cpu, description, path, mtime, size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (header.get('name'), header.get('vendor'), header.get('cpu'),
+             header.get('description'), path) + stat)
+        devid = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO peripherals (device, name, groupName, baseAddress) VALUES (?, ?, ?, ?)",
+            ((devid,) + pph for pph in header.get('peripherals', ())))
+
+    def devices(self, vendor=None, cpu=None):
+        """
+        Return the names of the indexed devices, optionally only those of a
+        given vendor or cpu.
+        """
+        query, args = "SELECT DISTINCT name FROM devices WHERE name IS NOT NULL", []
+        if vendor is not None:
+            query += " AND vendor = ?"
+            args.append(vendor)
+        if cpu is not None:
+            query += " AND cpu = ?"
+            args.append(cpu)
+        return [row[0] for row in self.db.execute(query + " ORDER BY name", args)]
+
+    def find(self, peripheral=None, address=None, device=None):
+        """
+        Find peripherals by name, which may be a glob pattern such as
+        'USART*', by base address, or both.
+
+        Returns
+        -------
+        matches : list of (device, peripheral, baseAddress)
+        """
+        query = ("SELECT d.name, p.name, p.baseAddress FROM peripherals p "
+                 "JOIN devices d ON d.id = p.device WHERE 1")
+        args = []
+        if peripheral is not None:
+            query += " AND p.name GLOB ?"
+            args.append(peripheral)
+        if address is not None:
+            query += " AND p.baseAddress = ?"
+            args.append(int(address))
+        if device is not None:
+            query += " AND d.name = ?"
+            args.append(device)
+        return self.db.execute(query + " ORDER BY d.name, p.baseAddress", args).fetchall()
+
+    def header(self, device):
+        """
+        Return the header of a device, as returned by ``read_header``, along
+        with the 'path' of its file.
+        """
+        row = self.db.execute(
+            "SELECT id, name, vendor, cpu, description, path FROM devices "
+            "WHERE name = ? ORDER BY mtime DESC LIMIT 1", (device,)).fetchone()
+        if row is None:
+            raise KeyError("Device '%s' is not in the catalog" % device)
+        header = dict(zip(('name', 'vendor', 'cpu', 'description', 'path'), row[1:]))
+        header['peripherals'] = self.db.execute(
+            "SELECT name, groupName, baseAddress FROM peripherals WHERE device = ? "
+            "ORDER BY baseAddress", row[:1]).fetchall()
+        return header
+
+    def path(self, device):
+        """
+        Return the file that describes a device. If several files describe
+        devices by that name, the most recently modified one is returned.
+        """
+        row = self.db.execute("SELECT path FROM devices WHERE name = ? "
+                              "ORDER BY mtime DESC LIMIT 1", (device,)).fetchone()
+        if row is None:
+            raise KeyError("Device '%s' is not in the catalog" % device)
+        return row[0]
+
+    def from_devfile(self, device, **kwparse):
+        """
+        Parse the file of a device by its name. (see ``mmdev.from_devfile``)
+        """
+        return utils.from_devfile(self.path(device), **kwparse)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, device):
+        return self.db.execute("SELECT 1 FROM devices WHERE name = ?", (device,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(name) FROM devices").fetchone()[0]
+
+    def __repr__(self):
+        return "<{:s} of {:d} devices>".format(self.__class__.__name__, len(self))
@@ -1,9 +1,24 @@
 import blocks
 from mmdev import utils
+import collections
+import logging
+import re
+
+logger = logging.getLogger(__name__)
 
 
 __all__ = ["CPU", "Device", "Port", "AccessPort", "DebugPort", "Peripheral",
-           "Register", "BitField", "EnumeratedValue"]
+           "Register", "BitField", "EnumeratedValue", "EnumTable"]
+
+# Cortex-M3/M4 bit-band regions as (region base, alias base). Each bit in the
+# first BITBAND_SIZE bytes of a region is mapped to a word in its alias region.
+BITBAND_REGIONS = ((0x20000000, 0x22000000), (0x40000000, 0x42000000))
+BITBAND_SIZE = 0x100000
+BITBAND_CPUS = 'CM3', 'CM4', 'SC300'
+
+# modifiedWriteValues for which writing 0 (W1x) or 1 (W0x) leaves a bit as is
+_WRITE_ONE = 'oneToClear', 'oneToSet', 'oneToToggle'
+_WRITE_ZERO = 'zeroToClear', 'zeroToSet', 'zeroToToggle'
 
 _levels = {'device': 0,
            'peripheral': 1,
@@ -41,6 +56,8 @@ class Device(blocks.DeviceBlock):
         Defines the bit-width of the maximum single data transfer supported by
         the bus infrastructure. For example, a value of 32 denotes that the
         device bus can transfer a maximum of 32 bits in a single transfer.
+    cpu : CPU
+        The processor core of the device, if described.
     bind : bool
         Tells the constructor whether or not to bind the subblocks as attributes
         of the Block instance.
@@ -49,6 +66,15 @@ class Device(blocks.DeviceBlock):
     description : str
         A string describing functionality, usage, and other relevant notes about
         the block.
+
+    Attributes
+    ----------
+    bitband : bool
+        Whether single bit fields in the bit-band regions are accessed through
+        their alias words. Enabled when the cpu is a Cortex-M3 or M4; set to
+        False to fall back to read-modify-writes of the parent register. A
+        device without a cpu node has it disabled, unless it is parsed with
+        ``from_devfile(..., bitband=True)`` (or set afterwards).
     """ 
     _attrs = 'vendor'
 
@@ -60,16 +86,107 @@ class Device(blocks.DeviceBlock):
                                      description=description, kwattrs=kwattrs)
         self.vendor = vendor
         self.cpu = cpu
+        self.bitband = cpu is not None and str(cpu.mnemonic).upper() in BITBAND_CPUS
 
         # purely for readability, set the address width for peripherals and
-        # registers
-        # for blk in self.walk(d=2):
-        #     blk._macrovalue = utils.HexValue(blk._macrovalue, self.busWidth)
+        # registers (the parser leaves values as plain ints)
+        for blk in self.walk(d=2):
+            if isinstance(blk.__dict__.get('address'), int):
+                blk.address = utils.HexValue(blk.address, self.busWidth)
+
+    def bitbandAddress(self, address, bit):
+        """
+        Return the alias address of bit `bit` of the data at `address`, or None
+        if bit-banding is disabled or the address is outside the bit-band
+        regions.
+        """
+        if not self.bitband:
+            return None
+        address += bit >> 3
+        for base, alias in BITBAND_REGIONS:
+            if base <= address < base + BITBAND_SIZE:
+                return alias + ((address - base) << 5) + ((bit & 7) << 2)
+        return None
 
     def set_format(self, blocktype, fmt):
         for blk in self.walk(d=1, l=_levels[blocktype.lower()]):
             blk._fmt = fmt
 
+    def reload(self):
+        """
+        Parse the device file this device was read from again, and patch the
+        changes into this device in place. Peripherals whose definition has
+        not changed are kept as they are, so references to them and to their
+        registers stay valid; changed peripherals are replaced by new ones.
+
+        Unchanged peripherals are found from a cache, which is kept from the
+        first reload on. Parse the device with ``from_devfile(...,
+        reload=True)`` to fill it from the start; otherwise the first reload
+        replaces every peripheral.
+
+        ``bitband`` is decided again from the new cpu, unless the device was
+        parsed with a `bitband` override, which is kept.
+
+        Returns
+        -------
+        added, removed : tuple
+            The peripherals that were added to and removed from the device.
+        """
+        source = getattr(self, '_source', None)
+        if source is None:
+            raise ValueError("%r was not parsed from a device file" % self)
+        devfile, kwparse = source
+        cache = getattr(self, '_cache', None)
+        if cache is None:
+            # the device was parsed without a cache, or was unpickled and has
+            # lost it, so this reload replaces every peripheral
+            cache = self._cache = {}
+
+        new = utils.from_devfile(devfile, cache=cache, **kwparse)
+        if new is None:
+            raise ValueError("Failed to parse '%s'" % devfile)
+
+        with self.transaction():
+            kept = set(map(id, new._nodes))
+            removed = tuple(blk for blk in self._nodes if id(blk) not in kept)
+            kept = set(map(id, self._nodes))
+            added = tuple(blk for blk in new._nodes if id(blk) not in kept)
+
+            for blk in removed:
+                if self.__dict__.get(blk.mnemonic) is blk:
+                    delattr(self, blk.mnemonic)
+            for blk in added:
+                if re.search('[\[\]]', blk.mnemonic) or blk.mnemonic.lower() == 'reserved':
+                    continue
+                if hasattr(self, blk.mnemonic):
+                    logger.warning("%s '%s' would overwrite existing attribute by "
+                                   "the same name in %s '%s'. Will not be added "
+                                   "to attributes." % (blk.__class__.__name__, blk.mnemonic,
+                                                       self._typename, self.mnemonic))
+                    continue
+                setattr(self, blk.mnemonic, blk)
+
+            self._nodes = new._nodes
+            for blk in self._nodes:
+                blk.parent = self
+            for blk in self.walk(build=False):
+                if isinstance(blk, blocks.DeviceBlock):
+                    break
+                blk.root = self
+
+            self.description = new.description
+            self.vendor = new.vendor
+            self.cpu = new.cpu
+            self.bitband = new.bitband
+            self._kwattrs = new._kwattrs
+        return added, removed
+
+    def __getstate__(self):
+        state = super(Device, self).__getstate__()
+        # the cache is only useful to the process that filled it
+        state.pop('_cache', None)
+        return state
+
 
 class Peripheral(blocks.Block):
     """\
@@ -121,6 +238,23 @@ class Peripheral(blocks.Block):
     def __repr__(self):
         return "<{:s} '{:s}' @ {}>".format(self._typename, self.mnemonic, self.address)
 
+    def snapshot(self):
+        """
+        Read every register that can be read without side effects.
+
+        Returns
+        -------
+        OrderedDict
+            Register values keyed by mnemonic.
+        """
+        values = collections.OrderedDict()
+        for blk in self._nodes:
+            regs = list(blk) if isinstance(blk, blocks.BlockArray) else [blk]
+            for reg in regs:
+                if blocks.Access[reg.access] & blocks.RDACC and not reg.readSideEffects:
+                    values[reg.mnemonic] = reg.value
+        return values
+
 
 class Port(blocks.DeviceBlock):
     """\
@@ -218,6 +352,15 @@ class Register(blocks.IOBlock):
             write access is permitted. Read operations on this block will always return 0.
         'read-write': 
             both read and write accesses are permitted.
+    modifiedWriteValues : str
+        The SVD modifiedWriteValues of the register, e.g. 'oneToClear'. None
+        means written values are stored as is.
+    readAction : str
+        The SVD readAction of the register, e.g. 'clear'. None means reads have
+        no side effects.
+    writeConstraint : str or tuple
+        Either 'writeAsRead', 'useEnumeratedValues' or a (minimum, maximum)
+        range of values that may be written.
     bind : bool
         Tells the constructor whether or not to bind subblocks as attributes of
         the Block instance.
@@ -229,15 +372,21 @@ class Register(blocks.IOBlock):
     """
     _dynamicBinding = True
     _macrokey = 'address'
-    _attrs    = 'resetValue', 'resetMask', 'size', 'address'
+    _attrs    = 'resetValue', 'resetMask', 'size', 'address', 'modifiedWriteValues', 'readAction', 'writeConstraint'
     _fmt      = "{displayName} ({mnemonic}, {address})"
+    _masks    = None
 
     def __init__(self, mnemonic, fields, address, size, access='read-write',
-                 resetMask=0, resetValue=None, bind=True, displayName='',
-                 description='', kwattrs={}):
+                 resetMask=0, resetValue=None, modifiedWriteValues=None,
+                 readAction=None, writeConstraint=None, bind=True,
+                 displayName='', description='', kwattrs={}):
         super(Register, self).__init__(mnemonic, fields, size, access=access,
                                        bind=bind, displayName=displayName,
                                        description=description, kwattrs=kwattrs)
+        self.modifiedWriteValues = modifiedWriteValues
+        self.readAction = readAction
+        self.writeConstraint = writeConstraint
+
         if resetMask == 0:
             resetValue = 0
 
@@ -245,6 +394,9 @@ class Register(blocks.IOBlock):
         self.resetMask = utils.HexValue(resetMask, self.size)
         self.address = utils.HexValue(address)
 
+        # last value read from or written to the register, if known
+        self.shadow = None
+
         for field in self.nodes:
             field.mask = utils.HexValue(field.mask, self.size)
 
@@ -255,10 +407,61 @@ class Register(blocks.IOBlock):
         return attrs
         
     def _read(self):
-        return self.root._read(self.address, self.size)
+        value = self.root._read(self.address, self.size)
+        if not self.readSideEffects and not getattr(self.root, 'recording', False):
+            self.shadow = value
+        return value
 
     def _write(self, value):
-        return self.root._write(self.address, value, self.size)
+        self.root._write(self.address, value, self.size)
+        if getattr(self.root, 'recording', False):
+            return
+
+        # write-one/write-zero bits don't hold the value written to them
+        self.shadow = None if self._writemasks()[0] else value
+
+    @property
+    def readSideEffects(self):
+        """
+        True if reading this register changes the state of the device.
+        """
+        return self.readAction is not None or any(f.readAction is not None for f in self.nodes)
+
+    def _writemasks(self):
+        """
+        Describe how the bits of this register respond to a write.
+
+        Returns
+        -------
+        (neutralMask, neutralValue, keepMask)
+            The bits that are left unchanged by writing the bits of
+            neutralValue to them, and the bits that must be read back and
+            rewritten to keep their value.
+        """
+        # computed on first use, as this is on the path of every field write
+        if self._masks is None:
+            self._masks = self._calcwritemasks()
+        return self._masks
+
+    def _calcwritemasks(self):
+        if not self.nodes:
+            mask = (1 << self.size) - 1
+            if self.modifiedWriteValues in _WRITE_ONE:
+                return mask, 0, 0
+            if self.modifiedWriteValues in _WRITE_ZERO:
+                return mask, mask, 0
+            return 0, 0, mask
+
+        neutralMask = neutralValue = keepMask = 0
+        for f in self.nodes:
+            if f.modifiedWriteValues in _WRITE_ONE:
+                neutralMask |= f.mask
+            elif f.modifiedWriteValues in _WRITE_ZERO:
+                neutralMask |= f.mask
+                neutralValue |= f.mask
+            elif f.modifiedWriteValues in (None, 'modify') and blocks.Access[f.access] & blocks.WRACC:
+                keepMask |= f.mask
+        return neutralMask, neutralValue, keepMask
 
     def status(self):
         v = self.value
@@ -272,14 +475,54 @@ class Register(blocks.IOBlock):
         print headerstr + substr if substr else headerstr
 
     def pack(self, *args, **kwargs):
+        """
+        Write several fields at once. Fields are given either positionally in
+        the order they are defined in, or by keyword, and a field's value may be
+        given by the name of one of its enumerated values.
+
+        The fields not given keep the value they have in the base value, which
+        is chosen with the `base` keyword:
+            'read':
+                read the register first (the default).
+            'reset':
+                start from the reset value, so that only a single write is
+                made.
+            'shadow':
+                start from the last value read or written (see ``shadow``),
+                reading the register only if it is not known.
+        """
+        kwargs.setdefault('base', 'read')
+        self.value = self.compose(*args, **kwargs)
+
+    def compose(self, *args, **kwargs):
+        """
+        Return the value ``pack`` would write, without writing it. The base
+        defaults to 'reset' so that nothing is read; e.g. to build a burst of
+        (address, value, size) writes for ``Target.writeBurst``.
+        """
+        base = kwargs.pop('base', 'reset')
         nodesdict = dict(self.items())
         nodes = list((self._nodes[idx], v) for idx, v in enumerate(args)) 
         nodes+= [(nodesdict[k.upper()], v) for k, v in kwargs.items()]
 
-        v = self.value
+        if base == 'reset':
+            v = self.resetValue & self.resetMask
+        elif base == 'shadow' and self.shadow is not None:
+            v = self.shadow
+        elif base in ('read', 'shadow'):
+            v = self.value
+        else:
+            raise ValueError("Unknown base '%s'; should be one of 'read', 'reset' or 'shadow'" % base)
+
+        # leave the write-one/write-zero fields that aren't given unchanged
+        neutralMask, neutralValue, keepMask = self._writemasks()
+        for f, a in nodes:
+            neutralMask &= ~f.mask
+        v = (v & ~neutralMask) | (neutralValue & neutralMask)
+
         for f, a in nodes:
-            v = (v & ~f.mask) | ((a << f.address) & f.mask)
-        self.value = v
+            v = (v & ~f.mask) | ((f.encode(a) << f.offset) & f.mask)
+        return v
 
     def rdiff(self, lastdword, newdword, mask=None):
         return self._diff(lastdword, newdword, 1, mask=mask)
@@ -336,8 +579,10 @@ class BitField(blocks.IOBlock):
     ----------
     mnemonic : str
         Shorthand or abbreviated name of block.
-    values : list-like
-        A list of the defined EnumeratedValues.
+    values : list-like or EnumTable
+        A list of the defined EnumeratedValues, or an EnumTable of them, from
+        which the EnumeratedValue blocks are only built when the field's nodes
+        are first accessed.
     offset : int
         The bit offset of this field.
     size : int
@@ -350,6 +595,17 @@ class BitField(blocks.IOBlock):
             write access is permitted. Read operations on this block will always return 0.
         'read-write': 
             both read and write accesses are permitted.
+    modifiedWriteValues : str
+        The SVD modifiedWriteValues of the field. Writes to 'oneToClear',
+        'oneToSet' and 'oneToToggle' fields (and their zeroTo counterparts) are
+        done with a single write, without reading the register first, when
+        every other writable field of the register can be written with a
+        neutral value.
+    readAction : str
+        The SVD readAction of the field. None means reads have no side effects.
+    writeConstraint : str or tuple
+        Either 'writeAsRead', 'useEnumeratedValues' or a (minimum, maximum)
+        range of values that may be written.
     bind : bool
         Tells the constructor whether or not to bind subblocks as attributes of
         the Block instance.
@@ -362,34 +618,133 @@ class BitField(blocks.IOBlock):
 
     _fmt = "{displayName} ({mnemonic}, {access}, {mask})"
     _macrokey = 'mask'
-    _attrs = 'mask', 'size', 'offset'
+    _attrs = 'mask', 'size', 'offset', 'modifiedWriteValues', 'readAction', 'writeConstraint'
+
+    _nodes = blocks._LazyNodes()
 
     def __new__(cls, *args, **kwargs):
         kwargs['bind'] = False
         return super(BitField, cls).__new__(cls, args[0], kwargs.get('values', []), **kwargs)
 
     def __init__(self, mnemonic, offset, size, values=[], access='read-write',
+                 modifiedWriteValues=None, readAction=None, writeConstraint=None,
                  displayName='', description='', kwattrs={}):
-        super(BitField, self).__init__(mnemonic, values, size, access=access,
+        super(BitField, self).__init__(mnemonic, (), size, access=access,
                                        bind=False, displayName=displayName,
                                        description=description, kwattrs=kwattrs)
+        self.modifiedWriteValues = modifiedWriteValues
+        self.readAction = readAction
+        self.writeConstraint = writeConstraint
         self.offset = offset
         self.size = size
         self.mask = utils.HexValue(((1 << self.size) - 1) << self.offset)
 
+        if isinstance(values, EnumTable):
+            # leave building the blocks to the first access of the nodes
+            self._enums = values
+            del self._nodes
+        else:
+            values = list(values)
+            self._enums = EnumTable((int(ev.value), ev.mnemonic, ev.description, ev._kwattrs)
+                                    for ev in values)
+            self._nodes = self._buildnodes(values)
+
+    def _buildnodes(self, enumvals=None):
+        if enumvals is None:
+            enumvals = [EnumeratedValue(name, value, description=description, kwattrs=kwattrs or {})
+                        for value, name, description, kwattrs in self._enums]
         intrepr = utils.BinValue if self.size <= 4 else utils.HexValue
-        for enumval in self.nodes:
+        for enumval in enumvals:
             enumval.value = intrepr(enumval.value, self.size)
+            enumval.parent = self
+            enumval.root = self.root
+        return tuple(sorted(enumvals, key=lambda x: x._macrovalue, reverse=True))
+
+    @property
+    def enumNames(self):
+        """
+        The names of the field's enumerated values, by value.
+        """
+        return self._enums.names
+
+    @property
+    def enumValues(self):
+        """
+        The field's enumerated values, by name.
+        """
+        return self._enums.values
+
+    def encode(self, value):
+        """
+        Return the value to write for `value`, which may be given by the name
+        of one of the field's enumerated values.
+        """
+        if not isinstance(value, basestring):
+            return value
+        try:
+            return self._enums.values[value]
+        except KeyError:
+            raise ValueError("%r is not an enumerated value of %s" % (value, self.mnemonic))
+
+    def _bitbandAddress(self):
+        if self.size != 1 or not isinstance(self.root, Device):
+            return None
+
+        # the bit-band hardware does its own read-modify-write which would
+        # trigger read side effects and write back set W1C bits
+        if self.parent.readSideEffects or self.parent._writemasks()[0]:
+            return None
+        return self.root.bitbandAddress(self.parent.address, self.offset)
+
+    def _checkConstraint(self, value):
+        if not isinstance(value, (int, long)):
+            # placeholders in a recorded sequence have no value until replayed
+            return
+        constraint = self.writeConstraint
+        if constraint == 'useEnumeratedValues' and self._enums:
+            if value not in self._enums.names:
+                raise ValueError("%d is not an enumerated value of %s" % (value, self.mnemonic))
+        elif isinstance(constraint, tuple):
+            if not constraint[0] <= value <= constraint[1]:
+                raise ValueError("%d is outside the range %d-%d allowed for %s"
+                                 % ((value,) + constraint + (self.mnemonic,)))
 
     def _read(self):
         # return (self.root.read(self.parent.offset + self.offset, self.size) & self.mask) >> self.offset
+        alias = self._bitbandAddress()
+        if alias is not None:
+            return self.root._read(alias, 32) & 1
         return (self.parent.value & self.mask) >> self.offset
 
-    # notice that writing a bitfield requires a read of the register first
+    # notice that writing a bitfield requires a read of the register first,
+    # unless it is a single bit that can be written through its bit-band alias
+    # or a write-one (or write-zero) field in an otherwise neutral register
     def _write(self, value):
+        value = self.encode(value)
+        self._checkConstraint(value)
+        alias = self._bitbandAddress()
+        if alias is not None:
+            self.root._write(alias, value & 1, 32)
+            if self.parent.shadow is not None:
+                self.parent.shadow = (self.parent.shadow & ~self.mask) | ((value & 1) << self.offset)
+            return
+
+        reg = self.parent
+        neutralMask, neutralValue, keepMask = reg._writemasks()
+        neutralMask &= ~self.mask
+        fieldbits = (value << self.offset) & self.mask
+        if self.modifiedWriteValues in _WRITE_ONE + _WRITE_ZERO and not keepMask & ~self.mask:
+            # No other bit needs its value preserved, so skip the read. Bits
+            # outside of any field are written with their reset value.
+            fieldmasks = reduce(lambda m, f: m | f.mask, reg.nodes, 0)
+            reg.value = fieldbits | neutralValue & neutralMask | reg.resetValue & ~fieldmasks
+            return
+
         # v = (self.root.read(self.parent.offset + self.offset, self.size) & self.mask) >> self.offset
         # self.root.write(self.parent.offset + self.offset, (value << self.offset) & self.mask, self.size)
-        self.parent.value = (self.parent.value & ~self.mask) | ((value << self.offset) & self.mask)
+        with self.root.transaction():
+            v = reg.value & ~(self.mask | neutralMask)
+            reg.value = v | fieldbits | neutralValue & neutralMask
 
     def __ilshift__(self, other):
         regval = self.parent.value 
@@ -423,3 +778,55 @@ class EnumeratedValue(blocks.LeafBlock):
     def __init__(self, mnemonic, value, description='', kwattrs={}):
         super(EnumeratedValue, self).__init__(mnemonic, description=description, kwattrs=kwattrs)
         self.value = utils.BinValue(value) if value.bit_length() <= 4 else utils.HexValue(value)
+
+
+class EnumTable(object):
+    """\
+    The enumerated values of a bit field as a table of (value, mnemonic,
+    description, kwattrs) rows, which is all the parsers keep of them (kwattrs
+    may be None if there are none). Few enumerated values are ever looked at,
+    so a BitField only builds their EnumeratedValue blocks when its nodes are
+    first accessed.
+
+    Attributes
+    ----------
+    names : dict
+        The mnemonics of the enumerated values, by value.
+    values : dict
+        The values of the enumerated values, by mnemonic.
+    """
+    # there is one for every bit field
+    __slots__ = 'rows', '_names', '_values'
+
+    def __init__(self, rows=()):
+        self.rows = tuple(rows)
+        self._names = self._values = None
+
+    # where a value or mnemonic is repeated, the first row has it
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = dict((row[0], row[1]) for row in reversed(self.rows))
+        return self._names
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = dict((row[1], row[0]) for row in reversed(self.rows))
+        return self._values
+
+    # the lookup dicts are cheap to build again, so leave them out
+    def __getstate__(self):
+        return {'rows': self.rows}
+
+    def __setstate__(self, state):
+        self.__init__(state['rows'])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return "<{:s} of {:d} values>".format(self.__class__.__name__, len(self.rows))
@@ -2,3 +2,4 @@ from datalink import DataLink
 from mockdatalink import MockDataLink
 from ftd2xx import FTD2xx
 from digilenths2 import DigilentHS2
+from simdatalink import SimDataLink, SimTarget, SimMemory
@@ -22,3 +22,25 @@ class DataLink(object):
 
     def read(self, *args, **kwargs):
         raise NotImplementedError
+
+    def transfer(self, segments):
+        """
+        Clock out a sequence of segments as a single transfer.
+
+        Each segment is either a string of bits to write (output to the
+        device leftmost character first) or an integer number of bits to read.
+        Data links that can do better than a write/read per segment should
+        override this.
+
+        Returns
+        -------
+        list
+            The bit strings read, one for each read segment, in order.
+        """
+        rdata = []
+        for seg in segments:
+            if isinstance(seg, basestring):
+                self.write(seg)
+            else:
+                rdata.append(self.read(seg))
+        return rdata
@@ -20,3 +20,7 @@ class MockDataLink(object):
     def read(self, *args, **kwargs):
         logger.debug("DataLink => 0")
         return 0
+
+    def transfer(self, segments):
+        logger.debug("DataLink <=> %s" % (segments,))
+        return ['0'*seg for seg in segments if not isinstance(seg, basestring)]
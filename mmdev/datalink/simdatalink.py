@@ -0,0 +1,447 @@
+"""
+A simulated ADIv5 target that speaks SWD at the bit level, so that the DAP
+stack can be exercised and benchmarked without hardware.
+
+The model covers the SW-DP registers (IDCODE, ABORT, CTRL/STAT, WCR, SELECT,
+RESEND and RDBUFF) and a single MEM-AP at APSEL 0 backed by a sparse memory
+that can be seeded from the reset values of a parsed device.
+"""
+from mmdev.datalink import DataLink
+from mmdev.components import BITBAND_REGIONS, BITBAND_SIZE
+import collections
+import logging
+
+logger = logging.getLogger(__name__)
+
+ACK_OK = 1
+ACK_WAIT = 2
+ACK_FAULT = 4
+
+# DP register addresses
+DP_IDCODE = DP_ABORT = 0x0
+DP_CTRLSTAT = DP_WCR = 0x4
+DP_SELECT = DP_RESEND = 0x8
+DP_RDBUFF = 0xC
+
+# ABORT bits
+DAPABORT   = 1 << 0
+STKCMPCLR  = 1 << 1
+STKERRCLR  = 1 << 2
+WDERRCLR   = 1 << 3
+ORUNERRCLR = 1 << 4
+
+# CTRL/STAT bits
+ORUNDETECT   = 1 << 0
+STICKYORUN   = 1 << 1
+STICKYCMP    = 1 << 4
+STICKYERR    = 1 << 5
+READOK       = 1 << 6
+WDATAERR     = 1 << 7
+CDBGRSTREQ   = 1 << 26
+CDBGRSTACK   = 1 << 27
+CDBGPWRUPREQ = 1 << 28
+CDBGPWRUPACK = 1 << 29
+CSYSPWRUPREQ = 1 << 30
+CSYSPWRUPACK = 1 << 31
+CTRLSTAT_WMASK = ORUNDETECT | 0x00FFFF0C | CDBGRSTREQ | CDBGPWRUPREQ | CSYSPWRUPREQ
+STICKY = STICKYORUN | STICKYCMP | STICKYERR | WDATAERR
+
+# MEM-AP register addresses
+AP_CSW, AP_TAR, AP_DRW = 0x00, 0x04, 0x0C
+AP_BD0, AP_BD3 = 0x10, 0x1C
+AP_CFG, AP_BASE, AP_IDR = 0xF4, 0xF8, 0xFC
+
+CSW_DEVICEEN = 1 << 6
+CSW_ADDRINC = 0x30
+CSW_SIZE = 0x7
+
+# A line reset is at least 50 clocks with SWDIO high
+LINE_RESET_LEN = 50
+
+
+class SimMemory(object):
+    """
+    Sparse, word-granular little-endian memory. If any regions have been
+    added, accesses outside of them fault.
+
+    Parameters
+    ----------
+    bitband : bool
+        Model the Cortex-M3/M4 bit-band alias regions.
+    """
+    def __init__(self, bitband=False):
+        self._words = {}
+        self._regions = []
+        self.bitband = bitband
+
+    def addRegion(self, start, size):
+        self._regions.append((start, start + size))
+
+    def _alias(self, addr):
+        """
+        Return the (byte address, bit) aliased by a bit-band alias address, or
+        None.
+        """
+        if self.bitband:
+            for base, alias in BITBAND_REGIONS:
+                if alias <= addr < alias + (BITBAND_SIZE << 5):
+                    bit = (addr - alias) >> 2
+                    return base + (bit >> 3), bit & 7
+        return None
+
+    def valid(self, addr):
+        alias = self._alias(addr)
+        if alias is not None:
+            addr = alias[0]
+        if not self._regions:
+            return True
+        return any(start <= addr < end for start, end in self._regions)
+
+    def read(self, addr):
+        """
+        Return the aligned word containing `addr`.
+        """
+        alias = self._alias(addr)
+        if alias is not None:
+            addr, bit = alias
+            return (self._words.get(addr & ~3, 0) >> (((addr & 3) << 3) + bit)) & 1
+        return self._words.get(addr & ~3, 0)
+
+    def write(self, addr, value, size=4):
+        """
+        Write the low `size` bytes of `value` to `addr`.
+        """
+        addr, value, size = int(addr), int(value), int(size)
+        alias = self._alias(addr)
+        if alias is not None:
+            addr, bit = alias
+            shift = ((addr & 3) << 3) + bit
+            word = self._words.get(addr & ~3, 0)
+            self._words[addr & ~3] = (word & ~(1 << shift)) | ((value & 1) << shift)
+            return
+        shift = (addr & 3) << 3
+        mask = ((1 << (size << 3)) - 1) << shift
+        word = self.read(addr)
+        self._words[addr & ~3] = (word & ~mask) | ((value << shift) & mask)
+
+    def load(self, device, regions=False):
+        """
+        Seed memory with the reset values of every register in `device`. This
+        leaves the valid regions as they are, unless `regions` is True, in
+        which case each peripheral's address block is added as a region. Since
+        that makes every other address fault, RAM should be added as a region
+        too.
+        """
+        from mmdev.components import Peripheral, Register
+
+        for blk in device.walk(build=False):
+            if isinstance(blk, Peripheral):
+                if regions:
+                    self.addRegion(blk.address, blk.size)
+            elif isinstance(blk, Register):
+                self.write(blk.address, blk.resetValue, max(blk.size >> 3, 1))
+
+
+class SimTarget(object):
+    """
+    Clock-level model of an ADIv5 SW-DP with one MEM-AP.
+
+    Parameters
+    ----------
+    memory : SimMemory
+        Backing store for the MEM-AP. Defaults to an empty memory where every
+        address is valid.
+    idcode : int
+        Value of the DP IDCODE register.
+    sizes : sequence of int
+        The access sizes (in bits) the MEM-AP supports.
+    powerUpDelay : int
+        Number of CTRL/STAT reads after a power-up request before the
+        corresponding ACK bit is set.
+    idr, base, cfg : int
+        Values of the MEM-AP's IDR, BASE and CFG registers.
+    """
+    def __init__(self, memory=None, idcode=0x2BA01477, sizes=(8, 16, 32),
+                 powerUpDelay=1, idr=0x24770011, base=0xE00FF003, cfg=0):
+        self.memory = SimMemory() if memory is None else memory
+        self.idcode = idcode
+        self.sizes = tuple(sizes)
+        self.powerUpDelay = powerUpDelay
+        self.idr = idr
+        self.base = base
+        self.cfg = cfg
+        self.stats = collections.Counter()
+
+        self._ctrlstat = 0
+        self._select = 0
+        self._wcr = 0
+        self._rdbuff = 0
+        self._resend = 0
+        self._csw = CSW_DEVICEEN | 2
+        self._tar = 0
+        self._powerup = 0
+        self._waits = 0
+        self._waitAfter = 0
+        self.lineReset()
+
+    def injectWait(self, count, after=0):
+        """
+        Respond WAIT to `count` AP accesses, starting after the next `after`
+        AP accesses have completed.
+        """
+        self._waitAfter = after
+        self._waits = count
+
+    def lineReset(self):
+        self._ones = 0
+        self._reset = True
+        self._swd = self._protocol()
+        self._out = self._swd.next()
+
+    def clock(self, hostbit=None):
+        """
+        Advance one clock. `hostbit` is the bit the host drives ('0' or '1'),
+        or None if the host is not driving. Returns the bit on the line as
+        seen by the host.
+        """
+        if hostbit == '1':
+            self._ones += 1
+            if self._ones >= LINE_RESET_LEN:
+                self.lineReset()
+                self._ones = LINE_RESET_LEN
+                return '1'
+        elif hostbit is not None:
+            self._ones = 0
+
+        out = self._out
+        self._out = self._swd.send(hostbit)
+        return out
+
+    def _protocol(self):
+        """
+        Generator that receives the host's bit for each clock and yields the
+        target's bit for the same clock ('1' when the target is not driving).
+        """
+        # SWDIO is pulled up, so clocks the host does not drive read as 1s
+        while True:
+            bit = yield '1'
+            if bit == '0':
+                continue
+
+            hdr = []
+            for i in xrange(7):
+                hdr.append((yield '1'))
+            apndp, rnw, a2, a3, parity, stop, park = [b != '0' for b in hdr]
+            if stop or not park or (apndp ^ rnw ^ a2 ^ a3) != parity:
+                break
+            addr = a2 << 2 | a3 << 3
+
+            ack, rdata = self._request(apndp, rnw, addr)
+            if ack is None:
+                break
+
+            yield '1' # turnaround
+            for i in xrange(3):
+                yield str((ack >> i) & 1)
+
+            orun = self._ctrlstat & ORUNDETECT
+            if ack != ACK_OK and not orun:
+                yield '1' # turnaround
+                continue
+
+            if rnw:
+                if ack != ACK_OK:
+                    rdata = None
+                for i in xrange(32):
+                    yield '1' if rdata is None else str((rdata >> i) & 1)
+                yield '1' if rdata is None else str(_parity(rdata))
+                yield '1' # turnaround
+                continue
+
+            yield '1' # turnaround
+            data = 0
+            for i in xrange(32):
+                if (yield '1') == '1':
+                    data |= 1 << i
+            parity = (yield '1') == '1'
+            if ack != ACK_OK:
+                continue
+            if parity != _parity(data):
+                self._ctrlstat |= WDATAERR
+                continue
+            self._write(apndp, addr, data)
+
+        # Protocol error: the target stops driving the line until the next
+        # line reset
+        logger.debug('Protocol error; target locked out until line reset')
+        while True:
+            yield '1'
+
+    def _request(self, apndp, rnw, addr):
+        """
+        Decide the ACK for a request and, for OK reads, produce the data.
+        Returns (ack, data); an ack of None means no response.
+        """
+        self.stats['requests'] += 1
+
+        # After a line reset the only legal request is a read of IDCODE
+        if self._reset:
+            if apndp or not rnw or addr != DP_IDCODE:
+                return None, None
+            self._reset = False
+
+        if apndp or (rnw and addr == DP_RDBUFF):
+            if apndp and self._ctrlstat & STICKY:
+                return self._fail(ACK_FAULT), None
+
+            if self._waitAfter:
+                self._waitAfter -= 1
+            elif self._waits:
+                self._waits -= 1
+                return self._fail(ACK_WAIT), None
+
+        if not apndp:
+            if not rnw:
+                return ACK_OK, None
+            self._resend = self._readDP(addr)
+            return ACK_OK, self._resend
+
+        if (self._select >> 24) != 0:
+            # No AP at this APSEL
+            return ACK_OK, 0 if rnw else None
+
+        addr |= self._select & 0xF0
+        if addr in (AP_DRW,) or AP_BD0 <= addr <= AP_BD3:
+            if not self.memory.valid(self._memaddr(addr)):
+                self._ctrlstat |= STICKYERR
+                return self._fail(ACK_FAULT), None
+
+        if not rnw:
+            return ACK_OK, None
+
+        # AP reads are posted; return the result of the previous AP read
+        self._resend, self._rdbuff = self._rdbuff, self._readAP(addr)
+        return ACK_OK, self._resend
+
+    def _fail(self, ack):
+        self.stats['wait' if ack == ACK_WAIT else 'fault'] += 1
+        if self._ctrlstat & ORUNDETECT:
+            self._ctrlstat |= STICKYORUN
+        return ack
+
+    def _readDP(self, addr):
+        if addr == DP_IDCODE:
+            return self.idcode
+        elif addr == DP_CTRLSTAT and self._select & 1:
+            return self._wcr
+        elif addr == DP_CTRLSTAT:
+            reqs = self._ctrlstat & (CDBGPWRUPREQ | CSYSPWRUPREQ)
+            if self._powerup:
+                self._powerup -= 1
+            else:
+                # mirror the power-up requests into the ACKs
+                self._ctrlstat = (self._ctrlstat & ~(CDBGPWRUPACK | CSYSPWRUPACK)) | (reqs << 1)
+            return self._ctrlstat
+        elif addr == DP_RESEND:
+            return self._resend
+        elif addr == DP_RDBUFF:
+            return self._rdbuff
+
+    def _write(self, apndp, addr, data):
+        if not apndp:
+            if addr == DP_ABORT:
+                if data & DAPABORT:
+                    self._waits = self._waitAfter = 0
+                clear = ((data & STKCMPCLR and STICKYCMP) | (data & STKERRCLR and STICKYERR) |
+                         (data & WDERRCLR and WDATAERR) | (data & ORUNERRCLR and STICKYORUN))
+                self._ctrlstat &= ~clear
+            elif addr == DP_CTRLSTAT and self._select & 1:
+                self._wcr = data
+            elif addr == DP_CTRLSTAT:
+                if data & ~self._ctrlstat & (CDBGPWRUPREQ | CSYSPWRUPREQ):
+                    self._powerup = self.powerUpDelay
+                self._ctrlstat = (self._ctrlstat & ~CTRLSTAT_WMASK) | (data & CTRLSTAT_WMASK)
+            elif addr == DP_SELECT:
+                self._select = data
+            return
+
+        if (self._select >> 24) != 0:
+            return
+
+        addr |= self._select & 0xF0
+        if addr == AP_CSW:
+            size = data & CSW_SIZE
+            if (8 << size) not in self.sizes:
+                size = self._csw & CSW_SIZE
+            self._csw = (data & ~CSW_SIZE & ~0x80) | CSW_DEVICEEN | size
+        elif addr == AP_TAR:
+            self._tar = data
+        elif addr == AP_DRW or AP_BD0 <= addr <= AP_BD3:
+            self.memory.write(self._memaddr(addr), data >> ((self._memaddr(addr) & 3) << 3),
+                              1 << (self._csw & CSW_SIZE))
+            self._increment(addr)
+
+    def _readAP(self, addr):
+        if addr == AP_CSW:
+            return self._csw
+        elif addr == AP_TAR:
+            return self._tar
+        elif addr == AP_DRW or AP_BD0 <= addr <= AP_BD3:
+            data = self.memory.read(self._memaddr(addr))
+            self._increment(addr)
+            return data
+        elif addr == AP_CFG:
+            return self.cfg
+        elif addr == AP_BASE:
+            return self.base
+        elif addr == AP_IDR:
+            return self.idr
+        return 0
+
+    def _memaddr(self, addr):
+        if addr == AP_DRW:
+            return self._tar
+        return (self._tar & ~0xF) | (addr & 0xC)
+
+    def _increment(self, addr):
+        # Only DRW accesses auto-increment, and only within a 1KB block
+        if addr != AP_DRW or not self._csw & CSW_ADDRINC:
+            return
+        tar = self._tar + (1 << (self._csw & CSW_SIZE))
+        self._tar = (self._tar & ~0x3FF) | (tar & 0x3FF)
+
+
+def _parity(data):
+    data = (data ^ (data >> 16))
+    data = (data ^ (data >> 8))
+    data = (data ^ (data >> 4))
+    data = (data ^ (data >> 2))
+    return (data ^ (data >> 1)) & 1
+
+
+class SimDataLink(DataLink):
+    """
+    A data link to a simulated SWD target.
+
+    Parameters
+    ----------
+    target : SimTarget
+        The simulated target. A default SimTarget is created if not given.
+    """
+    def __init__(self, target=None):
+        self.target = SimTarget() if target is None else target
+
+    def connect(self):
+        return
+
+    def disconnect(self):
+        return
+
+    def write(self, data, **kwargs):
+        clock = self.target.clock
+        for ch in data:
+            clock(ch)
+
+    def read(self, rlen):
+        clock = self.target.clock
+        return ''.join([clock() for i in xrange(rlen)])
@@ -1,2 +1,3 @@
 from devicelink import DeviceLink
 from daplink import DAPLink
+from busdriver import BusDriver
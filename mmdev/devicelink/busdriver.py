@@ -0,0 +1,41 @@
+class BusDriver(object):
+    """
+    Adapts a DeviceLink to the low-level driver interface expected by
+    ``mmdev.lib.bus32.Bus32``.
+
+    Reads and writes are queued on the link rather than sent immediately, so
+    all of the aligned pieces that Bus32 splits an unaligned access into go
+    out in a single batch. Reads return generators which flush the link when
+    first iterated; writes are sent by the next flush.
+
+    Parameters
+    ----------
+    link : mmdev.devicelink.DeviceLink
+        The device link to send transfers over.
+    big_endian : bool
+        Byte order of the target's memory.
+    addr_align : int
+        Page size, in bytes, that word transfers should not cross.
+    max_bytes : int
+        Maximum number of bytes in a single word transfer.
+    """
+    def __init__(self, link, big_endian=False, addr_align=0x400, max_bytes=0x400):
+        self.link = link
+        self.big_endian = big_endian
+        self.addr_align = addr_align
+        self.max_bytes = max_bytes
+
+    def readsingle(self, addr, size):
+        return self.link.queueMemRead(addr, 1, size << 3)
+
+    def readmultiple(self, addr, length):
+        return self.link.queueMemRead(addr, length, 32)
+
+    def writesingle(self, addr, size, data):
+        self.link.queueMemWrite(addr, [data], size << 3)
+
+    def writemultiple(self, addr, data, offset, length):
+        # a zero length write is Bus32's request to flush, which is left to the
+        # caller so that errors surface in one place
+        if length:
+            self.link.queueMemWrite(addr, data[offset:offset+length], 32)
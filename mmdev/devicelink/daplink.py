@@ -1,7 +1,10 @@
 from mmdev import utils
-from mmdev.transport import Transport
+from mmdev.transport import Transport, RetryPolicy
 from mmdev.devicelink import DeviceLink
+from mmdev.sequence import evaluate
+import collections
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -14,11 +17,28 @@ CSW_MSTRTYPE =  0x20000000
 CSW_MSTRCORE =  0x00000000
 CSW_MSTRDBG  =  0x20000000
 CSW_RESERVED =  0x01000000
+CSW_SADDRINC =  0x00000010
+CSW_SIZE     =  {8: 0, 16: 1, 32: 2}
+CSW_DEFAULT  =  CSW_MSTRDBG | CSW_HPROT | CSW_RESERVED | CSW_DBGSTAT
+
+# TAR auto-increment is only guaranteed to carry through the bottom 10 bits
+TAR_WRAP     =  0x400
+
+# What connect discovers about a target, cached by IDCODE and MEM-AP IDR
+Capabilities = collections.namedtuple('Capabilities', 'idcode sizes idr')
 
 
 class DAPLink(DeviceLink):
     """
     Models an ADIv5 compliant Serial Wire Debug interface.
+
+    Attributes
+    ----------
+    capabilityCache : dict
+        The capabilities probed by this link, by (IDCODE, MEM-AP IDR), so that
+        reconnecting to a known target skips probing. Unrelated parts may
+        share an IDCODE (e.g. every Cortex-M3/M4 SW-DP), so the IDR is read
+        again on each connect, and the cache isn't shared between links.
     """
     def __new__(cls, transport, descriptorfile='data/dap.json', **kwparse):
         return super(DAPLink, cls).__new__(cls, transport, descriptorfile, **kwparse)
@@ -27,55 +47,122 @@ class DAPLink(DeviceLink):
         super(DAPLink, self).__init__(transport, descriptorfile, **kwparse)
 
         for blk in self.nodes:
-            blk._macrovalue = utils.HexValue(blk._macrovalue, 8)
+            setattr(blk, blk._macrokey, utils.HexValue(blk._macrovalue, 8))
             blk.root = self
 
-    def connect(self):
+        # SELECT is write-only so keep a copy of the last value written
+        self._select = None
+        self._batchSetup = None
+        self.capabilities = None
+        self.capabilityCache = {}
+
+    def connect(self, fast=True, timeout=1.0):
         """
         Establish a connection to the Debug Access Port.
+
+        Parameters
+        ----------
+        fast : bool
+            Reuse the capabilities cached for a target with the same IDCODE
+            and MEM-AP IDR instead of probing for them again.
+        timeout : float
+            Time in seconds to wait for the power-up requests to be
+            acknowledged.
         """
+        start = lap = time.time()
         super(DAPLink, self).connect()
+        self._select = None
+        lap = self._logPhase('line reset', lap)
 
         # read ID code to confirm synchronization
-        logger.info('IDCODE: %s', self.DP.IDCODE.value)
-
-        # clear errors
-        self.DP.ABORT = 0x1F
-
-        # Reset CTRL flags to default values
-        self.DP.CTRLSTAT.MASKLANE = 0xF
-        self.DP.CTRLSTAT.TRNMODE = 0
-
-        # Reset the AP, AP bank, and CTRLSEL to their default
-        self.DP.SELECT = 0
-
-        # set clock frequency
-        # self.setSWJClock(frequency)
+        idcode = int(self.DP.IDCODE.value)
+        logger.info('IDCODE: %s', utils.HexValue(idcode, 8))
+        lap = self._logPhase('identify', lap)
+
+        # Clear errors, reset the AP, AP bank and CTRLSEL to their defaults,
+        # and request system and debug power up with the CTRL flags at their
+        # default values, all in a single batch
+        ctrl = self.DP.CTRLSTAT
+        ctrlstat = ctrl.MASKLANE.mask | ctrl.CSYSPWRUPREQ.mask | ctrl.CDBGPWRUPREQ.mask
+        if self.transport.overrunDetect:
+            ctrlstat |= ctrl.ORUNDETECT.mask
+        self._queueWrite(0, self.DP.ABORT.address, 0x1F)
+        self._queueWrite(0, self.DP.SELECT.address, 0)
+        self._queueWrite(0, ctrl.address, ctrlstat)
+        for rslt in self.flush():
+            rslt.result()
+        lap = self._logPhase('configure', lap)
+
+        self._powerUp(timeout)
+        lap = self._logPhase('power up', lap)
+
+        idr = self._readIDR()
+        caps = self.capabilityCache.get((idcode, idr)) if fast else None
+        if caps is None:
+            caps = self._probe(idcode, idr)
+            self.capabilityCache[idcode, idr] = caps
+            lap = self._logPhase('probe', lap)
+        else:
+            logger.debug('Using cached capabilities for IDCODE %s, IDR %s',
+                         utils.HexValue(idcode, 8), utils.HexValue(idr, 8))
 
-        # configure transfer
-        # self.transferConfigure()
+        self.capabilities = caps
+        self.MEMAP.laneWidth = min(caps.sizes)
+        logger.info('Connected in %.2f ms', (time.time() - start)*1e3)
 
-        # configure swd protocol
-        # self.swdConfigure()
+    @staticmethod
+    def _logPhase(phase, lap):
+        now = time.time()
+        logger.debug('connect: %s took %.2f ms', phase, (now - lap)*1e3)
+        return now
 
-        # Do a system and debug power up request
-        self.DP.SELECT = 0
-        self.DP.CTRLSTAT.pack(CSYSPWRUPREQ=1, CDBGPWRUPREQ=1)
-        mask = self.DP.CTRLSTAT.CSYSPWRUPACK.mask | self.DP.CTRLSTAT.CDBGPWRUPACK.mask
-        while (self.DP.CTRLSTAT&mask) != mask: None
-
-        # Prod for support of transfers smaller than 32 bits
-        self.MEMAP.CSW.SIZE = 0
-        if self.MEMAP.CSW.SIZE == 0:
-            self.MEMAP.laneWidth = 8 << 0
-            return
+    def _powerUp(self, timeout):
+        """
+        Poll for the power-up acknowledge with an exponential backoff, giving up
+        after `timeout` seconds.
+        """
+        ctrl = self.DP.CTRLSTAT
+        mask = ctrl.CSYSPWRUPACK.mask | ctrl.CDBGPWRUPACK.mask
+        delays = RetryPolicy(spins=2, backoff=100, maxBackoff=20000, deadline=timeout).delays()
+        while (ctrl.value & mask) != mask:
+            try:
+                time.sleep(next(delays))
+            except StopIteration:
+                raise DeviceLink.DeviceLinkException("Timed out waiting for power-up acknowledge")
+
+    def _readIDR(self):
+        """
+        Read the MEM-AP's IDR in a single batch.
+        """
+        idr, select = self.MEMAP.IDR, self.DP.SELECT
+        self._queueWrite(0, select.address, self.MEMAP.port << select.APSEL.offset
+                                            | (idr.address & 0xF0) >> 4 << select.APBANKSEL.offset)
+        self._queueRead(1, idr.address & 0xF)
+        idrread = self._queueRead(0, self.DP.RDBUFF.address)
+        self._queueWrite(0, select.address, 0)
+
+        for rslt in self.flush():
+            rslt.result()
+        return idrread.data
+
+    def _probe(self, idcode, idr):
+        """
+        Discover the access sizes supported by the MEM-AP in a single batch.
+        """
+        csw = self.MEMAP.CSW
+        sizereads = []
+        for size in (8, 16):
+            self._queueWrite(1, csw.address & 0xF, CSW_DEFAULT | CSW_SIZE[size])
+            self._queueRead(1, csw.address & 0xF)
+            sizereads.append((size, self._queueRead(0, self.DP.RDBUFF.address)))
+        self._queueWrite(1, csw.address & 0xF, CSW_DEFAULT | CSW_SIZE[32])
 
-        self.MEMAP.CSW.SIZE = 1
-        if self.MEMAP.CSW.SIZE == 1:
-            self.MEMAP.laneWidth = 8 << 1
-            return
+        for rslt in self.flush():
+            rslt.result()
 
-        self.MEMAP.laneWidth = 8 << 2
+        sizes = [size for size, rslt in sizereads
+                 if (rslt.data & csw.SIZE.mask) >> csw.SIZE.offset == CSW_SIZE[size]]
+        return Capabilities(idcode, tuple(sizes) + (32,), idr)
 
     def probe(self):
         baseaddr = self.MEMAP.BASE.BASEADDR.value
@@ -86,41 +173,246 @@ class DAPLink(DeviceLink):
             raise DeviceLink.DeviceLinkException("No such luck. Base address of the debug components is inaccessible.")
 
     def apselect(self, port, bank):
-        apsel = self.DP.SELECT.APSEL.value
-        banksel = self.DP.SELECT.APBANKSEL.value
-
-        if apsel != port:
-            self.DP.SELECT.APSEL = port
-        if banksel != bank:
-            self.DP.SELECT.APBANKSEL = bank
+        select = port << self.DP.SELECT.APSEL.offset | bank << self.DP.SELECT.APBANKSEL.offset
+        if self._select is not None:
+            select |= self._select & self.DP.SELECT.CTRLSEL.mask
+        if select != self._select:
+            self.DP.SELECT = select
 
     def _read(self, APnDP, address):
         assert (address&~0b1100) == 0, "Invalid register address; should be of form 0bxx00"
 
-        try:
-            self.transport.sendRequest(APnDP, 1, address & 0x0F)
-        except Transport.FaultResponse:
-            self.DP.ABORT.STKERRCLR = 1
-            raise
+        self.transport.sendRequest(APnDP, 1, address & 0x0F)
+        data = self.transport.readPacket()
+
+        # AP reads are posted; the result is returned by the next read
+        if APnDP:
+            self.transport.sendRequest(0, 1, self.DP.RDBUFF.address)
+            data = self.transport.readPacket()
 
-        return self.transport.readPacket()
+        return data
     read = _read
 
     def _write(self, APnDP, address, data):
         assert (address&~0b1100) == 0, "Invalid register address; should be of form 0bxx00"
 
-        try:
-            self.transport.sendRequest(APnDP, 0, address & 0x0F)
-        except Transport.FaultResponse:
-            self.DP.ABORT.STKERRCLR = 1
-            raise
+        self.transport.sendRequest(APnDP, 0, address & 0x0F)
 
         self.transport.sendPacket(data)
+        if not APnDP and address == self.DP.SELECT.address:
+            self._select = data
     write = _write
 
+    def _queueRead(self, APnDP, address):
+        assert (address&~0b1100) == 0, "Invalid register address; should be of form 0bxx00"
+        return self.transport.queueRequest(APnDP, 1, address & 0x0F)
+
+    def _queueWrite(self, APnDP, address, data):
+        assert (address&~0b1100) == 0, "Invalid register address; should be of form 0bxx00"
+        if not APnDP and address == self.DP.SELECT.address:
+            self._select = data
+            self._batchSetup = None
+        elif APnDP and address == self.MEMAP.CSW.address:
+            self._batchSetup = None
+        return self.transport.queueRequest(APnDP, 0, address & 0x0F, data)
+
+    def flush(self):
+        """
+        Send all queued transactions to the target. Recovery from WAIT and
+        FAULT responses is left to the transport's retry policy.
+        """
+        return self.transport.flush()
+
+    @staticmethod
+    def _tarchunks(addr, count, size=4):
+        """
+        Split a transfer of `count` elements of `size` bytes into pieces that do
+        not cross a TAR auto-increment boundary.
+        """
+        while count:
+            n = min(count, (TAR_WRAP - (addr % TAR_WRAP)) // size)
+            yield addr, n
+            addr += n * size
+            count -= n
+
+    def _queueBlockSetup(self, accessSize=32):
+        # SELECT and CSW only need writing once per batch for transfers of the
+        # same size, e.g. when many small transfers are merged into one batch
+        csw = CSW_DEFAULT | CSW_SADDRINC | CSW_SIZE[accessSize]
+        queue = self.transport._queue
+        if self._batchSetup is not None and self._batchSetup[0] is queue and self._batchSetup[1] == csw:
+            return
+        self._queueWrite(0, self.DP.SELECT.address, 0)
+        self._queueWrite(1, self.MEMAP.CSW.address, csw)
+        self._batchSetup = queue, csw
+
+    def queueMemWrite(self, addr, data, accessSize=32):
+        """
+        Queue a write of a sequence of values to consecutive addresses using
+        auto-incrementing transfers. Nothing is sent until the link is
+        flushed.
+        """
+        size = accessSize >> 3
+        assert (addr & (size-1)) == 0, "Block transfers must be aligned to the access size"
+
+        data = list(data)
+        values = iter(data)
+
+        self._queueBlockSetup(accessSize)
+        for tar, n in self._tarchunks(addr, len(data), size):
+            self._queueWrite(1, self.MEMAP.TAR.address, tar)
+            for i in xrange(n):
+                # narrow transfers use the byte lanes selected by the address
+                lane = ((tar + i*size) & 3) << 3
+                self._queueWrite(1, self.MEMAP.DRW.address, values.next() << lane)
+
+    def queueMemRead(self, addr, count, accessSize=32):
+        """
+        Queue a read of `count` values from consecutive addresses using
+        auto-incrementing transfers. Returns a generator over the values which
+        flushes the link when it is first iterated, if that has not already
+        happened.
+        """
+        size = accessSize >> 3
+        assert (addr & (size-1)) == 0, "Block transfers must be aligned to the access size"
+
+        self._queueBlockSetup(accessSize)
+        reads = []
+        for tar, n in self._tarchunks(addr, count, size):
+            self._queueWrite(1, self.MEMAP.TAR.address, tar)
+
+            # AP reads are posted: each DRW read returns the result of the
+            # previous one, and RDBUFF returns the last
+            self._queueRead(1, self.MEMAP.DRW.address)
+            reads.extend(self._queueRead(1, self.MEMAP.DRW.address) for i in xrange(n-1))
+            reads.append(self._queueRead(0, self.DP.RDBUFF.address))
+
+        return self._readvalues(reads, addr, size)
+
+    def _readvalues(self, reads, addr, size):
+        if reads and not reads[-1].done:
+            self.sync()
+
+        if size == 4:
+            for rslt in reads:
+                yield rslt.result()
+            return
+
+        mask = (1 << (size << 3)) - 1
+        for i, rslt in enumerate(reads):
+            yield (rslt.result() >> (((addr + i*size) & 3) << 3)) & mask
+
+    def memWriteBlock(self, addr, data, accessSize=32):
+        """
+        Write a sequence of values to consecutive addresses using
+        auto-incrementing transfers, sent as a single batch.
+        """
+        self.queueMemWrite(addr, data, accessSize)
+        self.sync()
+
+    def memReadBlock(self, addr, count, accessSize=32):
+        """
+        Read `count` values from consecutive addresses using auto-incrementing
+        transfers, sent as a single batch.
+        """
+        return list(self.queueMemRead(addr, count, accessSize))
+
+    def memWriteBurst(self, writes):
+        """
+        Write a sequence of (address, value) or (address, value, accessSize)
+        pairs as a single batch. The CSW is only rewritten when the access size
+        changes.
+        """
+        csw = None
+        self._queueWrite(0, self.DP.SELECT.address, 0)
+        for write in writes:
+            addr, data = write[:2]
+            accessSize = write[2] if len(write) > 2 else 32
+            if accessSize != csw:
+                self._queueWrite(1, self.MEMAP.CSW.address, CSW_DEFAULT | CSW_SIZE[accessSize])
+                csw = accessSize
+            self._queueWrite(1, self.MEMAP.TAR.address, addr)
+            self._queueWrite(1, self.MEMAP.DRW.address, data << ((addr & 3) << 3))
+        self.sync()
+
+    def compileSequence(self, ops):
+        """
+        Compile the operations of a ``mmdev.sequence.Sequence`` into batches
+        of DAP requests. Each batch runs up to the next poll. CSW and TAR are
+        only rewritten when the access size or address changes.
+        """
+        SELECT, RDBUFF = self.DP.SELECT.address, self.DP.RDBUFF.address
+        CSW, TAR, DRW = self.MEMAP.CSW.address, self.MEMAP.TAR.address, self.MEMAP.DRW.address
+
+        program = []
+        requests = None
+        for op in ops:
+            if op[0] == 'poll':
+                if requests:
+                    program.append(('batch', requests, reads))
+                requests = None
+                program.append(op)
+                continue
+
+            if requests is None:
+                requests, reads = [(0, 0, SELECT, 0)], []
+                csw = tar = None
+
+            address = op[1]
+            size = op[3] if op[0] == 'write' else op[2]
+            if size != csw:
+                requests.append((1, 0, CSW, CSW_DEFAULT | CSW_SIZE[size]))
+                csw = size
+            if address != tar:
+                requests.append((1, 0, TAR, address))
+                tar = address
+
+            lane = (address & 3) << 3
+            if op[0] == 'write':
+                data = op[2]
+                if isinstance(data, (int, long)):
+                    data = (data & ((1 << size) - 1)) << lane
+                else:
+                    data = (data, lane, (1 << size) - 1)
+                requests.append((1, 0, DRW, data))
+            else:
+                # AP reads are posted, so collect the result from RDBUFF
+                requests.append((1, 1, DRW, None))
+                reads.append((len(requests), lane, op[3], op[4], size))
+                requests.append((0, 1, RDBUFF, None))
+
+        if requests:
+            program.append(('batch', requests, reads))
+        return program
+
+    def runSequence(self, program, values):
+        """
+        Run a compiled sequence, sending each batch as a single transfer.
+        """
+        results = []
+        for segment in program:
+            if segment[0] == 'poll':
+                self._poll(*segment[1:])
+                continue
+
+            handles = []
+            for apndp, rnw, address, data in segment[1]:
+                if rnw:
+                    handles.append(self._queueRead(apndp, address))
+                    continue
+                if isinstance(data, tuple):
+                    expr, lane, mask = data
+                    data = (evaluate(expr, values) & mask) << lane
+                handles.append(self._queueWrite(apndp, address, data))
+            self.sync()
+
+            for idx, lane, mask, offset, size in segment[2]:
+                results.append(utils.HexValue(((handles[idx].data >> lane) & mask) >> offset, size))
+        return results
+
     def memWrite(self, addr, data, accessSize=32):
         self.DP.SELECT = 0
-        self.MEMAP.CSW = 0x23000052 | accessSize >> 4
+        self.MEMAP.CSW = CSW_DEFAULT | CSW_SADDRINC | CSW_SIZE[accessSize]
         self.MEMAP.TAR = addr
 
         if accessSize == 8:
@@ -132,7 +424,7 @@ class DAPLink(DeviceLink):
 
     def memRead(self, addr, accessSize=32):
         self.DP.SELECT = 0
-        self.MEMAP.CSW = 0x23000052 | accessSize >> 4
+        self.MEMAP.CSW = CSW_DEFAULT | CSW_SADDRINC | CSW_SIZE[accessSize]
         self.MEMAP.TAR = addr
 
         if accessSize == 8:
@@ -1,6 +1,8 @@
 from mmdev import utils
-from mmdev.transport import Transport
+from mmdev.transport import Transport, RetryPolicy
 from mmdev.blocks import DeviceBlock
+from mmdev.sequence import Sequence, evaluate
+import time
 
 
 class DeviceLink(DeviceBlock):
@@ -56,3 +58,100 @@ class DeviceLink(DeviceBlock):
         sequence of integer types.
         """
         raise NotImplementedError
+
+    def memWriteBlock(self, address, data, accessSize=32):
+        """
+        Write a sequence of values to consecutive addresses in device memory,
+        using transfers of `accessSize` bits. Links that can batch transfers
+        should override this.
+        """
+        step = accessSize >> 3
+        for i, value in enumerate(data):
+            self.memWrite(address + step*i, value, accessSize)
+
+    def memReadBlock(self, address, count, accessSize=32):
+        """
+        Read `count` values from consecutive addresses in device memory, using
+        transfers of `accessSize` bits. Links that can batch transfers should
+        override this.
+        """
+        step = accessSize >> 3
+        return [self.memRead(address + step*i, accessSize) for i in range(count)]
+
+    def memWriteBurst(self, writes):
+        """
+        Write a sequence of (address, value) or (address, value, accessSize)
+        pairs. Links that can batch transfers should send them as a single
+        burst.
+        """
+        for write in writes:
+            self.memWrite(*write)
+
+    def queueMemWrite(self, address, data, accessSize=32):
+        """
+        Queue a write of a sequence of values to consecutive addresses, to be
+        sent when the link is flushed. Links without a transfer queue write
+        immediately.
+        """
+        self.memWriteBlock(address, data, accessSize)
+
+    def queueMemRead(self, address, count, accessSize=32):
+        """
+        Queue a read of `count` values from consecutive addresses and return an
+        iterator over the values, which are available once the link has been
+        flushed. Links without a transfer queue read immediately.
+        """
+        return iter(self.memReadBlock(address, count, accessSize))
+
+    def compileSequence(self, ops):
+        """
+        Convert the operations of a ``mmdev.sequence.Sequence`` into a program
+        for ``runSequence``. Links that can batch transfers should override
+        both to send the sequence as a single batch.
+        """
+        return list(ops)
+
+    def runSequence(self, program, values):
+        """
+        Run a compiled sequence with `values` supplying its Variables, and
+        return the results of its reads.
+        """
+        results = []
+        for op in program:
+            if op[0] == 'write':
+                address, data, size = op[1:]
+                self.memWrite(address, evaluate(data, values) & ((1 << size) - 1), size)
+            elif op[0] == 'read':
+                address, size, mask, offset = op[1:]
+                results.append(utils.HexValue((self.memRead(address, size) & mask) >> offset, size))
+            else:
+                self._poll(*op[1:])
+        return results
+
+    def _poll(self, address, size, mask, expect, timeout):
+        """
+        Read `address` until the bits in `mask` equal `expect`, backing off
+        between reads, for at most `timeout` seconds.
+        """
+        delays = RetryPolicy(spins=2, backoff=100, maxBackoff=20000, deadline=timeout).delays()
+        while (self.memRead(address, size) & mask) != expect:
+            try:
+                time.sleep(next(delays))
+            except StopIteration:
+                raise Sequence.PollTimeout("Timed out polling 0x%x for 0x%x & 0x%x"
+                                           % (address, expect, mask))
+
+    def flush(self):
+        """
+        Send any queued transactions to the target.
+        """
+        return []
+
+    def sync(self):
+        """
+        Flush the link and raise the first error that occurred in the batch,
+        rather than the cancellations that follow it.
+        """
+        for rslt in self.flush():
+            if rslt.error is not None:
+                raise rslt.error
@@ -0,0 +1,185 @@
+import array
+from binascii import hexlify, unhexlify
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_typecodes = {8: 'B', 16: 'H', 32: 'I'}
+
+
+class MemoryView(object):
+    """
+    A sliceable view of a target's memory address space.
+
+    Indices and slice bounds are always byte addresses. An untyped view reads
+    and writes ranges as byte strings through the target's Bus32 engine, which
+    uses the widest aligned transfers the range allows. The typed views
+    ``u8``, ``u16`` and ``u32`` read and write arrays of elements using
+    transfers of exactly that size, which matters for peripherals that react
+    to the access width.
+
+    Ranges are split into batches of at most `chunkSize` bytes, each of which
+    is sent as a single block transfer by the device link.
+
+    Slices are returned as NumPy arrays if NumPy is installed, otherwise as
+    ``array.array`` objects.
+
+    Parameters
+    ----------
+    target : mmdev.target.Target
+        The target whose memory to access.
+    accessSize : int
+        The element size in bits for a typed view, or None for a byte view.
+    chunkSize : int
+        Maximum number of bytes to send in a single block transfer.
+
+    Examples
+    --------
+    >>> target.mem[0x20000000:0x20000010]
+    '\\x00\\x01\\x02...'
+    >>> target.mem.u32[0x20000000:0x20000010] = [1, 2, 3, 4]
+    >>> target.mem.u16[0x20000004]
+    2
+    """
+    def __init__(self, target, accessSize=None, chunkSize=0x1000):
+        self.target = target
+        self.accessSize = accessSize
+        self.chunkSize = chunkSize
+
+    @property
+    def u8(self):
+        return MemoryView(self.target, 8, self.chunkSize)
+
+    @property
+    def u16(self):
+        return MemoryView(self.target, 16, self.chunkSize)
+
+    @property
+    def u32(self):
+        return MemoryView(self.target, 32, self.chunkSize)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            size = self.accessSize or 8
+            self._checkalign(key, size)
+            return self.target.scheduler.read(key, 1, size)[0]
+
+        start, stop = self._bounds(key)
+        if stop is None:
+            raise ValueError("Reading memory requires an end address")
+        if self.accessSize is None:
+            return self._readbytes(start, stop - start)
+
+        size = self.accessSize
+        count = self._count(start, stop, size)
+        return self._asarray(self._readblock(start, count, size), size)
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, slice):
+            size = self.accessSize or 8
+            self._checkalign(key, size)
+            self.target.scheduler.write(key, [value], size)
+            return
+
+        start, stop = self._bounds(key)
+        if isinstance(value, (int, long)):
+            # fill the slice with a single value
+            if stop is None:
+                raise ValueError("Filling memory requires an end address")
+            if self.accessSize is None:
+                value = chr(value) * (stop - start)
+            else:
+                value = [value] * self._count(start, stop, self.accessSize)
+
+        if self.accessSize is None:
+            data = value.tostring() if hasattr(value, 'tostring') else str(bytearray(value))
+            values = data
+            length = len(data)
+        else:
+            values = [int(v) for v in value]
+            length = len(values) * (self.accessSize >> 3)
+
+        if stop is not None and stop - start != length:
+            raise ValueError("Cannot resize memory; slice is %d bytes but %d bytes were given"
+                             % (stop - start, length))
+
+        if self.accessSize is None:
+            self._writebytes(start, values)
+        else:
+            self._checkalign(start, self.accessSize)
+            self._writeblock(start, values, self.accessSize)
+
+    def __repr__(self):
+        size = 'u%d' % self.accessSize if self.accessSize else 'bytes'
+        return "<{:s} {:s} of '{:s}'>".format(self.__class__.__name__, size, self.target.mnemonic)
+
+    @staticmethod
+    def _bounds(key):
+        if key.step is not None:
+            raise ValueError("Strided memory access is not supported")
+        if key.start is None:
+            raise ValueError("Memory slices require a start address")
+        return key.start, key.stop
+
+    def _count(self, start, stop, size):
+        self._checkalign(start, size)
+        nbytes = size >> 3
+        if (stop - start) % nbytes:
+            raise ValueError("Slice length is not a multiple of the %d-bit element size" % size)
+        return (stop - start) // nbytes
+
+    @staticmethod
+    def _checkalign(addr, size):
+        if addr & ((size >> 3) - 1):
+            raise ValueError("Address 0x%x is not aligned to a %d-bit access" % (addr, size))
+
+    def _spans(self, addr, nbytes):
+        """
+        Split a byte range into batches that end on `chunkSize` boundaries, so
+        that only the first can start unaligned.
+        """
+        while nbytes:
+            n = min(nbytes, self.chunkSize - addr % self.chunkSize)
+            yield addr, n
+            addr += n
+            nbytes -= n
+
+    def _readblock(self, addr, count, size):
+        step = size >> 3
+        values = []
+        for span, n in self._spans(addr, count*step):
+            if size == 32:
+                values.extend(self.target.read(span, n >> 2))
+            else:
+                values.extend(self.target.scheduler.read(span, n // step, size))
+        return values
+
+    def _writeblock(self, addr, values, size):
+        step = size >> 3
+        i = 0
+        for span, n in self._spans(addr, len(values)*step):
+            chunk = values[i:i + n//step]
+            if size == 32:
+                self.target.write(span, chunk)
+            else:
+                self.target.scheduler.write(span, chunk, size)
+            i += n // step
+
+    def _readbytes(self, addr, nbytes):
+        return ''.join(unhexlify(self.target.readstring(span, n))
+                       for span, n in self._spans(addr, nbytes))
+
+    def _writebytes(self, addr, data):
+        offset = 0
+        for span, n in self._spans(addr, len(data)):
+            self.target.writestring(span, hexlify(data[offset:offset+n]))
+            offset += n
+
+    @staticmethod
+    def _asarray(values, size):
+        if numpy is not None:
+            return numpy.array(values, dtype='u%d' % (size >> 3))
+        return array.array(_typecodes[size], values)
@@ -4,5 +4,6 @@ from svd_parse import SVDParser
 
 PARSERS = { 
             'json': JSVONParser.from_devfile, 'jsvon': JSVONParser.from_devfile,
+            'jsvonb': JSVONParser.from_binfile,
             'svd': SVDParser
           }
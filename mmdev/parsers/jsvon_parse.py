@@ -1,10 +1,21 @@
-import json, re
+import json, re, hashlib, marshal
+from json.decoder import scanstring
 from mmdev.parsers.deviceparser import DeviceParser, ParseException, RequiredValueError
-from mmdev.components import Device, Peripheral, Port, Register, BitField, EnumeratedValue, DebugPort, AccessPort
-from mmdev.blocks import DeviceBlock
+from mmdev.components import Device, Peripheral, Port, Register, BitField, EnumTable, DebugPort, AccessPort
+from mmdev.blocks import DeviceBlock, LeafBlock
 from mmdev.arrays import RegisterArray
 from mmdev import utils
 
+# Binary JSVON files start with this, followed by the format version
+BINARY_MAGIC = 'JSVONB'
+BINARY_VERSION = 1
+
+# The values that are integers, which in JSON files may be hex strings
+_INTKEYS = frozenset(('address', 'size', 'resetValue', 'resetMask', 'mask', 'offset',
+                      'value', 'port', 'laneWidth', 'busWidth', 'elementSize'))
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
 
 def _readtxt(node, tag, default=None, parent={}, required=False, pop=False):
     if pop:
@@ -30,29 +41,230 @@ def _readint(node, tag, default=None, parent={}, required=False, pop=False):
                 
         return parent.get(tag, default)
 
+    return _toint(x)
+
+
+def _toint(x):
+    # Integers are written in decimal or hex, except for the values of
+    # enumerated values, which are written as 0b-prefixed literals
     try:
         return int(x)
     except ValueError:
-        return int(x, 16)        
+        pass
+    try:
+        return int(x, 0)
+    except ValueError:
+        return int(x, 16)
+
+
+class _JSONReader(object):
+    """
+    Reads a JSON document from the file `fh` one object member at a time, so
+    that large objects can be handled member by member instead of being
+    decoded whole. The file is read as the document is, a chunk at a time,
+    and only the text of the value being read is held in memory. The values
+    themselves are decoded by the json module's scanner.
+
+    Positions are offsets in the document.
+    """
+    def __init__(self, fh, chunksize=1 << 16):
+        self.fh = fh
+        self.chunksize = chunksize
+        self.text = ''  # the document from offset `base` on
+        self.base = 0
+        self.pos = 0    # the end of the last value read
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, pos):
+        # Drop the text before `pos`, which has been read, and read more from
+        # the file. Reads grow with the text held, so that a value spanning
+        # many chunks costs a linear number of retries
+        if self.eof:
+            return False
+        self.text = self.text[pos - self.base:]
+        self.base = pos
+        data = self.fh.read(max(self.chunksize, len(self.text)))
+        self.text += data
+        self.eof = not data
+        return not self.eof
+
+    def _char(self, pos):
+        while pos - self.base >= len(self.text) and self._fill(pos):
+            pass
+        return self.text[pos - self.base:pos - self.base + 1]
+
+    def _skip(self, pos):
+        while True:
+            end = self.base + _whitespace.match(self.text, pos - self.base).end()
+            if end - self.base < len(self.text) or not self._fill(end):
+                return end
+            pos = end
+
+    def _expect(self, pos, char):
+        pos = self._skip(pos)
+        if self._char(pos) != char:
+            raise ValueError("Expected '%s' at position %d" % (char, pos))
+        return self._skip(pos + 1)
+
+    def _scan(self, scan, pos):
+        # Scan a token at `pos`, reading more of the file while the token may
+        # be incomplete. A token must be followed by something, since a
+        # number at the end of the text held may go on in the file
+        while True:
+            try:
+                value, end = scan(self.text, pos - self.base)
+            except ValueError:
+                if not self._fill(pos):
+                    raise
+                continue
+            if end < len(self.text) or not self._fill(pos):
+                return value, self.base + end
+
+    def members(self, pos):
+        """
+        Generate the (key, position) of each member of the object at `pos`.
+        Each value must be read, with ``value`` or ``members``, before the
+        next member is generated.
+        """
+        pos = self._expect(pos, '{')
+        if self._char(pos) == '}':
+            self.pos = pos + 1
+            return
+        while True:
+            if self._char(pos) != '"':
+                raise ValueError("Expected a key at position %d" % pos)
+            key, pos = self._scan(lambda text, i: scanstring(text, i + 1), pos)
+            pos = self._expect(pos, ':')
+            yield key, pos
+
+            pos = self._skip(self.pos)
+            if self._char(pos) == '}':
+                self.pos = pos + 1
+                return
+            pos = self._expect(pos, ',')
+
+    def value(self, pos):
+        """
+        Decode the value at `pos`.
+        """
+        value, self.pos = self._scan(self._decoder.raw_decode, self._skip(pos))
+        return value
+
+
+def _tobinary(x, key=None):
+    # Convert a JSVON node for dumping: integers are stored as such, and
+    # ASCII strings are interned so that each is written only once
+    if isinstance(x, dict):
+        return dict((_tobinary(k), _tobinary(v, k)) for k, v in x.iteritems())
+    if isinstance(x, list):
+        return [_tobinary(v) for v in x]
+    if isinstance(x, basestring):
+        if key in _INTKEYS:
+            return _toint(x)
+        try:
+            return intern(str(x))
+        except UnicodeError:
+            return x
+    return x
+
+
+def dump_binary(doc, fh):
+    """
+    Write a JSVON document in binary form to the file `fh`. The document is a
+    block, or the decoded contents of a JSVON file.
+
+    The binary form stores the same schema as JSON, with integers stored
+    natively and repeated strings stored once. It is written with the marshal
+    module, so it can only be read by the same major version of Python.
+
+    Decoding the binary form is cheap, but building the device's blocks is
+    most of the cost of a load, so it loads little faster than JSON.
+    """
+    if isinstance(doc, LeafBlock):
+        doc = json.loads(doc.to_json(recursive=True))
+
+    (kind, node), = doc.items()
+    node = _tobinary(node)
+    pphs = node.pop('peripherals', None)
+
+    fh.write(BINARY_MAGIC + chr(BINARY_VERSION))
+    marshal.dump((kind, node, pphs is not None), fh, 2)
+    # peripherals are written one at a time, so that they can be read back
+    # one at a time
+    for item in (pphs or {}).iteritems():
+        marshal.dump(item, fh, 2)
+    marshal.dump(None, fh, 2)
+
+
+def _readconstraint(node):
+    # ranges are stored as a [minimum, maximum] list
+    x = _readtxt(node, 'writeConstraint')
+    return tuple(x) if isinstance(x, list) else x
 
 
 class JSVONParser(DeviceParser):
     _raiseErr = True
     _supcls = None
+    _cache = None
 
     @classmethod
-    def from_devfile(cls, devfile, raiseErr=True, supcls=None):
+    def from_devfile(cls, devfile, raiseErr=True, supcls=None, cache=None):
+        """
+        Parse a JSVON file. A `cache` dict works as for SVD files (see
+        ``SVDParser.parse_device``): peripherals whose definition has not
+        changed since it was filled are reused instead of parsed again.
+        """
         cls._raiseErr = raiseErr
         cls._supcls = supcls
+        cls._cache = cache
+
+        # The document is read member by member: each peripheral of a device
+        # is parsed as soon as it is decoded, so that neither the file nor
+        # the decoded document is ever held in memory whole
+        with open(devfile) as fh:
+            reader = _JSONReader(fh)
+            for k, pos in reader.members(0):
+                parser = cls._getparser(k)
+                node = {}
+                for key, pos in reader.members(pos):
+                    if key == 'peripherals':
+                        node[key] = cls.parse_peripherals((name, reader.value(p))
+                                                          for name, p in reader.members(pos))
+                    else:
+                        node[key] = reader.value(pos)
+
+                # don't support multiple nodes at the top level
+                return parser(node.pop('mnemonic'), node)
 
-        for k, v in json.load( open(devfile) ).iteritems():
-            try:
-                parser = getattr(cls, 'parse_' + utils.uncamelify(k))
-            except AttributeError:
-                raise AttributeError("No '%s' parser found" % k)
+    @classmethod
+    def from_binfile(cls, devfile, raiseErr=True, supcls=None, cache=None):
+        """
+        Parse a binary JSVON file (see ``dump_binary``).
+        """
+        cls._raiseErr = raiseErr
+        cls._supcls = supcls
+        cls._cache = cache
+
+        with open(devfile, 'rb') as fh:
+            magic = fh.read(len(BINARY_MAGIC) + 1)
+            if magic[:-1] != BINARY_MAGIC:
+                raise ParseException("'%s' is not a binary JSVON file" % devfile)
+            if ord(magic[-1]) != BINARY_VERSION:
+                raise ParseException("Unsupported binary JSVON version %d" % ord(magic[-1]))
+
+            kind, node, streamed = marshal.load(fh)
+            parser = cls._getparser(kind)
+            if streamed:
+                node['peripherals'] = cls.parse_peripherals(iter(lambda: marshal.load(fh), None))
+            return parser(node.pop('mnemonic'), node)
 
-            # don't support multiple nodes at the top level
-            return parser(v.pop('mnemonic'), v)
+    @classmethod
+    def _getparser(cls, kind):
+        try:
+            return getattr(cls, 'parse_' + utils.uncamelify(kind))
+        except AttributeError:
+            raise AttributeError("No '%s' parser found" % kind)
 
     @classmethod
     def parse_port(cls, portname, portnode):
@@ -103,6 +315,9 @@ class JSVONParser(DeviceParser):
                         resetMask=resetMask,
                         resetValue=_readint(regnode, 'resetValue', required=resetMask != 0),
                         access=_readtxt(regnode, 'access', 'read-write'),
+                        modifiedWriteValues=_readtxt(regnode, 'modifiedWriteValues'),
+                        readAction=_readtxt(regnode, 'readAction'),
+                        writeConstraint=_readconstraint(regnode),
                         displayName=_readtxt(regnode, 'displayName',''),
                         description=_readtxt(regnode, 'description',''))
 
@@ -122,22 +337,46 @@ class JSVONParser(DeviceParser):
                         # _readint(bfnode, 'width', required=True),
                         offset,
                         width,
-                        evals,
+                        EnumTable(evals),
                         access=_readtxt(bfnode, 'access', 'read-write'),
+                        modifiedWriteValues=_readtxt(bfnode, 'modifiedWriteValues'),
+                        readAction=_readtxt(bfnode, 'readAction'),
+                        writeConstraint=_readconstraint(bfnode),
                         displayName=_readtxt(bfnode, 'displayName',''),
                         description=_readtxt(bfnode, 'description',''))
 
     @classmethod
     def parse_enumerated_value(cls, evname, evnode):
-        return EnumeratedValue(evname,
-                               _readint(evnode, 'value', required=True),
-                               description=_readtxt(evnode, 'description',''))
+        # a row of the bit field's EnumTable
+        return _readint(evnode, 'value', required=True), evname, _readtxt(evnode, 'description',''), None
 
     @classmethod
-    def parse_device(cls, devname, devnode):
+    def parse_peripherals(cls, items):
+        """
+        Parse the (name, node) items of a device's peripherals.
+        """
+        cache, newcache = cls._cache, {}
         pphs = []
-        for pphname, pphnode in devnode.get('peripherals', {}).iteritems():
-            pphs.append(cls.parse_peripheral(pphname, pphnode))
+        for pphname, pphnode in items:
+            if cache is None:
+                pphs.append(cls.parse_peripheral(pphname, pphnode))
+                continue
+
+            fp = hashlib.sha1(json.dumps([pphname, pphnode], sort_keys=True)).hexdigest()
+            pph = newcache[fp] = cache[fp] if fp in cache else cls.parse_peripheral(pphname, pphnode)
+            pphs.append(pph)
+
+        if cache is not None:
+            cache.clear()
+            cache.update(newcache)
+            cls._cache = None
+        return pphs
+
+    @classmethod
+    def parse_device(cls, devname, devnode):
+        pphs = devnode.get('peripherals', {})
+        if isinstance(pphs, dict):
+            pphs = cls.parse_peripherals(pphs.iteritems())
 
         args = (devname,
                 pphs, 
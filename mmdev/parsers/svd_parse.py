@@ -1,4 +1,3 @@
-from xml.etree import ElementTree
 from mmdev.parsers.deviceparser import DeviceParser, ParseException, RequiredValueError
 from mmdev import components, arrays, utils
 
@@ -6,12 +5,57 @@ import re
 import logging
 from collections import OrderedDict
 from itertools import imap, chain
+import multiprocessing
+import threading
+import hashlib
 import sys
 
 logger = logging.getLogger(__name__)
 
+# The amount of XML sent to a worker at a time when parsing in parallel
+_CHUNKSIZE = 1 << 18
+
+_parselock = threading.RLock()
+
+# The values of the integer literals read so far. The same few sizes, masks
+# and reset values make up most of the literals in a file.
+_intmemo = {}
+_INTMEMO_SIZE = 1 << 12
+
 array_suffex = re.compile(r'\[%s\]|_?%s')
 
+# XML backends in order of preference. All of them provide the ElementTree
+# API; lxml and cElementTree build the tree in C. lxml is only used through
+# that API: selecting an element's children with XPath is slower than
+# iterating over them, and wrapping elements in SVDNodes is a small part of
+# the parse anyway. Unlike the others, lxml also yields comments and
+# processing instructions as children, which have to be skipped.
+BACKENDS = ('lxml', 'cElementTree', 'ElementTree')
+
+
+def get_backend(name=None):
+    """
+    Return the ElementTree module for the named XML backend, or for the
+    fastest one available if `name` is None.
+    """
+    if name is None:
+        for name in BACKENDS:
+            try:
+                return get_backend(name)
+            except ImportError:
+                continue
+        raise ImportError("No XML backend available")
+
+    if name == 'lxml':
+        from lxml import etree
+    elif name == 'cElementTree':
+        from xml.etree import cElementTree as etree
+    elif name == 'ElementTree':
+        from xml.etree import ElementTree as etree
+    else:
+        raise ValueError("Unknown XML backend %r, expected one of %s" % (name, BACKENDS))
+    return etree
+
 
 def get_suffix(name, exp=array_suffex): 
     m = exp.search(name)
@@ -20,6 +64,11 @@ def get_suffix(name, exp=array_suffex):
 get_basename = lambda name, exp=array_suffex: re.sub(exp, '', name)
 
 
+def _iselement(x):
+    # duck typed, since each backend has its own element type
+    return hasattr(x, 'tag')
+
+
 def _readtxt(node, tag, default=None, parent={}, required=False, pop=True):
     if pop:
         x = node.pop(tag, parent.get(tag, default))
@@ -29,7 +78,7 @@ def _readtxt(node, tag, default=None, parent={}, required=False, pop=True):
     if required and x is None:
         raise RequiredValueError("'%s'" % tag)
 
-    return x.text if isinstance(x, ElementTree.Element) else x
+    return x.text if _iselement(x) else x
 
 def _readint(node, tag, default=None, parent={}, required=False, pop=True):
     if pop:
@@ -37,19 +86,37 @@ def _readint(node, tag, default=None, parent={}, required=False, pop=True):
     else:
         x = node.get(tag, None)
 
+    if x is None:
+        x = parent.get(tag)
     if x is None:
         if required and default is None:
             raise RequiredValueError("'%s'" % tag)
-                
-        return parent.get(tag, default)
-    else:
-        x = x.text
+        return default
 
-    x = x.lower()
+    if _iselement(x):
+        x = x.text
+    elif not isinstance(x, basestring):
+        # inherited from an already parsed block
+        return x
+
+    try:
+        return _intmemo[x]
+    except KeyError:
+        pass
+    value = _parseint(x)
+    if len(_intmemo) < _INTMEMO_SIZE:
+        _intmemo[x] = value
+    return value
+
+
+def _parseint(x):
+    # Values are plain ints; they are given their display format by the
+    # blocks they end up in
+    x = x.strip().lower()
     if x.startswith('0x'):
-        return utils.HexValue(x, bitwidth=len(x[2:])*4, base=16)
+        return int(x, 16)
     elif x.startswith('#'):
-        return utils.BinValue(x[1:].replace('x','0'), base=2) # replace DCs with 0's for now
+        return int(x[1:].replace('x','0'), 2) # replace DCs with 0's for now
     elif x == 'false':
         return False
     elif x == 'true':
@@ -58,7 +125,27 @@ def _readint(node, tag, default=None, parent={}, required=False, pop=True):
         return int(x)
 
 
+def _readconstraint(node, parent={}):
+    x = node.pop('writeConstraint', parent.get('writeConstraint'))
+    if x is None or isinstance(x, (basestring, tuple)):
+        return x
+
+    x = SVDNode(x)
+    for k in ('writeAsRead', 'useEnumeratedValues'):
+        if _readint(x, k):
+            return k
+    if 'range' in x:
+        rng = SVDNode(x['range'])
+        return (_readint(rng, 'minimum', required=True), _readint(rng, 'maximum', required=True))
+    return None
+
+
 class SVDNode(dict):
+    """
+    The children of an element keyed by tag, with repeated tags collected
+    into lists, plus the element's attributes. The text of leaf elements is
+    extracted up front, so only elements with children are kept as elements.
+    """
     def __init__(self, node, *args, **kwargs):
         super(SVDNode, self).__init__()
         if isinstance(node, list):
@@ -67,52 +154,236 @@ class SVDNode(dict):
             node = node.pop(0)
 
         for e in node:
-            if e.tag not in self:
-                self[e.tag] = e
+            tag = e.tag
+            if not isinstance(tag, basestring):
+                # comments and processing instructions (lxml)
                 continue
+            text = e.text
+            if not len(e) and text is not None and not text.isspace():
+                e = text
 
-            if not isinstance(self[e.tag], list):
-                self[e.tag] = [self[e.tag]]
-            self[e.tag].append(e)
+            if tag not in self:
+                self[tag] = e
+                continue
+
+            if not isinstance(self[tag], list):
+                self[tag] = [self[tag]]
+            self[tag].append(e)
 
         self.update(node.attrib)
 
 
+def _metadata(node):
+    """
+    Reduce the unparsed remainder of an SVDNode to plain text values, so that
+    the metadata kept on a block does not hold on to the XML tree.
+    """
+    def text(x):
+        return x.text if _iselement(x) else x
+
+    meta = {}
+    for k, v in node.iteritems():
+        if isinstance(v, list):
+            v = [text(x) for x in v if not (_iselement(x) and len(x))]
+        elif _iselement(v):
+            if len(v):
+                continue
+            v = v.text
+        meta[k] = v
+    return meta
+
+
+def _clone(blk, offset=0):
+    """
+    Copy a parsed register (or register array) with its fields, moving it by
+    `offset`. Used to give a derived peripheral its own copy of the registers
+    of the peripheral it is derived from, rather than parsing them again.
+    """
+    if isinstance(blk, arrays.RegisterArray):
+        master = _clone(blk.master, offset) if blk.master is not None else None
+        return arrays.RegisterArray(blk.index, _clone(blk._template, offset),
+                                    elementSize=blk._elementSize, suffix=blk._suffix, master=master)
+    if isinstance(blk, components.Register):
+        return components.Register(blk.mnemonic, [_clone(f) for f in blk.nodes],
+                                   blk.address + offset, blk.size, access=blk.access,
+                                   resetMask=blk.resetMask, resetValue=blk.resetValue,
+                                   modifiedWriteValues=blk.modifiedWriteValues,
+                                   readAction=blk.readAction, writeConstraint=blk.writeConstraint,
+                                   displayName=blk.displayName, description=blk.description,
+                                   kwattrs=blk._kwattrs)
+    if isinstance(blk, components.BitField):
+        return components.BitField(blk.mnemonic, blk.offset, blk.size,
+                                   values=blk._enums,
+                                   access=blk.access, modifiedWriteValues=blk.modifiedWriteValues,
+                                   readAction=blk.readAction, writeConstraint=blk.writeConstraint,
+                                   description=blk.description, kwattrs=blk._kwattrs)
+    if isinstance(blk, components.EnumeratedValue):
+        return components.EnumeratedValue(blk.mnemonic, blk.value, description=blk.description,
+                                          kwattrs=blk._kwattrs)
+    raise TypeError("Cannot clone %r" % (blk,))
+
+
+class _ParsedBlocks(object):
+    """
+    The parsed subblocks of a block, standing in for the element they were
+    parsed from (e.g. <registers> or <fields>) when a block derived from it is
+    parsed.
+
+    The subblocks were parsed with the defaults (`context`) that the parent
+    passed down to them, e.g. a register's access for its fields. If a
+    derived block passes down different defaults they have to be parsed again
+    from `node`, if it is still available.
+    """
+    def __init__(self, blocks, node=None, baseaddr=0, context=None):
+        self.blocks = blocks
+        self.node = node
+        self.baseaddr = baseaddr
+        self.context = context
+
+    def reusable(self, context):
+        if context == self.context:
+            return True
+        if self.node is None:
+            logger.warning("Reusing subblocks of a derived block that were parsed with "
+                           "different defaults (%s instead of %s)", self.context, context)
+            return True
+        return False
+
+    def clone(self, baseaddr=0):
+        return [_clone(blk, baseaddr - self.baseaddr) for blk in self.blocks]
+
+
+class _PeripheralCache(object):
+    """
+    Looks up peripherals by a fingerprint of their definition: a hash of the
+    peripheral's elements, the device defaults and, for derived peripherals,
+    the fingerprint of their parent. Peripherals found are collected into a new
+    cache, which replaces the old one once the whole file has been parsed, so
+    that peripherals that are gone are dropped.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.salt = ''
+        self.found = {}
+        self.fingerprints = {}
+
+    def fingerprint(self, pphnode):
+        """
+        Return the key and fingerprint of a peripheral element. The
+        fingerprint is None without a cache.
+        """
+        name = pphnode.findtext('name')
+        key = get_basename(name), get_suffix(name)
+        if self.cache is None:
+            return key, None
+
+        # the number of children of each element pins down the structure;
+        # this is quite a bit faster than serializing the element
+        content = repr([(e.tag, e.text, len(e), sorted(e.items())) for e in pphnode.iter()
+                        if isinstance(e.tag, basestring)])
+        derivedFrom = pphnode.get('derivedFrom')
+        pfp = '' if derivedFrom is None else \
+              self.fingerprints.get((get_basename(derivedFrom), key[1]), '')
+        fp = self.fingerprints[key] = hashlib.sha1(self.salt + pfp + content).hexdigest()
+        return key, fp
+
+    def get(self, fp):
+        """
+        Return the (peripherals, inherited) entry of a fingerprint, or None.
+        """
+        if fp is None or fp not in self.cache:
+            return None
+        self.found[fp] = self.cache[fp]
+        return self.found[fp]
+
+    def add(self, fp, blks, inherited):
+        if fp is not None and blks:
+            self.found[fp] = blks, inherited
+
+    def commit(self):
+        if self.cache is not None:
+            self.cache.clear()
+            self.cache.update(self.found)
+
+
+def _parse_peripherals(cls, backend, raiseErr, regopts, chunk):
+    # Runs in a worker process: parses a chunk of serialized <peripheral>
+    # elements and returns the peripherals of each, along with what
+    # peripherals derived from them may inherit
+    etree = get_backend(backend)
+    cls._raiseErr = raiseErr
+    cls._peripherals = {}
+    pphs = []
+    for xml in chunk:
+        pphs.append(cls.parse_subblocks([etree.fromstring(xml)], cls.parse_peripheral,
+                                        parsed=cls._peripherals, **regopts))
+    return pphs, cls._peripherals
+
+
 class SVDParser(DeviceParser):
+    # The XML backend to use (see BACKENDS); None picks the fastest available
+    backend = None
+
     _raiseErr = True
     _supcls = None
+    _peripherals = None
 
     @classmethod
     def parse_subblocks(cls, subblksnode, parser, *args, **kwargs):
+        # Blocks already parsed elsewhere that derivedFrom may refer to, keyed
+        # by (basename, suffix)
+        parsed = kwargs.pop('parsed', {})
+
         # Collect blocks first, grouping blocks by their base name (i.e. name
-        # without an array suffix)
+        # without an array suffix), and index them by (basename, suffix) for
+        # derivedFrom lookups. Since a parent may actually be an array block,
+        # the first block with the same suffix as the derived block (or lack
+        # of one) is its parent.
         blkmap = OrderedDict()
+        index = {}
         for blknode in subblksnode:
-            name = get_basename(blknode.findtext('name'))
-            if name in blkmap:
-                blkmap[name].append(blknode)
+            if not isinstance(blknode.tag, basestring):
+                # comments and processing instructions (lxml)
+                continue
+            name = blknode.findtext('name')
+            key = get_basename(name), get_suffix(name)
+            if key[0] in blkmap:
+                blkmap[key[0]].append((key, blknode))
             else:
-                blkmap[name] = [blknode]
+                blkmap[key[0]] = [(key, blknode)]
+            index.setdefault(key, blknode)
+
+        # Parent nodes are built once however many blocks derive from them,
+        # and once a parent has been parsed its subblocks are reused
+        done = {}
+        inherited = {}
+
+        def getparent(key):
+            if key in parsed:
+                # a parent that has already been parsed has itself inherited
+                # whatever it is derived from
+                return parsed[key]
+            if key not in inherited:
+                pnode = index.get(key)
+                inherited[key] = {} if pnode is None else SVDNode(pnode)
+                if key in done:
+                    cls._reuse(inherited[key], done[key])
+            return inherited[key]
 
         subblocks = []
         for name, blknodelst in blkmap.iteritems():
             nodes = []
             parents = []
+            keys = []
 
             # Convert nodes to SVDNodes and grab the appropriate parent nodes
-            for bnode in blknodelst:
-                # Since a parent may actually be an array block, iterate through
-                # the parent list and find the first one that has the same
-                # suffix (or lack of one)
+            for key, bnode in blknodelst:
                 parent = {}
                 if 'derivedFrom' in bnode.attrib:
-                    childsfx = get_suffix(bnode.findtext('name'))
-                    for pblk in blkmap[get_basename(bnode.attrib['derivedFrom'])]:
-                        if get_suffix(pblk.findtext('name')) == childsfx:
-                            parent = SVDNode(pblk)
-                            break
+                    parent = getparent((get_basename(bnode.attrib['derivedFrom']), key[1]))
                 parents.append(parent)
                 nodes.append(SVDNode(bnode))
+                keys.append(key)
 
             # Split nodes from array nodes
             i = 0
@@ -141,12 +412,13 @@ class SVDParser(DeviceParser):
                     newblks = [cls.parse_array(arrnodes, arrparents, parser, arrtype, *args, master=master, **kwargs)]
                 else:
                     newblks = []
-                    for n, p in zip(nodes, parents):
+                    for n, p, key in zip(nodes, parents, keys):
                         nblk = parser(n, *args, parent=p, **kwargs)
                         if isinstance(nblk, list):
                             newblks.extend(nblk)
                         elif nblk is not None:
                             newblks.append(nblk)
+                            done.setdefault(key, nblk)
             except ParseException as e:
                 if cls._raiseErr:
                     raise e
@@ -159,12 +431,115 @@ class SVDParser(DeviceParser):
 
         return subblocks
 
+    @staticmethod
+    def _reuse(pnode, blk):
+        # Replace the subblock elements of a parent node with the subblocks
+        # already parsed from them
+        if isinstance(blk, components.Register) and _iselement(pnode.get('fields')):
+            pnode['fields'] = _ParsedBlocks(blk.nodes, pnode['fields'],
+                                            context=(blk.access, blk.modifiedWriteValues))
+        elif isinstance(blk, components.BitField) and _iselement(pnode.get('enumeratedValues')):
+            pnode['enumeratedValues'] = _ParsedBlocks(blk._enums, pnode['enumeratedValues'])
+
     @classmethod
-    def parse_device(cls, devfile, raiseErr=True, supcls=None):
+    def parse_device(cls, devfile, raiseErr=True, supcls=None, backend=None, processes=None,
+                     cache=None):
+        """
+        Parse an SVD file. If `processes` is given, peripherals are parsed in
+        a pool of that many processes (or one per core, if True).
+
+        If a `cache` dict is given, the peripherals parsed from the file are
+        stored in it by a fingerprint of their definition, and peripherals
+        whose definition is unchanged since the cache was filled are taken
+        from it rather than parsed again. The cached blocks themselves are
+        reused, so a cache should only be shared by reloads of one device
+        (see ``Device.reload``).
+        """
+        # the parse state is kept on the class, so files are parsed one at a
+        # time
+        with _parselock:
+            return cls._parse_device(devfile, raiseErr, supcls, backend, processes, cache)
+
+    @classmethod
+    def _parse_device(cls, devfile, raiseErr, supcls, backend, processes, cache):
         cls._raiseErr = raiseErr
         cls._supcls = supcls
-        devnode = SVDNode(ElementTree.parse(devfile).getroot())
-
+        cls._peripherals = {}
+        backend = backend or cls.backend
+        etree = get_backend(backend)
+
+        # The file is streamed: each peripheral is parsed as soon as its
+        # closing tag is read and its element is then discarded, so the whole
+        # document is never held in memory. Peripherals that are derived from
+        # another reuse its parsed registers, and peripheral arrays, which need
+        # all of their elements, are parsed once the document has been read.
+        #
+        # When parsing in parallel, peripherals are instead sent to the pool
+        # in chunks as they are read, and derived peripherals wait until all
+        # of the others have been parsed.
+        pool = None
+        if processes:
+            pool = multiprocessing.Pool(None if processes is True else processes)
+        #
+        # With a cache, each peripheral is fingerprinted by its elements, the
+        # device defaults and, if it is derived, the fingerprint of its parent.
+        root = pphsnode = None
+        depth = 0
+        pphs = []
+        pending = []
+        chunk, chunklen, jobs = [], 0, []
+        pcache = _PeripheralCache(cache)
+        try:
+            for event, elem in etree.iterparse(devfile, events=('start', 'end')):
+                if event == 'start':
+                    if depth == 0:
+                        root = elem
+                    elif depth == 1 and elem.tag == 'peripherals':
+                        pphsnode = elem
+                        regopts = cls._regopts(SVDNode(root))
+                        pcache.salt = repr(sorted(regopts.items()))
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth != 2 or elem.tag != 'peripheral' or pphsnode is None:
+                    continue
+
+                pphsnode.remove(elem)
+                if cls._deferred(elem, pool is not None):
+                    pending.append(elem)
+                    continue
+
+                if pool is None:
+                    pphs.extend(cls._parse_cached(elem, pcache, regopts))
+                    elem.clear()
+                    continue
+
+                key, fp = pcache.fingerprint(elem)
+                entry = pcache.get(fp)
+                if entry is not None:
+                    pphs.extend(cls._fromcache(key, entry))
+                else:
+                    chunk.append((etree.tostring(elem), fp, key))
+                    chunklen += len(chunk[-1][0])
+                    if chunklen >= _CHUNKSIZE:
+                        jobs.append(cls._submit(pool, backend, raiseErr, regopts, chunk))
+                        chunk, chunklen = [], 0
+                elem.clear()
+
+            if chunk:
+                jobs.append(cls._submit(pool, backend, raiseErr, regopts, chunk))
+            for job, fps, keys in jobs:
+                results, parsed = job.get()
+                cls._peripherals.update(parsed)
+                for blks, fp, key in zip(results, fps, keys):
+                    pphs.extend(blks)
+                    pcache.add(fp, blks, parsed.get(key))
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+        devnode = SVDNode(root)
         try:
             mnem = _readtxt(devnode, 'name', required=True)
             # version = _readtxt(devnode, 'version', required=True)
@@ -173,11 +548,7 @@ class SVDParser(DeviceParser):
             width = _readint(devnode, 'width', required=True)
             vendor = _readtxt(devnode, 'vendor', '')
 
-            regopts = { 'size'      :   _readint(devnode, 'size'),
-                        'access'    :   _readtxt(devnode, 'access'),
-                        # 'protection':   _readtxt(devnode, 'protection'),
-                        'resetValue':   _readint(devnode, 'resetValue'),
-                        'resetMask' :   _readint(devnode, 'resetMask') }
+            regopts = cls._regopts(devnode, pop=True)
 
             for k, t in {'vendorID': _readtxt, 'version': _readtxt, 'series':
                          _readtxt, 'licenseText': _readtxt}.items():
@@ -196,7 +567,7 @@ class SVDParser(DeviceParser):
                           _readtxt(cpu_node, 'endian'),
                           _readint(cpu_node, 'mpuPresent'),
                           _readint(cpu_node, 'fpuPresent'),
-                          kwattrs=cpu_node)
+                          kwattrs=_metadata(cpu_node))
             else:
                 cpu = None
         except ParseException as e:
@@ -205,11 +576,26 @@ class SVDParser(DeviceParser):
             logger.critical(e.message)
             return None
 
-        pphs = cls.parse_subblocks(devnode.pop('peripherals'), cls.parse_peripheral, **regopts)
+        if pphsnode is None:
+            raise RequiredValueError("'peripherals'")
+        devnode.pop('peripherals')
+
+        # derived peripherals whose parent is now known can be looked up in
+        # the cache; anything else waits for the rest to be parsed together
+        deferred = []
+        for elem in pending:
+            if cache is None or cls._deferred(elem):
+                deferred.append(elem)
+            else:
+                pphs.extend(cls._parse_cached(elem, pcache, regopts))
+        pphs.extend(cls.parse_subblocks(deferred, cls.parse_peripheral,
+                                        parsed=cls._peripherals, **regopts))
+        cls._peripherals = {}
+        pcache.commit()
 
         args = mnem, pphs, addressUnitBits, width, cpu
         kwargs = dict(description=description, vendor=vendor,
-                      kwattrs=devnode)
+                      kwattrs=_metadata(devnode))
 
         # don't ask...
         if cls._supcls is None:
@@ -219,6 +605,52 @@ class SVDParser(DeviceParser):
         components.Device.__init__(newdev, *args, **kwargs)
         return newdev
 
+    @classmethod
+    def _fromcache(cls, key, entry):
+        blks, inherited = entry
+        if inherited is not None:
+            cls._peripherals[key] = inherited
+        return blks
+
+    @classmethod
+    def _parse_cached(cls, pphnode, pcache, regopts):
+        key, fp = pcache.fingerprint(pphnode)
+        entry = pcache.get(fp)
+        if entry is not None:
+            return cls._fromcache(key, entry)
+
+        blks = cls.parse_subblocks([pphnode], cls.parse_peripheral,
+                                   parsed=cls._peripherals, **regopts)
+        pcache.add(fp, blks, cls._peripherals.get(key))
+        return blks
+
+    @classmethod
+    def _submit(cls, pool, backend, raiseErr, regopts, chunk):
+        xml, fps, keys = zip(*chunk)
+        job = pool.apply_async(_parse_peripherals, (cls, backend, raiseErr, regopts, xml))
+        return job, fps, keys
+
+    @classmethod
+    def _deferred(cls, pphnode, parallel=False):
+        # Whether a peripheral has to wait until the rest of the document has
+        # been read: arrays, and derived peripherals whose parent has not been
+        # parsed yet (which, when parsing in parallel, is all of them)
+        if pphnode.find('dim') is not None or pphnode.find('dimIndex') is not None:
+            return True
+        derivedFrom = pphnode.get('derivedFrom')
+        if derivedFrom is None:
+            return False
+        key = get_basename(derivedFrom), get_suffix(pphnode.findtext('name'))
+        return parallel or key not in cls._peripherals
+
+    @staticmethod
+    def _regopts(devnode, pop=False):
+        return { 'size'      :   _readint(devnode, 'size', pop=pop),
+                 'access'    :   _readtxt(devnode, 'access', pop=pop),
+                 # 'protection':   _readtxt(devnode, 'protection'),
+                 'resetValue':   _readint(devnode, 'resetValue', pop=pop),
+                 'resetMask' :   _readint(devnode, 'resetMask', pop=pop) }
+
     @classmethod
     def parse_peripheral(cls, pphnode, parent={}, size=None, access=None,
                          protection=None, resetValue=None, resetMask=0):
@@ -234,8 +666,13 @@ class SVDParser(DeviceParser):
                     'prependToName': _readtxt(pphnode, 'prependToName', '', parent=parent),
                     'appendToName': _readtxt(pphnode, 'appendToName', '', parent=parent)}
 
-        regs = cls.parse_subblocks(pphnode.pop('registers', parent.get('registers', [])), 
-                                   cls.parse_register, pphaddr, **regopts)
+        registers = pphnode.pop('registers', parent.get('registers', []))
+        if isinstance(registers, _ParsedBlocks) and registers.reusable(regopts):
+            regs = registers.clone(pphaddr)
+        else:
+            if isinstance(registers, _ParsedBlocks):
+                registers = registers.node
+            regs = cls.parse_subblocks(registers, cls.parse_register, pphaddr, **regopts)
 
         if 'groupName' in pphnode or 'groupName' in parent:
             pphnode['groupName'] = _readtxt(pphnode, 'groupName', parent=parent)
@@ -252,9 +689,20 @@ class SVDParser(DeviceParser):
         addrblocks = pphnode.pop('addressBlock', parent.get('addressBlock'))
         if not isinstance(addrblocks, list):
             addrblocks = [addrblocks]
-
+        addrblocks = [SVDNode(b) if _iselement(b) else b for b in addrblocks]
+
+        # keep what a derived peripheral may inherit, with its registers
+        # already parsed
+        if cls._peripherals is not None:
+            inherited = dict(regopts, name=name, baseAddress=pphaddr, description=description,
+                             addressBlock=map(dict, addrblocks), registers=_ParsedBlocks(regs, baseaddr=pphaddr, context=regopts))
+            if 'groupName' in pphnode:
+                inherited['groupName'] = pphnode['groupName']
+            cls._peripherals[(get_basename(name), get_suffix(name))] = inherited
+
+        kwattrs = _metadata(pphnode)
         pphblk = []
-        for addrblk in imap(SVDNode, addrblocks):
+        for addrblk in imap(dict, addrblocks):
             offset = _readint(addrblk, 'offset', required=True)
             size = _readint(addrblk, 'size', required=True)
             # usage = _readint(pphnode, 'usage')
@@ -264,7 +712,7 @@ class SVDParser(DeviceParser):
                                      pphaddr + offset,
                                      size,
                                      description=description,
-                                     kwattrs=pphnode))
+                                     kwattrs=kwattrs))
         return pphblk
 
 
@@ -319,15 +767,28 @@ class SVDParser(DeviceParser):
                   'access' : _readtxt(regnode, 'access', access, required=True),
                   # protection = _readtxt(regnode, 'protection', protection),
                   'resetMask' : _readint(regnode, 'resetMask', resetMask, parent=parent),
+                  'modifiedWriteValues': _readtxt(regnode, 'modifiedWriteValues', parent=parent),
+                  'readAction': _readtxt(regnode, 'readAction', parent=parent),
+                  'writeConstraint': _readconstraint(regnode, parent=parent),
                   'displayName': _readtxt(regnode, 'displayName', '', parent=parent)
                   }
         kwargs['resetValue'] = _readint(regnode, 'resetValue', resetValue, 
                                         parent=parent, required=kwargs['resetMask'] != 0)
 
+        fields = regnode.pop('fields', parent.get('fields', []))
+        context = kwargs['access'], kwargs['modifiedWriteValues']
+        if isinstance(fields, _ParsedBlocks) and fields.reusable(context):
+            fields = fields.clone()
+        else:
+            if isinstance(fields, _ParsedBlocks):
+                fields = fields.node
+            fields = cls.parse_subblocks(fields, cls.parse_bitfield, access=context[0],
+                                         modifiedWriteValues=context[1])
+
         args = [\
                 # These are required even when inheriting from another register
                 _readtxt(regnode, 'name', required=True),
-                cls.parse_subblocks(regnode.pop('fields', parent.get('fields', [])), cls.parse_bitfield, access=kwargs['access']),
+                fields,
                 _readint(regnode, 'addressOffset', required=True) + baseaddr,
                 _readint(regnode, 'size', size, required=True),
                 ]
@@ -335,7 +796,7 @@ class SVDParser(DeviceParser):
         return components.Register(*args, **kwargs)
 
     @classmethod
-    def parse_bitfield(cls, bitnode, parent={}, access=None):
+    def parse_bitfield(cls, bitnode, parent={}, access=None, modifiedWriteValues=None):
         name = _readtxt(bitnode, 'name', parent=parent, required=True)
 
         description = _readtxt(bitnode, 'description', '', parent=parent)
@@ -353,21 +814,29 @@ class SVDParser(DeviceParser):
             bit_width=1+(msb-lsb)
 
         access = _readtxt(bitnode, 'access', access, required=True)
-        # modifiedWriteValues = _readtxt(bitnode, 'writeValueType')
-        # writeConstraint = _readtxt(bitnode, 'writeConstraintType')
-        # readAction = _readtxt(bitnode, 'readActionType')
+        modifiedWriteValues = _readtxt(bitnode, 'modifiedWriteValues', modifiedWriteValues, parent=parent)
+        writeConstraint = _readconstraint(bitnode, parent=parent)
+        readAction = _readtxt(bitnode, 'readAction', parent=parent)
         
         enumvals = bitnode.get('enumeratedValues', parent.get('enumeratedValues', []))
-        if len(enumvals):
-            # discard 'enumeratedValues' level attributes
-            enumvals = enumvals.findall('enumeratedValue')
-
-        enumvals = cls.parse_subblocks(enumvals, cls.parse_enumerated_value)
-
-        return components.BitField(name, bit_offset, bit_width, values=enumvals, access=access, description=description, kwattrs=bitnode)
+        if isinstance(enumvals, _ParsedBlocks):
+            # the table is never modified, so it can be shared
+            enumvals = enumvals.blocks
+        else:
+            if len(enumvals):
+                # discard 'enumeratedValues' level attributes
+                enumvals = enumvals.findall('enumeratedValue')
+            enumvals = components.EnumTable(cls.parse_subblocks(enumvals, cls.parse_enumerated_value))
+
+        return components.BitField(name, bit_offset, bit_width, values=enumvals, access=access,
+                                   modifiedWriteValues=modifiedWriteValues, readAction=readAction,
+                                   writeConstraint=writeConstraint, description=description,
+                                   kwattrs=_metadata(bitnode))
 
     @classmethod
     def parse_enumerated_value(cls, enumnode, parent={}):
+        # Enumerated values are kept as rows of an EnumTable rather than as
+        # blocks, which the bit field only builds when they are accessed
         name =_readtxt(enumnode, 'name', parent=parent, required=True)
         description = _readtxt(enumnode, 'description', '', parent=parent)
 
@@ -376,4 +845,4 @@ class SVDParser(DeviceParser):
             return None
         
         value = _readint(enumnode, 'value', parent=parent, required=True)
-        return components.EnumeratedValue(name, value, description=description, kwattrs=enumnode)
+        return value, name, description, _metadata(enumnode) or None
@@ -0,0 +1,357 @@
+'''
+Periodic sampling of registers and bit fields into a ring buffer.
+
+A Sampler is given the registers and fields to monitor and a sample rate. It
+works out once which registers have to be read, and groups registers at
+consecutive addresses into auto-incrementing reads, so that each sample is a
+single batch of transfers. A background thread then takes a sample every
+period and stores the raw register values, with a timestamp and a sequence
+number, in a preallocated ring buffer.
+
+The ring buffer is a flat buffer of fixed size records, in memory or in a
+memory-mapped file so that another process can follow it. If NumPy is
+installed, ``Sampler.array`` is a structured array view of the buffer.
+
+Consumers iterate over a sampler to receive decoded samples as they arrive.
+Each iterator keeps its own position; if it falls more than a buffer's worth
+of samples behind, the samples it missed are counted as dropped (or, if
+strict, an Overrun is raised). Samples that were taken late because the link
+could not keep up with the rate are counted in ``Sampler.late``.
+
+Example
+-------
+>>> sampler = Sampler(target, [target.ADC1.DR, target.TIM2.CNT, target.ADC1.SR.EOC], rate=1000)
+>>> with sampler:
+...     for sample in sampler.samples(timeout=1.0):
+...         print sample.time, sample.values
+'''
+from mmdev import blocks
+from collections import namedtuple
+import threading
+import struct
+import mmap
+import time
+import logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+
+def register(blk):
+    """
+    Return the Register that has to be read for a Register or BitField.
+    """
+    if isinstance(blk, blocks.IOBlock) and hasattr(blk, 'address'):
+        return blk
+    if isinstance(getattr(blk, 'parent', None), blocks.IOBlock):
+        return blk.parent
+    raise ValueError("%r is not a register or bit field" % (blk,))
+
+
+def readplan(registers, sideEffects=False):
+    """
+    Plan the fewest reads of a set of registers: registers of the same size at
+    consecutive addresses are read together by one auto-incrementing read.
+
+    Reading a register with read side effects (see
+    ``Register.readSideEffects``), such as a status register that is cleared
+    by reading it, consumes the events it reports, so such registers raise a
+    ValueError unless `sideEffects` is True.
+
+    Returns
+    -------
+    plan : list of (address, count, size)
+        The reads, in address order.
+    slots : dict
+        Maps each register's address to the index of its value in the
+        concatenated results of the reads.
+    """
+    byaddress = {}
+    for reg in registers:
+        if not sideEffects and getattr(reg, 'readSideEffects', False):
+            raise ValueError("Reading %r has side effects; pass sideEffects=True "
+                             "to read it anyway" % (reg,))
+        byaddress[int(reg.address)] = reg
+    plan = []
+    slots = {}
+    for address in sorted(byaddress):
+        size = byaddress[address].size
+        last = plan[-1] if plan else None
+        if last is not None and last[2] == size and last[0] + last[1]*(size >> 3) == address:
+            plan[-1] = (last[0], last[1] + 1, size)
+        else:
+            plan.append((address, 1, size))
+        slots[address] = len(slots)
+    return plan, slots
+
+
+def readraw(target, plan):
+    """
+    Run a read plan as a single batch and return the register values.
+    """
+    link = target.link
+    raw = []
+    with target.transaction():
+        reads = [link.queueMemRead(address, count, size) for address, count, size in plan]
+        link.sync()
+        for values in reads:
+            raw.extend(values)
+    return raw
+
+
+class Sample(namedtuple('Sample', 'seq time values')):
+    """
+    A decoded sample: its sequence number, the time it was taken, and the
+    values of the sampled blocks in the order they were given.
+    """
+    __slots__ = ()
+
+
+class Sampler(object):
+    """
+    Samples registers and bit fields of a target at a fixed rate on a
+    background thread.
+
+    Parameters
+    ----------
+    target : mmdev.target.Target
+        The target to sample.
+    blks : sequence
+        The Registers and BitFields to sample.
+    rate : float
+        Samples per second.
+    capacity : int
+        The number of samples the ring buffer holds.
+    filename : str
+        If given, the ring buffer is a memory-mapped file of this name.
+    sideEffects : bool
+        Allow sampling registers with read side effects (see ``readplan``).
+
+    Attributes
+    ----------
+    count : int
+        The number of samples taken.
+    late : int
+        The number of sample periods that were missed because a sample took
+        longer than the period.
+    dropped : int
+        The number of samples consumers missed because they fell behind.
+    plan : list of (address, count, size)
+        The reads that make up each sample.
+    """
+    class SamplerException(Exception):
+        pass
+
+    class Overrun(SamplerException):
+        pass
+
+    _header = struct.Struct('<Qd')
+
+    def __init__(self, target, blks, rate, capacity=4096, filename=None,
+                 sideEffects=False):
+        self.target = target
+        self.blocks = list(blks)
+        self.period = 1.0 / rate
+        self.capacity = capacity
+        self.filename = filename
+        self.count = 0
+        self.late = 0
+        self.dropped = 0
+
+        self.plan, self._decoders = self._makeplan(self.blocks, sideEffects)
+        self._record = struct.Struct(self._header.format + 'I' * self._nslots)
+        self._buffer = self._allocate(self._record.size * capacity)
+
+        self._cond = threading.Condition()
+        self._running = False
+        self._error = None
+        self._thread = None
+
+    def _makeplan(self, blks, sideEffects):
+        plan, slots = readplan((register(blk) for blk in blks), sideEffects)
+        self._nslots = len(slots)
+
+        decoders = []
+        for blk in blks:
+            reg = register(blk)
+            offset = 0 if reg is blk else blk.offset
+            decoders.append((slots[int(reg.address)], offset, (1 << blk.size) - 1))
+        return plan, decoders
+
+    def _allocate(self, nbytes):
+        if self.filename is None:
+            return bytearray(nbytes)
+        with open(self.filename, 'w+b') as fh:
+            fh.truncate(nbytes)
+            return mmap.mmap(fh.fileno(), nbytes)
+
+    @property
+    def array(self):
+        """
+        The ring buffer as a NumPy structured array with fields 'seq', 'time'
+        and 'raw'. Slot i holds the sample with sequence number n where
+        ``n % capacity == i``.
+        """
+        if numpy is None:
+            raise ImportError("The array view of the ring buffer requires NumPy")
+        dtype = [('seq', '<u8'), ('time', '<f8'), ('raw', '<u4', (self._nslots,))]
+        return numpy.frombuffer(self._buffer, dtype=dtype, count=self.capacity)
+
+    @property
+    def running(self):
+        return self._running
+
+    def start(self):
+        """
+        Start sampling on a background thread.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='Sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the sampling thread to finish.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample(self):
+        """
+        Take a single sample now, without storing it, and return its raw
+        register values.
+        """
+        return readraw(self.target, self.plan)
+
+    def decode(self, raw):
+        """
+        Return the values of the sampled blocks from a sample's raw register
+        values.
+        """
+        return tuple((raw[slot] >> offset) & mask for slot, offset, mask in self._decoders)
+
+    def _run(self):
+        period = self.period
+        deadline = time.time()
+        try:
+            while self._running:
+                now = time.time()
+                raw = self.sample()
+                self._store(now, raw)
+
+                deadline += period
+                now = time.time()
+                if now > deadline:
+                    missed = int((now - deadline) / period) + 1
+                    self.late += missed
+                    deadline += missed * period
+                if deadline > now:
+                    time.sleep(deadline - now)
+        except Exception as e:
+            logger.exception("Sampling stopped")
+            self._error = e
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    def _store(self, timestamp, raw):
+        seq = self.count
+        offset = (seq % self.capacity) * self._record.size
+        self._record.pack_into(self._buffer, offset, seq, timestamp, *raw)
+        with self._cond:
+            self.count = seq + 1
+            self._cond.notify_all()
+
+    def _load(self, seq):
+        offset = (seq % self.capacity) * self._record.size
+        record = self._record.unpack_from(self._buffer, offset)
+        if record[0] != seq:
+            return None
+        return Sample(seq, record[1], self.decode(record[2:]))
+
+    def samples(self, timeout=None, strict=False, start=None):
+        """
+        Generate the samples taken from now on (or from sequence number
+        `start`, if it is still in the buffer), waiting for each as needed.
+
+        Stops when sampling stops, or when no sample arrives within `timeout`
+        seconds. If the consumer falls behind by more than the capacity of the
+        buffer, the samples it missed are skipped and counted in ``dropped``,
+        or if `strict` an Overrun is raised.
+        """
+        seq = self.count if start is None else start
+        while True:
+            with self._cond:
+                while seq >= self.count and self._running:
+                    if not self._wait(timeout):
+                        return
+                if seq >= self.count:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                count = self.count
+
+            if count - seq > self.capacity:
+                missed = count - seq - self.capacity
+                if strict:
+                    raise self.Overrun("Consumer fell %d samples behind" % missed)
+                self.dropped += missed
+                seq += missed
+
+            sample = self._load(seq)
+            if sample is None:
+                # overwritten while it was being read
+                continue
+            yield sample
+            seq += 1
+
+    __iter__ = samples
+
+    def _wait(self, timeout):
+        if timeout is None:
+            self._cond.wait()
+            return True
+        before = self.count
+        self._cond.wait(timeout)
+        return self.count != before or not self._running
+
+    def history(self):
+        """
+        Return the samples currently in the buffer, oldest first.
+        """
+        count = self.count
+        result = []
+        for seq in xrange(max(count - self.capacity, 0), count):
+            sample = self._load(seq)
+            if sample is not None:
+                result.append(sample)
+        return result
+
+    def __repr__(self):
+        return "<{:s} of {:d} blocks at {:g} Hz>".format(self.__class__.__name__,
+                                                          len(self.blocks), 1.0/self.period)
@@ -0,0 +1,196 @@
+'''
+Thread-safe access to a device link.
+
+A DAPLink keeps state on the target between transfers (the DP SELECT bank and
+the MEM-AP CSW and TAR), and a queued batch belongs to whichever thread syncs
+it, so a link must never be used by two threads at once. The Scheduler
+serializes access to a link and merges memory transfers from different
+threads into shared batches.
+
+Transfers are submitted with ``read`` and ``write``, which block until their
+result is available. A thread that submits a transfer while the link is idle
+sends it, together with any transfers that other threads submitted in the
+meantime, as a single batch. Threads whose transfers were carried by another
+thread's batch just pick up their results. Nothing is gained for a single
+thread, but under concurrent load most transfers share a batch.
+
+A group of operations that must not be interleaved with those of other
+threads, such as a read-modify-write, is run inside ``transaction``, during
+which other threads' transfers wait rather than joining its batches:
+
+>>> with target.transaction():
+...     target.RCC.CR.HSEON = 1
+'''
+from mmdev import aio
+import collections
+import contextlib
+import threading
+import time
+
+
+class Latency(object):
+    """
+    Latency statistics for the operations of one thread, in seconds.
+    """
+    __slots__ = 'count', 'total', 'max'
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return "<{:s} n={:d} mean={:.1f}us max={:.1f}us>".format(
+            self.__class__.__name__, self.count, self.mean*1e6, self.max*1e6)
+
+
+class Scheduler(object):
+    """
+    Serializes the use of a device link by multiple threads, merging their
+    memory transfers into shared batches.
+
+    Parameters
+    ----------
+    link : mmdev.devicelink.DeviceLink
+        The link to schedule. It should only be used through the scheduler, or
+        while holding its lock.
+    maxBatch : int
+        The most transfers merged into a single batch.
+
+    Attributes
+    ----------
+    lock : threading.RLock
+        Held while the link is in use.
+    batches : int
+        The number of batches sent.
+    merged : int
+        The number of transfers that were sent in a batch shared with other
+        transfers.
+    latency : dict
+        Maps thread names to the Latency of their operations, from submission
+        to completion.
+    """
+    def __init__(self, link, maxBatch=256):
+        self.link = link
+        self.maxBatch = maxBatch
+        self.lock = threading.RLock()
+        self.batches = 0
+        self.merged = 0
+        self.latency = collections.defaultdict(Latency)
+        self._pending = collections.deque()
+        self._mutex = threading.Lock()
+        self._holder = None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Hold the link for the duration of a with block, so that the operations
+        in it are not interleaved with those of other threads. Transactions
+        may be nested.
+
+        While a transaction is held only its own transfers are sent; those of
+        other threads stay pending until it ends.
+        """
+        with self.lock:
+            outer, self._holder = self._holder, threading.current_thread()
+            try:
+                yield
+            finally:
+                self._holder = outer
+
+    def read(self, address, count=1, accessSize=32):
+        """
+        Read a list of `count` values from consecutive, aligned addresses.
+        """
+        return self._submit(('read', address, count, accessSize))
+
+    def write(self, address, data, accessSize=32):
+        """
+        Write a sequence of values to consecutive, aligned addresses.
+        """
+        self._submit(('write', address, list(data), accessSize))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run any other blocking use of the link as a transaction.
+        """
+        start = time.time()
+        try:
+            with self.transaction():
+                return fn(*args, **kwargs)
+        finally:
+            self._record(time.time() - start)
+
+    def resetMetrics(self):
+        with self._mutex:
+            self.batches = self.merged = 0
+            self.latency.clear()
+
+    def _submit(self, request):
+        start = time.time()
+        future = aio.Future()
+        with self._mutex:
+            self._pending.append((threading.current_thread(), request, future))
+
+        # Whoever holds the lock sends everything pending when it gets to it
+        # (unless it is in a transaction), so by the time the lock is acquired
+        # the transfer may already be done.
+        with self.lock:
+            while not future.done():
+                self._send()
+        self._record(time.time() - start)
+        return future.result()
+
+    def _send(self):
+        with self._mutex:
+            if self._holder is None:
+                batch = [self._pending.popleft()[1:]
+                         for i in xrange(min(len(self._pending), self.maxBatch))]
+            else:
+                # in a transaction, which only the lock holder can be in:
+                # leave the other threads' transfers for after it
+                batch, rest = [], collections.deque()
+                for entry in self._pending:
+                    if entry[0] is self._holder and len(batch) < self.maxBatch:
+                        batch.append(entry[1:])
+                    else:
+                        rest.append(entry)
+                self._pending = rest
+        if not batch:
+            return
+
+        self.batches += 1
+        if len(batch) > 1:
+            self.merged += len(batch)
+            aio.transfer(self.link, batch)
+            return
+
+        # a lone single transfer doesn't need to be queued
+        (kind, address, data, accessSize), future = batch[0]
+        if kind == 'read' and data == 1:
+            fn, args = self.link.memRead, (address, accessSize)
+        elif kind == 'write' and len(data) == 1:
+            fn, args = self.link.memWrite, (address, data[0], accessSize)
+        else:
+            aio.transfer(self.link, batch)
+            return
+        try:
+            result = fn(*args)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result([result] if kind == 'read' else None)
+
+    def _record(self, elapsed):
+        name = threading.current_thread().name
+        with self._mutex:
+            self.latency[name].add(elapsed)
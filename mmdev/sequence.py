@@ -0,0 +1,205 @@
+'''
+Register sequences: record a series of register and bit field operations once
+through the attribute API, then replay them as a single batch of bus
+transfers.
+
+This is the memory-mapped counterpart of ``mmdev.iotemplate.IOTemplate``. A
+sequence is recorded once, converted once per device link into a compiled
+program, and that program is applied many times. Data that changes between
+replays is given as ``Variable`` placeholders, which are filled in from the
+arguments the sequence is called with.
+
+While recording, nothing is sent to the target. Register reads return a model
+of the register's value: the last value written in the sequence, or else the
+register's shadow or reset value (see ``Register.pack``). This means field
+writes are recorded as single writes without the read of a read-modify-write.
+Reads and polls that should happen on the target are recorded explicitly with
+``Sequence.read`` and ``Sequence.poll``.
+
+Example
+-------
+>>> with target.record() as seq:
+...     target.RCC.CR.HSEON = 1
+...     seq.poll(target.RCC.CR.HSERDY, 1, timeout=0.1)
+...     target.GPIOA.ODR = seq.var(0)
+...     seq.read(target.GPIOA.IDR)
+>>> seq(0x55)
+[0x00000010]
+'''
+from mmdev import blocks
+import operator
+
+
+class _Expr(object):
+    ''' An integer expression over Variables, built by applying operators to
+        a Variable, and evaluated when the sequence is replayed.
+    '''
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+
+    def evaluate(self, values):
+        return self.op(*[a.evaluate(values) if isinstance(a, _Expr) else a for a in self.args])
+
+    def __lshift__(self, other):  return _Expr(operator.lshift, self, other)
+    def __rshift__(self, other):  return _Expr(operator.rshift, self, other)
+    def __and__(self, other):     return _Expr(operator.and_, self, other)
+    def __or__(self, other):      return _Expr(operator.or_, self, other)
+    def __xor__(self, other):     return _Expr(operator.xor, self, other)
+    def __add__(self, other):     return _Expr(operator.add, self, other)
+    def __rlshift__(self, other): return _Expr(operator.lshift, other, self)
+    def __rrshift__(self, other): return _Expr(operator.rshift, other, self)
+    def __rand__(self, other):    return _Expr(operator.and_, other, self)
+    def __ror__(self, other):     return _Expr(operator.or_, other, self)
+    def __rxor__(self, other):    return _Expr(operator.xor, other, self)
+    def __radd__(self, other):    return _Expr(operator.add, other, self)
+    def __invert__(self):         return _Expr(operator.invert, self)
+
+
+class Variable(_Expr):
+    ''' Variable is a place-holder for data that is supplied when the
+        sequence is replayed (like ``iotemplate.TDIVariable``).
+
+        The index selects which of the arguments the sequence is called with
+        supplies the value.
+    '''
+    def __init__(self, index=0):
+        self.index = index
+
+    def evaluate(self, values):
+        return values[self.index]
+
+    def __repr__(self):
+        return "<Variable %d>" % self.index
+
+
+def evaluate(data, values):
+    ''' Return the value of a constant or expression for the given variable
+        values.
+    '''
+    return data.evaluate(values) if isinstance(data, _Expr) else data
+
+
+class Sequence(object):
+    """
+    A recorded sequence of bus operations on a target.
+
+    Operations are kept as tuples:
+        ('write', address, data, size)
+            `data` is an int or an expression over Variables.
+        ('read', address, size, mask, offset)
+            The result is ``(value & mask) >> offset``.
+        ('poll', address, size, mask, expect, timeout)
+            Wait until ``value & mask == expect``.
+
+    Parameters
+    ----------
+    target : mmdev.target.Target
+        The target the sequence is recorded on and replayed to.
+    base : {'shadow', 'reset'}
+        Where the modelled value of a register that has not been written in
+        the sequence comes from.
+    """
+    class SequenceException(Exception):
+        pass
+
+    class PollTimeout(SequenceException):
+        pass
+
+    def __init__(self, target, base='shadow'):
+        self.target = target
+        self.base = base
+        self.ops = []
+        self._state = {}
+        self._registers = None
+        self._compiled = {}
+
+    def var(self, index=0):
+        """
+        Return a placeholder for the `index`th argument of a replay.
+        """
+        return Variable(index)
+
+    def read(self, blk):
+        """
+        Record a read of a Register or BitField. Returns the index of its
+        result in the list returned by a replay.
+        """
+        address, size, mask, offset = self._locate(blk)
+        self._modify()
+        self.ops.append(('read', address, size, mask, offset))
+        return sum(1 for op in self.ops if op[0] == 'read') - 1
+
+    def poll(self, blk, value, timeout=1.0):
+        """
+        Record a wait until a Register or BitField reads as `value`, for at
+        most `timeout` seconds.
+        """
+        address, size, mask, offset = self._locate(blk)
+        self._modify()
+        self.ops.append(('poll', address, size, mask, (value << offset) & mask, timeout))
+
+        # after the poll, the modelled value of the register is at least known
+        # to have these bits
+        if isinstance(self._state.get(address), (int, long)):
+            self._state[address] = (self._state[address] & ~mask) | ((value << offset) & mask)
+
+    def __call__(self, *values):
+        """
+        Replay the sequence, with `values` supplying the Variables. Returns
+        the results of the recorded reads.
+        """
+        link = self.target.link
+        program = self._compiled.get(link)
+        if program is None:
+            program = self._compiled[link] = link.compileSequence(self.ops)
+        with self.target.transaction():
+            return link.runSequence(program, values)
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __repr__(self):
+        return "<{:s} of {:d} operations>".format(self.__class__.__name__, len(self.ops))
+
+    # recording interface used by Target._read/_write
+
+    def _record_write(self, address, value, size):
+        self._modify()
+        self.ops.append(('write', address, value, size))
+        self._state[address] = value
+
+    def _record_read(self, address, size):
+        value = self._state.get(address)
+        if value is None:
+            reg = self._register(address)
+            if reg is None:
+                raise self.SequenceException("No register at 0x%x to model a read of" % address)
+            if self.base == 'shadow' and reg.shadow is not None:
+                value = reg.shadow
+            else:
+                value = reg.resetValue & reg.resetMask
+            self._state[address] = value
+
+        if isinstance(value, _Expr):
+            raise self.SequenceException("Cannot read back a register written with a Variable "
+                                         "while recording; use Sequence.read instead")
+        return value
+
+    def _modify(self):
+        self._compiled = {}
+
+    def _register(self, address):
+        if self._registers is None:
+            self._registers = {}
+            for blk in self.target.walk(build=False):
+                if hasattr(blk, 'address') and hasattr(blk, 'resetValue'):
+                    self._registers[int(blk.address)] = blk
+        return self._registers.get(address)
+
+    @staticmethod
+    def _locate(blk):
+        if isinstance(blk, blocks.IOBlock) and hasattr(blk, 'address'):
+            return int(blk.address), blk.size, (1 << blk.size) - 1, 0
+        reg = blk.parent
+        return int(reg.address), reg.size, int(blk.mask), blk.offset
@@ -0,0 +1,305 @@
+'''
+Run jobs on many targets at once, e.g. to flash and verify every board on a
+test station.
+
+A SessionManager is given a list of probes, each of which knows how to open
+its own, isolated link stack (data link, transport, device link and Target).
+A job is a function called as ``job(target, *args)`` once per probe, in a
+worker thread or process, and the return values, errors and timings of all of
+the jobs are collected into a Report.
+
+Threads are enough when the links spend their time waiting on USB; links
+whose protocol work is done in Python (such as the simulated links, or bit
+banged cables) only scale across processes. In process mode the probes, the
+job and its arguments are pickled, so the job must be a module level
+function.
+
+The device file is parsed once per session, and each worker builds its
+Target from a pickled copy of the device, which is much faster than parsing
+the file again and doesn't queue the workers on the parser.
+
+Example
+-------
+>>> def flash(target, image):
+...     target.mem[0x08000000:0x08000000+len(image)] = image
+...     return target.mem[0x08000000:0x08000000+len(image)] == image
+>>> session = SessionManager('data/STM32F20x.svd', FtdiProbe.discover(), mode='process')
+>>> report = session.run(flash, image)
+>>> report.failed
+[]
+'''
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.transport import SWD
+from mmdev.devicelink import DAPLink
+from mmdev.lib.userconfig import UserConfig
+from mmdev import utils
+from multiprocessing.pool import ThreadPool
+from collections import namedtuple
+import multiprocessing
+import cPickle as pickle
+import traceback
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FtdiProbe(object):
+    """
+    An FTDI cable, selected by serial number, location id, description or
+    index (anything ``d2xx.SysInfo.find`` accepts).
+
+    Parameters
+    ----------
+    name : str or int
+        The serial number, location id, description or index of the cable.
+    cable : str
+        The cable driver module (see ``UserConfig.getcable``).
+    options : dict
+        Further configuration options for the cable, e.g. ``FTDI_JTAG_FREQ``.
+    """
+    def __init__(self, name, cable='ftdi', **options):
+        self.name = name
+        self.cable = cable
+        self.options = options
+
+    @classmethod
+    def discover(cls, cable='ftdi', **options):
+        """
+        Return a probe for every cable of the given driver that is attached,
+        by serial number.
+        """
+        config = UserConfig()
+        config.CABLE_DRIVER = cable
+        info = config.getcable().info
+        return [cls(str(dev.SerialNumber), cable, **options) for dev in info]
+
+    def open(self):
+        """
+        Return a new, unconnected device link to the probe.
+        """
+        from mmdev.datalink import FTD2xx
+
+        config = UserConfig()
+        config.CABLE_DRIVER = self.cable
+        config.CABLE_NAME = self.name
+        for name, value in self.options.iteritems():
+            setattr(config, name.upper(), value)
+        return DAPLink(SWD(FTD2xx(config)))
+
+    def __repr__(self):
+        return "<{:s} {!r}>".format(self.__class__.__name__, self.name)
+
+
+class SimProbe(object):
+    """
+    A simulated target (see ``mmdev.datalink.SimTarget``), for running
+    sessions without hardware.
+
+    Parameters
+    ----------
+    name : str
+        A name for the probe, used in reports.
+    regions : sequence of (start, size)
+        Memory regions of the simulated target. Every address is valid if no
+        regions are given.
+    seed : bool
+        Seed the simulated memory with the reset values of the device's
+        registers. Seeding does not change which addresses are valid.
+    targetOptions : dict
+        Further arguments to SimTarget, e.g. ``idcode``.
+    """
+    def __init__(self, name, regions=(), seed=True, **targetOptions):
+        self.name = name
+        self.regions = tuple(regions)
+        self.seed = seed
+        self.targetOptions = targetOptions
+
+    @classmethod
+    def farm(cls, count, regions=(), **kwargs):
+        """
+        Return `count` simulated probes named sim0, sim1, ...
+        """
+        return [cls('sim%d' % i, regions, **kwargs) for i in xrange(count)]
+
+    def open(self):
+        """
+        Return a new, unconnected device link to a fresh simulated target.
+        """
+        memory = SimMemory()
+        for start, size in self.regions:
+            memory.addRegion(start, size)
+        return DAPLink(SWD(SimDataLink(SimTarget(memory, **self.targetOptions))))
+
+    def setup(self, link, target):
+        """
+        Called with the link and Target once the Target has been created.
+        """
+        if self.seed:
+            link.transport.datalink.target.memory.load(target)
+
+    def __repr__(self):
+        return "<{:s} {!r}>".format(self.__class__.__name__, self.name)
+
+
+class Result(namedtuple('Result', 'probe value error openTime jobTime')):
+    """
+    The outcome of a job on one probe. `error` is the formatted traceback if
+    the job failed. Times are in seconds.
+    """
+    __slots__ = ()
+
+
+class Report(list):
+    """
+    The Results of a session, in probe order, and the wall clock time the
+    session took.
+    """
+    def __init__(self, results, elapsed):
+        list.__init__(self, results)
+        self.elapsed = elapsed
+
+    @property
+    def values(self):
+        return [r.value for r in self]
+
+    @property
+    def failed(self):
+        return [r for r in self if r.error is not None]
+
+    @property
+    def serialTime(self):
+        """
+        The time the jobs would have taken one after another.
+        """
+        return sum(r.openTime + r.jobTime for r in self)
+
+    @property
+    def speedup(self):
+        return self.serialTime / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        lines = ["{:d} targets, {:d} failed, {:.3f}s elapsed ({:.1f}x speedup)"
+                 .format(len(self), len(self.failed), self.elapsed, self.speedup)]
+        for r in self:
+            status = 'ok' if r.error is None else r.error.strip().splitlines()[-1]
+            lines.append("    {:<16s} open {:.3f}s  job {:.3f}s  {:s}"
+                         .format(str(getattr(r.probe, 'name', r.probe)),
+                                 r.openTime, r.jobTime, status))
+        return '\n'.join(lines)
+
+
+def _session(device, probe, job, args):
+    # Runs in a worker. Everything from the data link up is created here, and
+    # the device is unpickled from the session's copy, so no state is shared
+    # between targets.
+    from mmdev.target import Target
+
+    start = time.time()
+    target = None
+    opened = None
+    try:
+        link = probe.open()
+        target = Target(link, pickle.loads(device))
+        if hasattr(probe, 'setup'):
+            probe.setup(link, target)
+        target.connect()
+        opened = time.time()
+        value = job(target, *args)
+        error = None
+    except Exception:
+        value = None
+        error = traceback.format_exc()
+        logger.error("Job failed on %r:\n%s", probe, error)
+    finally:
+        if target is not None:
+            try:
+                target.disconnect()
+            except Exception:
+                logger.exception("Failed to disconnect %r", probe)
+
+    end = time.time()
+    if opened is None:
+        opened = end
+    return Result(probe, value, error, opened - start, end - opened)
+
+
+class SessionManager(object):
+    """
+    Opens a Target on each of a set of probes and runs jobs on all of them
+    concurrently.
+
+    Parameters
+    ----------
+    descriptor : str
+        The device file describing the targets.
+    probes : sequence
+        The probes to open, e.g. FtdiProbes or SimProbes. Anything with an
+        ``open()`` method returning a new DeviceLink can be used; an optional
+        ``setup(link, target)`` method is called once the Target exists.
+    mode : {'thread', 'process'}
+        Whether jobs are run on a thread pool or a process pool.
+    workers : int
+        The size of the pool. Defaults to one worker per probe.
+    kwparse : dict
+        Options for parsing the device file (see ``from_devfile``).
+    """
+    def __init__(self, descriptor, probes, mode='thread', workers=None, **kwparse):
+        if mode not in ('thread', 'process'):
+            raise ValueError("mode must be 'thread' or 'process', not %r" % mode)
+        self.descriptor = descriptor
+        self.probes = list(probes)
+        self.mode = mode
+        self.workers = workers or len(self.probes) or 1
+        self.kwparse = kwparse
+        self._device = None
+
+    @property
+    def device(self):
+        """
+        The device parsed from the descriptor, pickled, as it is sent to the
+        workers. It is parsed on first use.
+        """
+        if self._device is None:
+            device = utils.from_devfile(self.descriptor, **self.kwparse)
+            if device is None:
+                raise ValueError("Failed to parse '%s'" % self.descriptor)
+            self._device = pickle.dumps(device, pickle.HIGHEST_PROTOCOL)
+        return self._device
+
+    @classmethod
+    def simulated(cls, descriptor, count, regions=(), mode='thread', **kwargs):
+        """
+        A session on `count` simulated targets, for testing without hardware.
+        """
+        return cls(descriptor, SimProbe.farm(count, regions), mode=mode, **kwargs)
+
+    def run(self, job, *args):
+        """
+        Run ``job(target, *args)`` on every probe and return a Report of the
+        results. A job that raises does not stop the others.
+        """
+        start = time.time()
+        device = self.device
+        work = [(device, probe, job, args) for probe in self.probes]
+
+        if self.mode == 'thread':
+            pool = ThreadPool(self.workers)
+        else:
+            pool = multiprocessing.Pool(self.workers)
+        try:
+            results = pool.map(_star_session, work, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        report = Report(results, time.time() - start)
+        logger.info("%s", report)
+        return report
+
+    def __repr__(self):
+        return "<{:s} of {:d} probes ({:s})>".format(self.__class__.__name__,
+                                                     len(self.probes), self.mode)
+
+
+def _star_session(work):
+    return _session(*work)
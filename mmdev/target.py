@@ -1,14 +1,35 @@
 from mmdev import utils
 from mmdev.components import Device
-from mmdev.devicelink import DeviceLink
+from mmdev.devicelink import DeviceLink, BusDriver
+from mmdev.lib.bus32 import Bus32
+from mmdev.memview import MemoryView
+from mmdev.sequence import Sequence
+from mmdev.scheduler import Scheduler
+from mmdev import aio
+import contextlib
 
 
 class Target(Device):
     """
     Models an SVD-like device that defines a single memory address space and its
     data bus.
+
+    The descriptor is either a device file, which is parsed with the options
+    in `kwparse`, or an already parsed Device, whose blocks the target takes
+    over (so a device should only be given to one target; see
+    ``mmdev.session`` for sharing one parse between targets).
     """
+    _recorder = None
+    _worker = None
+
     def __new__(cls, link, descriptor, **kwparse):
+        if isinstance(descriptor, Device):
+            tgt = Device.__new__(cls, descriptor.mnemonic, (), bind=False)
+            tgt.__dict__.update(descriptor.__dict__)
+            for blk in tgt._nodes:
+                blk.parent = tgt
+            return tgt
+
         # This is a sneaky way for init'ing the deviceblock but it's much easier
         # to let from_devfile handle the parsing and initialization
         return utils.from_devfile(descriptor, supcls=cls, **kwparse)
@@ -16,71 +37,194 @@ class Target(Device):
     def __init__(self, link, descriptorfile, **kwparse):
         assert isinstance(link, DeviceLink)
         self.link = link
+        self.scheduler = Scheduler(link)
 
-        for blk in self.walk():
+        self.bigEndian = self.cpu is not None and 'big' in str(self.cpu.endian).lower()
+        self.bus = Bus32(BusDriver(link, big_endian=self.bigEndian))
+
+        for blk in self.walk(build=False):
             blk.root = self
 
+    @property
+    def mem(self):
+        """
+        A sliceable view of the target's address space. (see
+        ``mmdev.memview.MemoryView``)
+        """
+        return MemoryView(self)
+
+    @property
+    def recording(self):
+        """
+        True while register operations are being recorded into a Sequence.
+        """
+        return self._recorder is not None
+
+    @contextlib.contextmanager
+    def record(self, base='shadow'):
+        """
+        Record the register operations made in a with block into a
+        ``mmdev.sequence.Sequence`` instead of sending them to the target.
+        Bit-banding is disabled while recording so that field writes are
+        recorded against their register.
+        """
+        seq = Sequence(self, base=base)
+        self._recorder, bitband = seq, self.bitband
+        self.bitband = False
+        try:
+            yield seq
+        finally:
+            self._recorder, self.bitband = None, bitband
+
+    def transaction(self):
+        """
+        Hold the link for the duration of a with block, so that the operations
+        in it are not interleaved with those of other threads. (see
+        ``mmdev.scheduler.Scheduler``)
+        """
+        return self.scheduler.transaction()
+
     def connect(self):
-        self.link.connect()
+        self.scheduler.call(self.link.connect)
 
     def disconnect(self):
-        self.link.disconnect()
+        self.aclose()
+        self.scheduler.call(self.link.disconnect)
 
     def reset(self):
-        self.link.disconnect()
-        self.link.connect()
+        with self.transaction():
+            self.link.disconnect()
+            self.link.connect()
 
-    # defer to a DeviceLink to read/write memory
+    # defer to a DeviceLink to read/write memory. Register accesses from
+    # different threads are merged into shared batches by the scheduler.
     def _write(self, address, value, accessSize=None):
         if accessSize is None:
             accessSize = self.busWidth
-        self.link.memWrite(address, value, accessSize)
-    write = _write
-    
+        if self._recorder is not None:
+            return self._recorder._record_write(address, value, accessSize)
+        self.scheduler.write(address, [value], accessSize)
+
     def _read(self, address, accessSize=None):
         if accessSize is None:
             accessSize = self.busWidth
-        return utils.HexValue(self.link.memRead(address, accessSize), accessSize)
-    read = _read
-
-    # def read(self, address, bitlen):
-    #     data = []
-
-    #     # First align the address
-    #     modbits = address % self.laneWidth
-    #     address -= modbits
-    #     bitlen -= modbits
-    #     xferlen = align*bool(modbits)
-    #     data += self.link.memRead(address, xferlen)
-    #     address += xferlen
-
-    #     # Read the rest of the data in the largest aligned transfers possible
-    #     xferwidth = self.busWidth
-    #     while bitlen:
-    #         xferlen = xferwidth * (bitlen // xferwidth)
-    #         data += self.link.memRead(address, xferlen)
-    #         bitlen -= xferlen
-    #         address += xferlen
-    #         xferwidth >>= 1
-
-    #     return data
-
-    # def write(self, address, data, bitlen):
-    #     # First align the address
-    #     modbits = address % self.laneWidth
-    #     address -= modbits
-    #     bitlen -= modbits
-    #     xferlen = align*bool(modbits)
-    #     self.link.memWrite(address, data.pop(), xferlen)
-    #     address += xferlen
-
-    #     # Read the rest of the data in the largest aligned transfers possible
-    #     xferwidth = self.busWidth
-    #     while bitlen:
-    #         xferlen = xferwidth * (bitlen // xferwidth)
-    #         self.link.memWrite(address, data.pop(), xferlen)
-    #         bitlen -= xferlen
-    #         address += xferlen
-    #         xferwidth >>= 1
-
-    #     return data
+        if self._recorder is not None:
+            return utils.HexValue(self._recorder._record_read(address, accessSize), accessSize)
+        return utils.HexValue(self.scheduler.read(address, 1, accessSize)[0], accessSize)
+
+    # Arbitrary, possibly unaligned, reads and writes go through Bus32 which
+    # splits them into aligned transfers. The writes are queued on the link so
+    # each call is sent as a single batch, in a transaction.
+    def read(self, address, count=None):
+        """
+        Read a 32 bit value, or a list of `count` 32 bit values.
+        """
+        with self.transaction():
+            return self.bus.read(address, count)
+
+    def readhalf(self, address, count=None):
+        """
+        Read a 16 bit value, or a list of `count` 16 bit values.
+        """
+        with self.transaction():
+            return self.bus.readhalf(address, count)
+
+    def readbyte(self, address, count=None):
+        """
+        Read a byte, or a list of `count` bytes.
+        """
+        with self.transaction():
+            return self.bus.readbyte(address, count)
+
+    def readstring(self, address, length):
+        """
+        Read `length` bytes and return them as a hex string.
+        """
+        with self.transaction():
+            return self.bus.readstring(address, length)
+
+    def writeBurst(self, writes):
+        """
+        Write a precomputed sequence of (address, value) or (address, value,
+        accessSize) pairs as a single burst, e.g. a peripheral initialization
+        sequence built with ``Register.compose``.
+        """
+        self.scheduler.call(self.link.memWriteBurst, writes)
+
+    def write(self, address, value):
+        """
+        Write a 32 bit value or list of 32 bit values.
+        """
+        with self.transaction():
+            self.bus.write(address, value)
+            self.link.sync()
+
+    def writehalf(self, address, value):
+        """
+        Write a 16 bit value or list of 16 bit values.
+        """
+        with self.transaction():
+            self.bus.writehalf(address, value)
+            self.link.sync()
+
+    def writebyte(self, address, value):
+        """
+        Write a byte or list of bytes.
+        """
+        with self.transaction():
+            self.bus.writebyte(address, value)
+            self.link.sync()
+
+    def writestring(self, address, value):
+        """
+        Write the bytes given by a hex string.
+        """
+        with self.transaction():
+            self.bus.writestring(address, value)
+            self.link.sync()
+
+    # Asynchronous API. Work is run on a LinkWorker thread which coalesces
+    # transfers submitted together. (see ``mmdev.aio``)
+    @property
+    def worker(self):
+        """
+        The LinkWorker that runs this target's asynchronous operations, started
+        on first use.
+        """
+        if self._worker is None:
+            self._worker = aio.LinkWorker(self.link, lock=self.scheduler.lock)
+        return self._worker
+
+    def aread(self, address, count=None, accessSize=32):
+        """
+        Read a value, or a list of `count` values, from aligned consecutive
+        addresses. Returns a future.
+        """
+        future = self.worker.read(address, count or 1, accessSize)
+        if count is None:
+            future = aio.chain(future, lambda values: values[0])
+        return aio.wrap_future(future)
+
+    def awrite(self, address, value, accessSize=32):
+        """
+        Write a value or list of values to aligned consecutive addresses.
+        Returns a future.
+        """
+        if isinstance(value, (int, long)):
+            value = [value]
+        return aio.wrap_future(self.worker.write(address, value, accessSize))
+
+    def acall(self, fn, *args, **kwargs):
+        """
+        Run a blocking call that uses the link, such as a register access, on
+        the worker thread. Returns a future.
+        """
+        return aio.wrap_future(self.worker.call(fn, *args, **kwargs))
+
+    def aclose(self):
+        """
+        Stop the worker thread once its pending work is done.
+        """
+        if self._worker is not None:
+            self._worker.close()
+            self._worker = None
@@ -1,3 +1,3 @@
-from transport import Transport
+from transport import Transport, TransferResult, RetryPolicy
 from mocktransport import MockTransport
 from swd import SWD
@@ -8,7 +8,7 @@ logger = logging.getLogger(__name__)
 class MockTransport(Transport):
 
     def __init__(self, datalink=None):
-        self.datalink = MockDataLink()
+        super(MockTransport, self).__init__(MockDataLink())
 
     def sendPacket(self, *args, **kwargs):
         logger.debug("Transport <= %s %s" % (args, kwargs))
@@ -20,3 +20,11 @@ class MockTransport(Transport):
 
     def sendRequest(self, *args, **kwargs):
         return 1
+
+    def _transfer(self, queue):
+        for rslt in queue:
+            logger.debug("Transport <=> %r" % rslt)
+            if rslt.rnw:
+                rslt.data = 0
+            rslt.ack = 1
+            rslt.done = True
@@ -1,4 +1,4 @@
-from transport import Transport
+from transport import Transport, RetryPolicy
 import logging
 import time
 
@@ -14,10 +14,51 @@ ACK_OK = 1
 ACK_WAIT = 2
 ACK_FAULT = 4
 
+# DP registers and flags used for error recovery
+DP_ABORT = 0 << 2
+DP_CTRLSTAT = 1 << 2
+DAPABORT = 1 << 0
+ORUNERRCLR = 1 << 4
+ORUNDETECT = 1 << 0
+STICKYORUN = 1 << 1
+STICKYERR = 1 << 5
+WDATAERR = 1 << 7
+
 reverse_bits = lambda b,w: ("{0:0%db}" % w).format(b)[::-1]
 
 
+def _parity(data):
+    data = (data ^ (data >> 16))
+    data = (data ^ (data >> 8))
+    data = (data ^ (data >> 4))
+    data = (data ^ (data >> 2))
+    return (data ^ (data >> 1)) & 1
+
+
 class SWD(Transport):
+    """
+    Serial Wire Debug protocol transport.
+
+    Parameters
+    ----------
+    datalink : mmdev.datalink.DataLink
+        Specifies the underlying data link to use for sending data.
+    retry : mmdev.transport.RetryPolicy
+        How to recover from WAIT and FAULT responses.
+    overrunDetect : bool
+        Use the DP's overrun detection (CTRL/STAT.ORUNDETECT), which
+        ``DAPLink.connect`` enables to match. The data phase of every
+        transaction is then always clocked, so a batch of queued requests is
+        sent as a single data link transfer that runs to completion without
+        the host reacting to each ACK. The sticky flags are checked once at
+        the end of the batch. Without it, queued requests are sent one at a
+        time so that each ACK is checked before the data phase, and queueing
+        saves nothing.
+    """
+    def __init__(self, datalink, retry=None, overrunDetect=True):
+        super(SWD, self).__init__(datalink)
+        self.retry = RetryPolicy() if retry is None else retry
+        self.overrunDetect = overrunDetect
 
     def connect(self):
         self.datalink.connect()
@@ -29,6 +70,7 @@ class SWD(Transport):
         self.JTAG2SWD()
 
     def disconnect(self):
+        self._queue = []
         try:
             self.line_reset()
         finally:
@@ -45,80 +87,267 @@ class SWD(Transport):
 
         self.datalink.write('0'*8)
 
-    def sendPacket(self, data):
-        parity = data
-        parity = (parity ^ (parity >> 16))
-        parity = (parity ^ (parity >> 8))
-        parity = (parity ^ (parity >> 4))
-        parity = (parity ^ (parity >> 2))
-        parity = (parity ^ (parity >> 1)) & 1
+    def resync(self):
+        """
+        Bring the target back in step with the host after a failed transaction
+        left the line in an unknown state. A line reset must be followed by a
+        read of IDCODE before the DP will accept any other request.
+        """
+        self.line_reset()
+        self.datalink.write('0'*8)
+        self.sendRequest(0, 1, IDCODE)
+        return self.readPacket()
 
+    @staticmethod
+    def _encodeRequest(apndp, rnw, a23):
+        rqst = a23 | rnw << 1 | apndp
+        parity = rqst
+        parity ^= parity >> 1
+        parity ^= parity >> 2        
+        parity &= 1
+
+        return '1{}{}01'.format(reverse_bits(rqst,w=4), '1' if parity else '0')
+
+    @staticmethod
+    def _encodePacket(data):
         # Insert one turnaround period (needed between reception of ACK and
         # transmission of data) followed by the data word and parity bit
-        data = '0' + reverse_bits(data,w=32) + ('1' if parity else '0')
+        return '0' + reverse_bits(data,w=32) + ('1' if _parity(data) else '0')
+
+    @staticmethod
+    def _decodeAck(ack):
+        # skip the turnaround bit then read 3 bit ACK
+        logger.debug('ACK %s' % ack[3:0:-1])
+        return int(ack[3:0:-1],2)
 
+    def _decodePacket(self, x):
+        logger.debug("RDATA %s (0x%08x)" % (x[31::-1], int(x[31::-1], base=2)))
+        data, presp = int(x[31::-1], 2), int(x[32], 2)
+
+        if _parity(data) ^ presp:
+            raise self.InvalidResponse("Parity Error")
+
+        return data
+
+    def _ackError(self, ack):
+        if ack==ACK_WAIT:
+            return self.BusyResponse("DAP stuck in WAIT state")
+        elif ack==ACK_FAULT:
+            return self.FaultResponse('Target responded with FAULT error code')
+        elif ack==0b111:
+            return self.NoACKResponse('No response from target.')
+        elif ack!=ACK_OK:
+            return self.InvalidResponse('Received invalid ACK ({:#03b})'.format(ack))
+
+    def sendPacket(self, data):
+        data = self._encodePacket(data)
         logger.debug("WDATA %s (0x%08x)" % (data[1:-1], int(data[-2:0:-1], base=2)))
         self.datalink.write(data)
 
     def readPacket(self):
         # read 32bit word + 1 bit parity, and clock 1 additional cycle to
         # satisfy turnaround for next transmission
-        x = self.datalink.read(34)
-        logger.debug("RDATA %s (0x%08x)" % (x[31::-1], int(x[31::-1], base=2)))
-        data, presp = int(x[31::-1], 2), int(x[32], 2)
+        return self._decodePacket(self.datalink.read(34))
 
-        parity = data
-        parity = (parity ^ (parity >> 16))
-        parity = (parity ^ (parity >> 8))
-        parity = (parity ^ (parity >> 4))
-        parity = (parity ^ (parity >> 2))
-        parity = (parity ^ (parity >> 1)) & 1
+    def _skipData(self, rnw):
+        """
+        Clock past the data phase of a transaction that did not receive an OK
+        ACK. Without overrun detection there is no data phase, only a
+        turnaround.
+        """
+        if not self.overrunDetect:
+            self.datalink.read(1)
+        elif rnw:
+            self.datalink.read(34)
+        else:
+            self.datalink.write('0'*34)
 
-        if parity ^ presp:
-            raise self.InvalidResponse("Parity Error")
+    def _writeAbort(self, value):
+        # ABORT writes are accepted regardless of sticky flags, so don't go
+        # through the retry logic in sendRequest
+        self.datalink.write(self._encodeRequest(0, 0, DP_ABORT))
+        ack = self._decodeAck(self.datalink.read(4))
+        if ack == ACK_OK:
+            self.sendPacket(value)
+        else:
+            logger.warning('ABORT write received ACK {:#05b}'.format(ack))
+            self._skipData(0)
 
-        return data
+    def _recover(self, ack):
+        """
+        Apply the retry policy's recovery action for a request that failed
+        with `ack`.
+        """
+        if ack == ACK_WAIT and self.retry.abortOnTimeout:
+            self._writeAbort(DAPABORT | (ORUNERRCLR if self.overrunDetect else 0))
+        elif ack == ACK_FAULT and self.retry.faultClear:
+            self._writeAbort(self.retry.faultClear)
 
     def sendRequest(self, apndp, rnw, a23):
         """
         Sends an SWD 4 bit request packet (APnDP | RnW | A[2:3]) and
-        verifies the response from the target
+        verifies the response from the target. WAIT responses are retried
+        according to the retry policy.
         """
-        rqst = a23 | rnw << 1 | apndp
-        parity = rqst
-        parity ^= parity >> 1
-        parity ^= parity >> 2        
-        parity &= 1
-
-        rqst = '1{}{}01'.format(reverse_bits(rqst,w=4), '1' if parity else '0')
-        logger.debug('RQST %s (apndp=%d, rnw=%d, a23=0x%x)' % (rqst, apndp, rnw, a23))
-        self.datalink.write(rqst)
-
-        # wait 1 TRN then read 3 bit ACK
-        ack = self.datalink.read(4)
-        logger.debug('ACK %s' % ack[3:0:-1])
-        ack = int(ack[3:0:-1],2)
-
-        tries = 0
-        while ack == ACK_WAIT and tries < 3:
-            time.sleep(0.1)
-            self.datalink.read(1) # insert a turnaround before sending next request
+        ack = self._request(apndp, rnw, a23)
+        if ack != ACK_OK:
+            raise self._ackError(ack)
+        return ack
 
+    def _request(self, apndp, rnw, a23):
+        # Send a request packet, retrying WAITs, and return the final ACK. The
+        # recovery action has been taken if it is not OK.
+        rqst = self._encodeRequest(apndp, rnw, a23)
+        delays = None
+        while True:
             logger.debug('RQST %s (apndp=%d, rnw=%d, a23=0x%x)' % (rqst, apndp, rnw, a23))
             self.datalink.write(rqst)
 
-            ack = self.datalink.read(4)
-            logger.debug('ACK %s' % ack[3:0:-1])
-            ack = int(ack[3:0:-1],2)
-            tries += 1
-        if tries == 3:
-            raise self.BusyResponse("DAP stuck in WAIT state")
+            # wait 1 TRN then read 3 bit ACK
+            ack = self._decodeAck(self.datalink.read(4))
+            if ack == ACK_OK:
+                return ack
 
-        if ack==ACK_FAULT:
-            raise self.FaultResponse('Target responded with FAULT error code')
-        elif ack==0b111:
-            raise self.NoACKResponse('No response from target.')
-        elif ack!=ACK_OK:
-            raise self.InvalidResponse('Received invalid ACK ({:#03b})'.format(ack))
+            if ack in (ACK_WAIT, ACK_FAULT):
+                self._skipData(rnw)
+            if ack != ACK_WAIT:
+                break
 
+            if delays is None:
+                delays = self.retry.delays()
+            delay = next(delays, None)
+            if delay is None:
+                break
+            if self.overrunDetect:
+                self._writeAbort(ORUNERRCLR)
+            if delay:
+                time.sleep(delay)
+
+        self._recover(ack)
         return ack
+
+    def _transfer(self, queue):
+        """
+        Send a batch of queued requests as a single data link transfer. This
+        relies on overrun detection: the batch always runs to completion and a
+        read of CTRL/STAT is appended to check the sticky flags. Without it
+        (``overrunDetect=False``), a data phase clocked out after a WAIT or
+        FAULT would be taken by the target as new requests, so the requests
+        are sent one data link transfer at a time instead (see
+        ``_transferEach``).
+
+        The request that failed and all requests after it are retried if the
+        failure was a WAIT, and otherwise the failed request reports the error
+        and the requests after it are cancelled.
+        """
+        if not self.overrunDetect:
+            return self._transferEach(queue)
+
+        delays = None
+        while queue:
+            segments = []
+            for rslt in queue:
+                segments.append(self._encodeRequest(rslt.apndp, rslt.rnw, rslt.a23))
+                segments.append(4)
+                segments.append(34 if rslt.rnw else self._encodePacket(rslt.data))
+            segments.extend((self._encodeRequest(0, 1, DP_CTRLSTAT), 4, 34))
+            logger.debug('XFER %d requests' % len(queue))
+            rdata = iter(self.datalink.transfer(segments))
+
+            failed = None
+            for i, rslt in enumerate(queue):
+                ack = self._decodeAck(rdata.next())
+                x = rdata.next() if rslt.rnw else None
+                if failed is not None:
+                    continue # collateral of an earlier failure, will be retried or cancelled
+                rslt.ack = ack
+                if ack != ACK_OK:
+                    failed = i
+                    continue
+                if rslt.rnw:
+                    try:
+                        rslt.data = self._decodePacket(x)
+                    except self.InvalidResponse as e:
+                        rslt.error = e
+                rslt.done = True
+
+            ack = self._decodeAck(rdata.next())
+            x = rdata.next()
+            try:
+                ctrlstat = self._decodePacket(x) if ack == ACK_OK else None
+            except self.InvalidResponse:
+                ctrlstat = None
+
+            if failed is None and ctrlstat is not None and ctrlstat & (STICKYERR | WDATAERR):
+                # A posted AP write faulted with no later AP access to
+                # report it; blame the last AP write of the batch
+                rslt = [r for r in queue if r.apndp and not r.rnw][-1:] or queue[-1:]
+                rslt[0].error = self.FaultResponse('Sticky error flag set by posted write '
+                                                   '(CTRL/STAT=0x%08x)' % ctrlstat)
+                self._recover(ACK_FAULT)
+                return
+
+            if failed is None:
+                return
+
+            queue = queue[failed:]
+            rslt = queue[0]
+            if rslt.ack not in (ACK_WAIT, ACK_FAULT):
+                try:
+                    self.resync()
+                except self.TransportException as e:
+                    self._cancel(queue, e)
+                    raise
+
+            if rslt.ack == ACK_WAIT:
+                if delays is None:
+                    delays = self.retry.delays()
+                delay = next(delays, None)
+                if delay is not None:
+                    self._writeAbort(ORUNERRCLR)
+                    if delay:
+                        time.sleep(delay)
+                    continue
+
+            self._recover(rslt.ack)
+            rslt.error = self._ackError(rslt.ack)
+            rslt.done = True
+            self._cancel(queue[1:], self.CancelledRequest("Request was not sent; "
+                                                          "an earlier queued request failed"))
+            return
+
+    def _transferEach(self, queue):
+        """
+        Send queued requests one at a time, checking each ACK before going on
+        to the data phase.
+        """
+        for i, rslt in enumerate(queue):
+            rslt.ack = ack = self._request(rslt.apndp, rslt.rnw, rslt.a23)
+            if ack != ACK_OK:
+                if ack not in (ACK_WAIT, ACK_FAULT):
+                    # no valid response, so the line may be out of step
+                    try:
+                        self.resync()
+                    except self.TransportException as e:
+                        self._cancel(queue[i:], e)
+                        raise
+                rslt.error = self._ackError(ack)
+                rslt.done = True
+                self._cancel(queue[i+1:], self.CancelledRequest("Request was not sent; "
+                                                                "an earlier queued request failed"))
+                return
+
+            if rslt.rnw:
+                try:
+                    rslt.data = self.readPacket()
+                except self.InvalidResponse as e:
+                    rslt.error = e
+            else:
+                self.sendPacket(rslt.data)
+            rslt.done = True
+
+    @staticmethod
+    def _cancel(queue, error):
+        for rslt in queue:
+            rslt.error = error
+            rslt.done = True
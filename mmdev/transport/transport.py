@@ -1,9 +1,126 @@
+import time
+
+
+class RetryPolicy(object):
+    """
+    Describes how a transport recovers from WAIT and FAULT responses.
+
+    A request that receives WAIT is first retried immediately `spins` times.
+    After that, retries are spaced by an exponential backoff starting at
+    `backoff` microseconds and capped at `maxBackoff` microseconds, until
+    `deadline` seconds have passed since the first WAIT.
+
+    Parameters
+    ----------
+    spins : int
+        Number of immediate retries before backing off.
+    backoff : int
+        Initial delay between retries in microseconds.
+    maxBackoff : int
+        Maximum delay between retries in microseconds.
+    deadline : float
+        Time in seconds after which the request is given up on and a
+        BusyResponse is raised.
+    abortOnTimeout : bool
+        Write DAPABORT to cancel the stalled transaction when giving up.
+    faultClear : int
+        Bits written to the DP ABORT register after a FAULT response to clear
+        the sticky error flags. Set to 0 to leave the flags for inspection.
+    """
+    def __init__(self, spins=8, backoff=10, maxBackoff=10000, deadline=0.5,
+                 abortOnTimeout=True, faultClear=0x1C):
+        self.spins = spins
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.deadline = deadline
+        self.abortOnTimeout = abortOnTimeout
+        self.faultClear = faultClear
+
+    def delays(self):
+        """
+        Generate the delay in seconds to wait before each retry. The generator
+        is exhausted once the deadline has passed.
+        """
+        start = time.time()
+        for i in xrange(self.spins):
+            yield 0
+
+        delay = self.backoff
+        while True:
+            remaining = self.deadline - (time.time() - start)
+            if remaining <= 0:
+                return
+            yield min(delay * 1e-6, remaining)
+            delay = min(delay * 2, self.maxBackoff)
+
+    def __repr__(self):
+        return "<{:s} spins={:d} backoff={:g}us deadline={:g}s>".format(self.__class__.__name__,
+                                                                        self.spins, self.backoff,
+                                                                        self.deadline)
+
+
+class TransferResult(object):
+    """
+    A handle to the outcome of a request that has been queued on a transport.
+
+    The request is not guaranteed to have been sent to the target until the
+    transport is flushed. Calling ``result()`` on a pending handle flushes the
+    transport's queue.
+
+    Attributes
+    ----------
+    ack : int
+        The ACK received for this request, or None if it has not been sent.
+    data : int
+        The data word read (for read requests) or written (for write requests).
+    error : Transport.TransportException
+        The error that occurred for this request, if any.
+    done : bool
+        True once the request has been sent and its response processed.
+    """
+    __slots__ = 'transport', 'apndp', 'rnw', 'a23', 'data', 'ack', 'error', 'done'
+
+    def __init__(self, transport, apndp, rnw, a23, data=None):
+        self.transport = transport
+        self.apndp = apndp
+        self.rnw = rnw
+        self.a23 = a23
+        self.data = data
+        self.ack = None
+        self.error = None
+        self.done = False
+
+    def result(self):
+        """
+        Return the data for this request, flushing the transport first if
+        necessary. Raises the error reported for this request, if any.
+        """
+        if not self.done:
+            self.transport.flush()
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+    def __repr__(self):
+        state = 'pending' if not self.done else ('error' if self.error else 'done')
+        return "<{:s} apndp={:d} rnw={:d} a23=0x{:x} {:s}>".format(self.__class__.__name__,
+                                                                 self.apndp, self.rnw,
+                                                                 self.a23, state)
+
+
 class Transport(object):
     """
     Models the communication protocol that is used for sending and receiving
     data over a data link. Handles encapsulation of data, error checking, and
     automatic resending of data among other things.
 
+    Requests can either be sent immediately (``sendRequest`` followed by
+    ``sendPacket``/``readPacket``) or queued with ``queueRequest``. Queued
+    requests are sent when the queue is flushed, together as a single data
+    link transfer if the transport can run them without checking each
+    response first (e.g. SWD with overrun detection), and otherwise one at a
+    time.
+
     Parameters
     ----------
     datalink : mmdev.datalink.DataLink
@@ -24,13 +141,21 @@ class Transport(object):
     class BusyResponse(TransportException):
         pass
 
+    class CancelledRequest(TransportException):
+        pass
+
+    # Set by transports that rely on the DP's overrun detection mode
+    overrunDetect = False
+
     def __init__(self, datalink):
         self.datalink = datalink
+        self._queue = []
 
     def connect(self):
         self.datalink.connect()
 
     def disconnect(self):
+        self._queue = []
         self.datalink.disconnect()
 
     def sendPacket(self, *args, **kwargs):
@@ -41,3 +166,30 @@ class Transport(object):
 
     def sendRequest(self, *args, **kwargs):
         raise NotImplementedError
+
+    def queueRequest(self, apndp, rnw, a23, data=None):
+        """
+        Append a request to the transfer queue and return a TransferResult
+        handle for it. For write requests, `data` is the word to write.
+        """
+        rslt = TransferResult(self, apndp, rnw, a23, data)
+        self._queue.append(rslt)
+        return rslt
+
+    def flush(self):
+        """
+        Send all queued requests. Errors are not raised here but are recorded
+        on the TransferResult of the request that caused them.
+
+        Returns
+        -------
+        list
+            The TransferResults that were flushed.
+        """
+        queue, self._queue = self._queue, []
+        if queue:
+            self._transfer(queue)
+        return queue
+
+    def _transfer(self, queue):
+        raise NotImplementedError
@@ -12,7 +12,7 @@ def camelify(word, sep='_'):
     return ''.join([k.capitalize() for k in word.split(sep)])
 
 def uncamelify(word, sep='_'):
-    return re.sub(r'(?!^)([A-Z][a-z0-9]+)', '%s\1' % sep, word).lower()
+    return re.sub(r'(?!^)([A-Z][a-z0-9]+)', r'%s\1' % sep, word).lower()
 
 #TODO: change to a 64 bit version of the lookup
 def get_mask_offset(mask):
@@ -52,6 +52,17 @@ def from_devfile(devfile, file_format=None, raiseErr=True, **kwargs):
     Supported Formats:
         + 'json' : JSON
         + 'svd'  : CMSIS-SVD
+
+    The device remembers where it was parsed from, so that it can be reloaded
+    after the file has been edited (see ``Device.reload``). With
+    ``reload=True``, it also keeps a cache of its peripherals, so that the
+    first reload keeps the peripherals that have not changed; otherwise the
+    cache is only built by the first reload. A `cache` dict may be passed
+    instead (see ``SVDParser.parse_device``).
+
+    A `bitband` keyword overrides whether the device uses bit-band aliases
+    (see ``Device.bitband``), which is otherwise decided from its cpu; e.g.
+    for Cortex-M3/M4 devices whose file has no cpu node, like STM32F20x.
     """
     from mmdev import parsers
     if file_format is None:
@@ -61,7 +72,28 @@ def from_devfile(devfile, file_format=None, raiseErr=True, **kwargs):
     except KeyError:
         raise KeyError("File extension '%s' not recognized" % file_format)
 
-    return parsercls(devfile, raiseErr=raiseErr, **kwargs)
+    bitband = kwargs.pop('bitband', None)
+    cache = kwargs.pop('cache', None)
+    if kwargs.pop('reload', False) and cache is None:
+        cache = {}
+    dev = parsercls(devfile, raiseErr=raiseErr, cache=cache, **kwargs)
+    if dev is not None:
+        if bitband is not None:
+            dev.bitband = bitband
+        kwargs.pop('supcls', None)
+        dev._source = devfile, dict(kwargs, file_format=file_format, raiseErr=raiseErr,
+                                    bitband=bitband)
+        dev._cache = cache
+    return dev
+
+
+def _asint(x):
+    # Let bitwise operators fall back to the other operand's reflected method
+    # for non-numeric types (e.g. placeholders in a recorded sequence)
+    try:
+        return int(x)
+    except TypeError:
+        return NotImplemented
 
 
 class _IntValue(int):
@@ -87,15 +119,25 @@ class _IntValue(int):
         return self.__class__(int.__invert__(self), self.width)
 
     def __lshift__(self, other):
-        return self.__class__( int.__lshift__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__lshift__(self, other), self.width)
     def __rshift__(self, other):
-        return self.__class__( int.__rshift__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__rshift__(self, other), self.width)
     def __and__(self, other):
-        return self.__class__( int.__and__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__and__(self, other), self.width)
     def __xor__(self, other):
-        return self.__class__( int.__xor__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__xor__(self, other), self.width)
     def __or__(self, other):
-        return self.__class__( int.__or__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__or__(self, other), self.width)
     def __add__(self, other):
         return self.__class__( int.__add__(self, int(other)), self.width)
     def __sub__(self, other):
@@ -110,27 +152,37 @@ class _IntValue(int):
         return self.__class__( int.__floordiv__(self, int(other)), self.width)
 
     def __rlshift__(self, other):
-        return self.__class__( int.__lshift__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__rlshift__(self, other), self.width)
     def __rrshift__(self, other):
-        return self.__class__( int.__rshift__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__rrshift__(self, other), self.width)
     def __rand__(self, other):
-        return self.__class__( int.__and__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__and__(self, other), self.width)
     def __rxor__(self, other):
-        return self.__class__( int.__xor__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__xor__(self, other), self.width)
     def __ror__(self, other):
-        return self.__class__( int.__or__(self, int(other)), self.width)
+        other = _asint(other)
+        if other is NotImplemented: return other
+        return self.__class__( int.__or__(self, other), self.width)
     def __radd__(self, other):
         return self.__class__( int.__add__(self, int(other)), self.width)
     def __rsub__(self, other):
-        return self.__class__( int.__sub__(self, int(other)), self.width)
+        return self.__class__( int.__rsub__(self, int(other)), self.width)
     def __rmod__(self, other):
-        return self.__class__( int.__mod__(self, int(other)), self.width)
+        return self.__class__( int.__rmod__(self, int(other)), self.width)
     def __rmul__(self, other):
         return self.__class__( int.__mul__(self, int(other)), self.width)
     def __rdiv__(self, other):
-        return self.__class__( int.__div__(self, int(other)), self.width)
+        return self.__class__( int.__rdiv__(self, int(other)), self.width)
     def __rfloordiv__(self, other):
-        return self.__class__( int.__floordiv__(self, int(other)), self.width)
+        return self.__class__( int.__rfloordiv__(self, int(other)), self.width)
 
     def __repr__(self):
         return self.fmt.format(self)
@@ -0,0 +1,227 @@
+'''
+Watch registers and bit fields for changes.
+
+A Watcher polls everything that is being watched with as few reads as
+possible: all of the watched fields of a register share one read of the
+register, and registers at consecutive addresses share one auto-incrementing
+read (see ``mmdev.sampler.readplan``), so each poll is a single batch of
+transfers.
+
+Callbacks are called on the watcher's thread as ``callback(blk, old, new)``
+with the old and new values of the watched register or field, decoded using
+the field's mask and offset. A watch can be limited to changes to a given
+value, e.g. a flag going high.
+
+Watching a register with read side effects, such as a status register that is
+cleared by reading it, would consume the very events being watched for, so
+it has to be asked for (see ``Watcher.watch``).
+
+The interval between polls adapts to activity: it drops to `minInterval` as
+soon as something changes, and backs off towards `maxInterval` while nothing
+does.
+
+Example
+-------
+>>> watcher = Watcher(target)
+>>> watcher.watch(target.USART1.SR.RXNE, on_rx, when=1)
+>>> watcher.watch(target.RCC.CR, lambda blk, old, new: logger.info("%s -> %s", old, new))
+>>> watcher.start()
+'''
+from mmdev.sampler import register, readplan, readraw
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Watch(object):
+    """
+    A watch on a register or bit field, as returned by ``Watcher.watch``.
+    """
+    def __init__(self, watcher, blk, callback, when):
+        self.watcher = watcher
+        self.blk = blk
+        self.callback = callback
+        self.when = when
+        self.register = register(blk)
+        if self.register is blk:
+            self.offset, self.mask = 0, (1 << blk.size) - 1
+        else:
+            self.offset, self.mask = blk.offset, (1 << blk.size) - 1
+
+    def decode(self, regvalue):
+        return (regvalue >> self.offset) & self.mask
+
+    def cancel(self):
+        self.watcher.unwatch(self)
+
+    def __repr__(self):
+        return "<{:s} on '{:s}'>".format(self.__class__.__name__, self.blk.mnemonic)
+
+
+class Watcher(object):
+    """
+    Polls watched registers and fields of a target and calls back on changes.
+
+    Parameters
+    ----------
+    target : mmdev.target.Target
+        The target to watch.
+    minInterval : float
+        The shortest time between polls, in seconds, used while the watched
+        values are changing.
+    maxInterval : float
+        The longest time between polls, in seconds, reached while nothing
+        changes.
+    backoff : float
+        The factor the interval grows by after each poll without a change.
+
+    Attributes
+    ----------
+    polls : int
+        The number of polls made.
+    interval : float
+        The current time between polls.
+    """
+    def __init__(self, target, minInterval=0.001, maxInterval=0.1, backoff=2.0):
+        self.target = target
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.backoff = backoff
+        self.interval = minInterval
+        self.polls = 0
+
+        self._watches = []
+        self._plan = None
+        self._values = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def watch(self, blk, callback, when=None, sideEffects=False):
+        """
+        Call ``callback(blk, old, new)`` whenever the value of the register or
+        bit field `blk` changes, or if `when` is given, only when it changes
+        to `when`. Returns a Watch, which can be cancelled.
+
+        Raises a ValueError if reading the register has side effects (see
+        ``Register.readSideEffects``), unless `sideEffects` is True.
+        """
+        w = Watch(self, blk, callback, when)
+        if not sideEffects and getattr(w.register, 'readSideEffects', False):
+            raise ValueError("Reading %r has side effects; pass sideEffects=True "
+                             "to watch it anyway" % (w.register,))
+        with self._lock:
+            self._watches.append(w)
+            self._plan = None
+        return w
+
+    def unwatch(self, w):
+        with self._lock:
+            if w in self._watches:
+                self._watches.remove(w)
+                self._plan = None
+
+    @property
+    def watches(self):
+        return tuple(self._watches)
+
+    @property
+    def plan(self):
+        """
+        The reads that make up a poll, as (address, count, size) tuples.
+        """
+        return self._getplan()[0]
+
+    def _getplan(self):
+        with self._lock:
+            if self._plan is None:
+                # side effects were checked as each watch was added
+                plan, slots = readplan((w.register for w in self._watches), sideEffects=True)
+                groups = dict((address, []) for address in slots)
+                for w in self._watches:
+                    groups[int(w.register.address)].append(w)
+                self._plan = plan, [(address, slot, groups[address])
+                                    for address, slot in slots.iteritems()]
+            return self._plan
+
+    def poll(self):
+        """
+        Read the watched registers once and call back on any changes. Returns
+        True if anything changed. The first poll of a register only records
+        its value.
+        """
+        if not self._watches:
+            return False
+        plan, registers = self._getplan()
+
+        raw = readraw(self.target, plan)
+        self.polls += 1
+
+        changed = False
+        values = self._values
+        for address, slot, watches in registers:
+            new = raw[slot]
+            old = values.get(address)
+            values[address] = new
+            if old is None or old == new:
+                continue
+            changed = True
+            for w in watches:
+                oldval, newval = w.decode(old), w.decode(new)
+                if oldval == newval or (w.when is not None and newval != w.when):
+                    continue
+                try:
+                    w.callback(w.blk, oldval, newval)
+                except Exception:
+                    logger.exception("Exception in watch callback for %r", w)
+
+        # forget registers that are no longer watched
+        if len(values) > len(registers):
+            for address in set(values) - set(r[0] for r in registers):
+                del values[address]
+        return changed
+
+    def start(self):
+        """
+        Start polling on a background thread.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name='Watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while self._running:
+            try:
+                changed = self.poll()
+            except Exception:
+                logger.exception("Watch poll failed")
+                changed = False
+
+            if changed:
+                self.interval = self.minInterval
+            else:
+                self.interval = min(self.interval * self.backoff, self.maxInterval)
+            self._wake.wait(self.interval)
+
+    def __repr__(self):
+        return "<{:s} of {:d} watches>".format(self.__class__.__name__, len(self._watches))
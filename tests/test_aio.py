@@ -0,0 +1,157 @@
+import threading
+import unittest
+
+import mmdev
+from mmdev import aio
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD, Transport
+
+RAM = 0x20000000
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class AsyncTargetTest(unittest.TestCase):
+
+    def setUp(self):
+        memory = SimMemory()
+        memory.load(mmdev.from_devfile(DEVFILE), regions=True)
+        memory.addRegion(RAM, 0x1000)
+        self.target = Target(DAPLink(SWD(SimDataLink(SimTarget(memory)))), DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+
+    def hold(self):
+        # keep the worker busy until the returned event is set, so that what
+        # is submitted meanwhile is sent together
+        held, release = threading.Event(), threading.Event()
+        def wait():
+            held.set()
+            release.wait(5)
+        self.target.acall(wait)
+        held.wait(5)
+        return release
+
+    def test_read_write(self):
+        self.assertIsNone(self.target.awrite(RAM, [1, 2, 3, 4]).result(5))
+        self.assertEqual(self.target.aread(RAM + 4).result(5), 2)
+        self.assertEqual(self.target.aread(RAM, 4).result(5), [1, 2, 3, 4])
+        self.assertEqual(self.target.aread(RAM + 2, 2, 8).result(5), [0, 0])
+        self.assertEqual(self.target.read(RAM + 8), 3)
+
+    def test_batching(self):
+        worker = self.target.worker
+        release = self.hold()
+        batches = worker.batches
+
+        writes = [self.target.awrite(RAM + 4*i, 3*i) for i in range(32)]
+        reads = [self.target.aread(RAM + 4*i) for i in range(32)]
+        release.set()
+
+        for f in writes:
+            self.assertIsNone(f.result(5))
+        self.assertEqual([f.result(5) for f in reads], [3*i for i in range(32)])
+        self.assertEqual(worker.batches, batches + 1)
+
+    def test_calls_keep_order(self):
+        cr = self.target.TIMER0.CR
+        release = self.hold()
+        first = self.target.aread(cr.address)
+        cr.aset(5)
+        second = cr.aget()
+        third = self.target.aread(cr.address)
+        release.set()
+
+        self.assertEqual(first.result(5), cr.resetValue)
+        self.assertEqual(second.result(5), 5)
+        self.assertEqual(third.result(5), 5)
+
+    def test_fault(self):
+        release = self.hold()
+        write = self.target.awrite(RAM, 1)
+        read = self.target.aread(0x30000000)
+        release.set()
+
+        self.assertRaises(Transport.FaultResponse, read.result, 5)
+        self.assertIsInstance(write.exception(5), Transport.FaultResponse)
+        # the worker recovers
+        self.assertEqual(self.target.awrite(RAM, 7).result(5), None)
+        self.assertEqual(self.target.aread(RAM).result(5), 7)
+
+    def test_call_exception(self):
+        def fail():
+            raise ValueError('failed')
+        future = self.target.acall(fail)
+        self.assertRaises(ValueError, future.result, 5)
+        self.assertEqual(self.target.acall(lambda: 1).result(5), 1)
+
+    def test_timeout(self):
+        release = self.hold()
+        self.addCleanup(release.set)
+        future = self.target.aread(RAM)
+        self.assertRaises(aio.LinkWorker.Timeout, future.result, 0.01)
+        self.assertRaises(aio.LinkWorker.Timeout, future.exception, 0.01)
+        self.assertFalse(future.done())
+
+        release.set()
+        self.assertEqual(future.result(5), 0)
+
+    def test_closed(self):
+        worker = self.target.worker
+        self.target.aclose()
+        self.assertRaises(aio.LinkWorker.Closed, worker.read, RAM)
+        # a new worker is started on demand
+        self.assertEqual(self.target.aread(RAM).result(5), 0)
+
+
+class FutureTest(unittest.TestCase):
+
+    def test_chain(self):
+        future = aio.Future()
+        chained = aio.chain(future, lambda x: x*2)
+        self.assertFalse(chained.done())
+        future.set_result(2)
+        self.assertEqual(chained.result(0), 4)
+
+        future = aio.Future()
+        chained = aio.chain(future, lambda x: x*2)
+        future.set_exception(KeyError('x'))
+        self.assertRaises(KeyError, chained.result, 0)
+
+    def test_callback_after_done(self):
+        future = aio.Future()
+        future.set_result(1)
+        done = []
+        future.add_done_callback(done.append)
+        self.assertEqual(done, [future])
+
+    @unittest.skipIf(aio.asyncio is not None, "trollius is installed")
+    def test_wrap_without_trollius(self):
+        future = aio.Future()
+        self.assertIs(aio.wrap_future(future), future)
+
+
+@unittest.skipUnless(aio.asyncio is not None, "trollius is not installed")
+class TrolliusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = aio.asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def wrap(self, fn):
+        future = aio.Future()
+        threading.Thread(target=lambda: fn(future)).start()
+        return aio.wrap_future(future, loop=self.loop)
+
+    def test_result(self):
+        wrapped = self.wrap(lambda f: f.set_result(3))
+        self.assertEqual(self.loop.run_until_complete(wrapped), 3)
+
+    def test_exception(self):
+        wrapped = self.wrap(lambda f: f.set_exception(ValueError('failed')))
+        self.assertRaises(ValueError, self.loop.run_until_complete, wrapped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import mmdev
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/STM32F20x.svd'
+
+
+class BitbandTest(unittest.TestCase):
+    """
+    STM32F20x is a Cortex-M3, but its file has no cpu node, so bit-banding
+    has to be asked for.
+    """
+    def target(self, **kwparse):
+        self.memory = SimMemory(bitband=True)
+        link = DAPLink(SWD(SimDataLink(SimTarget(self.memory))))
+        tgt = Target(link, DEVFILE, raiseErr=False, **kwparse)
+        tgt.connect()
+        self.addCleanup(tgt.disconnect)
+
+        # record the addresses written
+        self.writes = writes = []
+        write = tgt.scheduler.write
+        def record(address, data, accessSize=32):
+            writes.append(address)
+            return write(address, data, accessSize)
+        tgt.scheduler.write = record
+        return tgt
+
+    def test_disabled_without_cpu(self):
+        dev = mmdev.from_devfile(DEVFILE, raiseErr=False)
+        self.assertIsNone(dev.cpu)
+        self.assertFalse(dev.bitband)
+        self.assertIsNone(dev.bitbandAddress(0x40023830, 0))
+
+    def test_override(self):
+        dev = mmdev.from_devfile(DEVFILE, raiseErr=False, bitband=True)
+        self.assertTrue(dev.bitband)
+        self.assertEqual(dev.bitbandAddress(0x40023830, 3), 0x42000000 + 0x23830*32 + 3*4)
+
+    def test_field_write_goes_to_alias(self):
+        tgt = self.target(bitband=True)
+        reg = tgt.RCC.AHB1ENR
+        alias = tgt.bitbandAddress(reg.address, reg.GPIOAEN.offset)
+        self.assertEqual(alias, 0x42000000 + (int(reg.address) - 0x40000000)*32)
+
+        reg.GPIOAEN = 1
+        self.assertEqual(self.writes, [alias])
+        self.assertEqual(reg.GPIOAEN.value, 1)
+        self.assertEqual(self.memory.read(reg.address) & 1, 1)
+
+    def test_field_write_without_bitband(self):
+        tgt = self.target()
+        reg = tgt.RCC.AHB1ENR
+        reg.GPIOAEN = 1
+        self.assertEqual(self.writes, [reg.address])
+        self.assertEqual(self.memory.read(reg.address) & 1, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
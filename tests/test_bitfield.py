@@ -0,0 +1,159 @@
+import unittest
+
+from mmdev.components import BitField, EnumeratedValue, EnumTable
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class SimTargetCase(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimMemory()
+        tgt = Target(DAPLink(SWD(SimDataLink(SimTarget(self.memory)))), DEVFILE)
+        tgt.connect()
+        self.addCleanup(tgt.disconnect)
+        self.timer = tgt.TIMER0
+
+        # record the accesses made
+        self.reads, self.writes = reads, writes = [], []
+        read, write = tgt.scheduler.read, tgt.scheduler.write
+        def recordread(address, count=1, accessSize=32):
+            reads.append(address)
+            return read(address, count, accessSize)
+        def recordwrite(address, data, accessSize=32):
+            writes.append((address, list(data)))
+            return write(address, data, accessSize)
+        tgt.scheduler.read, tgt.scheduler.write = recordread, recordwrite
+
+
+class FieldWriteTest(SimTargetCase):
+
+    def clearable(self, *names):
+        # make the named status flags write-one-to-clear
+        sr = self.timer.SR
+        for name in names:
+            getattr(sr, name).modifiedWriteValues = 'oneToClear'
+        sr._masks = None
+        return sr
+
+    def test_one_to_clear(self):
+        sr = self.clearable('OV', 'UN', 'MATCH')
+        self.memory.write(sr.address, 1 << 10 | 1 << 9, 2)
+
+        sr.OV = 1
+        self.assertEqual(self.reads, [])
+        self.assertEqual(self.writes, [(sr.address, [1 << 10])])
+
+    def test_one_to_clear_keeps_others(self):
+        # UN is an ordinary read-write field, which has to be read back
+        sr = self.clearable('OV', 'MATCH')
+        self.memory.write(sr.address, 1 << 10 | 1 << 9 | 1 << 8, 2)
+
+        sr.OV = 1
+        self.assertEqual(self.reads, [sr.address])
+        # MATCH is written with 0, so that it isn't cleared as well
+        self.assertEqual(self.writes, [(sr.address, [1 << 10 | 1 << 9])])
+
+    def test_range_constraint(self):
+        cr = self.timer.CR
+        cr.MODE.writeConstraint = (0, 2)
+        self.assertRaises(ValueError, setattr, cr, 'MODE', 3)
+        self.assertEqual(self.writes, [])
+
+        cr.MODE = 2
+        self.assertEqual(self.memory.read(cr.address), 2 << 4)
+
+    def test_enumerated_constraint(self):
+        cr = self.timer.CR
+        cr.MODE.writeConstraint = 'useEnumeratedValues'
+        self.assertRaises(ValueError, setattr, cr, 'MODE', 7)
+        self.assertEqual(self.writes, [])
+
+        cr.MODE = 'Reload_MATCH'
+        self.assertEqual(self.memory.read(cr.address), 4 << 4)
+
+
+class SnapshotTest(SimTargetCase):
+
+    def test_snapshot(self):
+        t = self.timer
+        self.memory.write(t.CR.address, 0x11)
+        t.SR.readAction = 'clear'
+        t.COUNT.readAction = 'clear'
+
+        values = t.snapshot()
+        self.assertEqual(values['CR'], 0x11)
+        for name in ('SR', 'COUNT', 'PRESCALE_WR'):
+            self.assertNotIn(name, values)
+        self.assertNotIn(t.SR.address, self.reads)
+        self.assertNotIn(t.COUNT.address, self.reads)
+        self.assertIn(t.INT.address, self.reads)
+
+    def test_snapshot_field_side_effects(self):
+        self.timer.SR.OV.readAction = 'clear'
+        self.assertNotIn('SR', self.timer.snapshot())
+        self.assertNotIn(self.timer.SR.address, self.reads)
+
+
+class EnumTableTest(unittest.TestCase):
+    """
+    A BitField given an EnumTable behaves as one given the EnumeratedValues
+    built from its rows.
+    """
+    rows = ((0, 'OFF', 'Off', None), (1, 'ON', 'On', {'usage': 'read-write'}),
+            (2, 'FAST', 'Fast', None), (1, 'ENABLED', 'Also on', None),
+            (3, 'OFF', 'Off again', None))
+
+    def fields(self, **kwargs):
+        lazy = BitField('MODE', 4, 2, values=EnumTable(self.rows), **kwargs)
+        eager = BitField('MODE', 4, 2, values=[EnumeratedValue(name, value, description=desc,
+                                                               kwattrs=kwattrs or {})
+                                               for value, name, desc, kwattrs in self.rows],
+                         **kwargs)
+        return lazy, eager
+
+    def test_nodes(self):
+        lazy, eager = self.fields()
+        self.assertNotIn('_nodes', vars(lazy))
+        self.assertEqual(lazy.enumValues['FAST'], 2)
+        self.assertNotIn('_nodes', vars(lazy))
+
+        def nodes(field):
+            return [(ev.mnemonic, ev.value, type(ev.value), ev.description, ev.attrs,
+                     ev.parent is field) for ev in field._nodes]
+        self.assertEqual(nodes(lazy), nodes(eager))
+        self.assertIn('_nodes', vars(lazy))
+
+    def test_lookup(self):
+        # where a value or name is repeated, the first one defined is used
+        names, values = {}, {}
+        for value, name, desc, kwattrs in self.rows:
+            names.setdefault(value, name)
+            values.setdefault(name, value)
+
+        for field in self.fields():
+            self.assertEqual(field.enumNames, names)
+            self.assertEqual(field.enumValues, values)
+            for name, value in values.items():
+                self.assertEqual(field.encode(name), value)
+            self.assertEqual(field.encode(3), 3)
+            self.assertRaises(ValueError, field.encode, 'SLOW')
+
+    def test_constraint(self):
+        for field in self.fields(writeConstraint='useEnumeratedValues'):
+            for value in range(4):
+                field._checkConstraint(value)
+            self.assertRaises(ValueError, field._checkConstraint, 4)
+
+        # without enumerated values there is nothing to check against
+        field = BitField('MODE', 4, 2, values=EnumTable(), writeConstraint='useEnumeratedValues')
+        field._checkConstraint(7)
+        self.assertEqual(field._nodes, ())
+
+
+if __name__ == '__main__':
+    unittest.main()
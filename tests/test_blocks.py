@@ -0,0 +1,140 @@
+import cPickle as pickle
+import pickle as pypickle
+import textwrap
+import unittest
+
+import mmdev
+from mmdev import blocks
+from mmdev.components import BitField, EnumeratedValue, Register
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class DocTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = mmdev.from_devfile(DEVFILE)
+
+    def test_instance_doc(self):
+        for blk in (self.dev.TIMER0, self.dev.TIMER0.CR, self.dev.TIMER0.SR.OV):
+            self.assertEqual(blk.__doc__, textwrap.fill(blk.description, width=70))
+        self.assertNotIn('__doc__', vars(self.dev.TIMER0.CR))
+
+    def test_class_doc(self):
+        self.assertTrue(Register.__doc__.strip().startswith('Models a generic hardware register.'))
+        self.assertEqual(type(self.dev.TIMER0.CR).__doc__, Register.__doc__)
+
+
+class WalkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = mmdev.from_devfile(DEVFILE)
+
+    def test_levels(self):
+        dev, timer = self.dev, self.dev.TIMER0
+        self.assertEqual(list(dev.walk(l=0, d=1)), [dev])
+        self.assertEqual(list(dev.walk(d=1)), list(dev._nodes))
+        self.assertEqual(list(timer.walk(d=1)), list(timer._nodes))
+        # breadth first, a level at a time
+        self.assertEqual(list(dev.walk(d=3)),
+                         list(dev.walk(d=1)) + list(dev.walk(l=2, d=1)) + list(dev.walk(l=3, d=1)))
+        self.assertEqual(list(dev.walk(l=0, d=0)), [])
+
+    def test_arrays(self):
+        # array elements are walked one level below the array
+        timer = self.dev.TIMER0
+        regs = list(timer.walk(l=2, d=1))
+        self.assertEqual([blk for blk in regs if blk.parent is timer], list(timer.RELOAD))
+        self.assertIn(timer.RELOAD, list(timer.walk(d=1)))
+        for elem in timer.RELOAD:
+            for field in elem._nodes:
+                self.assertIn(field, list(timer.walk()))
+
+    def test_build(self):
+        dev = self.dev
+        fields = [blk for blk in dev.walk(build=False) if isinstance(blk, BitField)]
+        self.assertTrue(fields)
+        self.assertFalse([blk for blk in dev.walk(build=False) if isinstance(blk, EnumeratedValue)])
+        # walking without building leaves them unbuilt
+        for field in fields:
+            self.assertNotIn('_nodes', vars(field))
+
+        # those that have been built are walked
+        mode = dev.TIMER0.CR.MODE
+        values = list(mode._nodes)
+        self.assertTrue(values)
+        self.assertEqual([blk for blk in dev.walk(build=False) if isinstance(blk, EnumeratedValue)],
+                         values)
+
+        everything = list(dev.walk())
+        self.assertGreater(len(everything), len(fields) + len(values))
+        self.assertEqual(list(dev.walk(build=False)), everything)
+
+
+def signature(dev):
+    return [(blk._typename, blk.mnemonic, sorted((k, str(v)) for k, v in blk.attrs.items()))
+            for blk in dev.walk()]
+
+
+class PickleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dev = mmdev.from_devfile(DEVFILE)
+
+    def check_links(self, top):
+        # every block is its parent's subblock, or an element of one of its
+        # arrays, and shares its root
+        for blk in top.walk():
+            siblings = list(blk.parent._nodes)
+            for arr in blk.parent._nodes:
+                if isinstance(arr, blocks.BlockArray):
+                    siblings.extend(arr)
+            self.assertIn(blk, siblings)
+            self.assertIs(blk.root, top.root)
+
+    def test_device(self):
+        for dumps in (pickle.dumps, pypickle.dumps):
+            for protocol in (0, pickle.HIGHEST_PROTOCOL):
+                dev = pickle.loads(dumps(self.dev, protocol))
+                self.assertEqual(signature(dev), signature(self.dev))
+                self.assertIsNone(dev.parent)
+                self.check_links(dev)
+
+    def test_binding(self):
+        dev = pickle.loads(pickle.dumps(self.dev, pickle.HIGHEST_PROTOCOL))
+        for new, old in zip(dev.walk(), self.dev.walk()):
+            self.assertIsNot(new, old)
+            if getattr(old, '_dynamicBinding', False):
+                # each dynamically bound block has a class of its own
+                self.assertIsNot(type(new), type(old))
+                self.assertIs(type(new).__base__, type(old).__base__)
+            else:
+                self.assertIs(type(new), type(old))
+
+        self.assertIs(dev.TIMER0.CR.EN, dev.TIMER0.CR._nodes[-1])
+        self.assertEqual(dev.TIMER1.address, self.dev.TIMER1.address)
+        # the access methods of registers are bound again
+        self.assertNotIn('_IOBlock__write', vars(dev.TIMER0.PRESCALE_RD))
+        self.assertIs(dev.TIMER0.CR._IOBlock__read.__self__, dev.TIMER0.CR)
+
+    def test_subtree(self):
+        # a block is pickled detached from its parent
+        timer = pickle.loads(pickle.dumps(self.dev.TIMER0, pickle.HIGHEST_PROTOCOL))
+        self.assertIsNone(timer.parent)
+        self.assertIs(timer.root, timer)
+        self.assertEqual(signature(timer), signature(self.dev.TIMER0))
+        self.assertIs(timer.RELOAD[0].parent, timer)
+        self.assertIs(self.dev.TIMER0.parent, self.dev)
+
+    def test_lazy_nodes(self):
+        # enumerated values that haven't been built stay unbuilt
+        field = self.dev.TIMER0.CR.MODE
+        self.assertNotIn('_nodes', vars(field))
+        dev = pickle.loads(pickle.dumps(self.dev, pickle.HIGHEST_PROTOCOL))
+        self.assertNotIn('_nodes', vars(dev.TIMER0.CR.MODE))
+        self.assertEqual(signature(dev.TIMER0.CR.MODE), signature(field))
+        self.assertIs(dev.TIMER0.CR.MODE._nodes[0].root, dev)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD, Transport
+
+DEVFILE = 'data/ARM_Sample.svd'
+RAM = 0x20000000
+
+
+class Bus32Test(unittest.TestCase):
+    """
+    Target's arbitrary memory accesses, which Bus32 splits into aligned
+    transfers queued on the link.
+    """
+    def setUp(self):
+        self.memory = SimMemory()
+        self.memory.addRegion(RAM, 0x1000)
+        self.datalink = SimDataLink(SimTarget(self.memory))
+        link = DAPLink(SWD(self.datalink))
+        self.target = Target(link, DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+
+        # record the transfers queued on the link, and those sent
+        self.queued, self.transfers = queued, transfers = [], []
+        read, write = link.queueMemRead, link.queueMemWrite
+        def recordread(addr, count, accessSize=32):
+            queued.append(('read', addr, count, accessSize))
+            return read(addr, count, accessSize)
+        def recordwrite(addr, data, accessSize=32):
+            queued.append(('write', addr, len(data), accessSize))
+            return write(addr, data, accessSize)
+        link.queueMemRead, link.queueMemWrite = recordread, recordwrite
+        transfer = self.datalink.transfer
+        self.datalink.transfer = lambda *args: transfers.append(1) or transfer(*args)
+
+        for i in range(8):
+            self.memory.write(RAM + 4*i, 0x03020100 + 0x04040404*i)
+
+    def test_read(self):
+        self.assertEqual(self.target.read(RAM + 4), 0x07060504)
+        self.assertEqual(self.target.read(RAM, 2), [0x03020100, 0x07060504])
+        self.assertEqual(self.target.readhalf(RAM + 6), 0x0706)
+        self.assertEqual(self.target.readhalf(RAM + 2, 3), [0x0302, 0x0504, 0x0706])
+        self.assertEqual(self.target.readbyte(RAM + 5), 5)
+        self.assertEqual(self.target.readbyte(RAM + 3, 3), [3, 4, 5])
+        self.assertEqual(self.target.readstring(RAM + 3, 6), '030405060708')
+
+    def test_unaligned_read(self):
+        # a word read from an unaligned address
+        self.assertEqual(self.target.read(RAM + 1), 0x04030201)
+        self.assertEqual(self.target.read(RAM + 2, 2), [0x05040302, 0x09080706])
+        self.assertEqual(self.target.readhalf(RAM + 3), 0x0403)
+
+    def test_write(self):
+        self.target.write(RAM, [0x11111111, 0x22222222])
+        self.target.writehalf(RAM + 2, 0xaaaa)
+        self.target.writebyte(RAM + 5, [0xbb, 0xcc])
+        self.assertEqual(self.memory.read(RAM), 0xaaaa1111)
+        self.assertEqual(self.memory.read(RAM + 4), 0x22ccbb22)
+
+    def test_unaligned_write(self):
+        self.target.write(RAM + 1, 0xaabbccdd)
+        self.assertEqual(self.memory.read(RAM), 0xbbccdd00)
+        self.assertEqual(self.memory.read(RAM + 4), 0x070605aa)
+
+        self.target.writestring(RAM + 7, 'deadbeef12')
+        self.assertEqual(self.target.readstring(RAM + 6, 7), '06deadbeef120c')
+
+    def test_widths(self):
+        self.target.readhalf(RAM + 2, 3)
+        self.target.writebyte(RAM + 1, 5)
+        self.target.write(RAM + 4, [1, 2])
+        self.assertEqual(self.queued, [('read', RAM + 2, 1, 16), ('read', RAM + 4, 1, 32),
+                                       ('write', RAM + 1, 1, 8), ('write', RAM + 4, 2, 32)])
+
+    def test_one_batch(self):
+        # an unaligned head and tail, and the words between them, are read
+        # in one transfer
+        self.assertEqual(self.target.readstring(RAM + 1, 13), '0102030405060708090a0b0c0d')
+        self.assertGreater(len(self.queued), 1)
+        self.assertEqual(len(self.transfers), 1)
+
+        del self.transfers[:]
+        self.target.writestring(RAM + 3, '00' * 9)
+        self.assertEqual(len(self.transfers), 1)
+        self.assertEqual(self.memory.read(RAM), 0x00020100)
+        self.assertEqual(self.memory.read(RAM + 8), 0)
+        self.assertEqual(self.memory.read(RAM + 12), 0x0f0e0d0c)
+
+    def test_tar_wrap(self):
+        self.target.write(RAM + 0x3f8, range(1, 9))
+        # no transfer crosses the TAR auto-increment boundary
+        for op, addr, count, size in self.queued:
+            self.assertEqual(addr // 0x400, (addr + count*4 - 1) // 0x400)
+        self.assertEqual(sum(q[2] for q in self.queued), 8)
+        self.assertEqual([self.memory.read(RAM + 0x3f8 + 4*i) for i in range(8)], range(1, 9))
+        self.assertEqual(self.target.read(RAM + 0x3f8, 8), range(1, 9))
+
+    def test_fault(self):
+        self.assertRaises(Transport.FaultResponse, self.target.read, 0x30000000)
+        self.assertRaises(Transport.FaultResponse, self.target.write, 0x30000000, 5)
+        self.assertEqual(self.target.read(RAM, 2), [0x03020100, 0x07060504])
+
+
+if __name__ == '__main__':
+    unittest.main()
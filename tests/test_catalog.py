@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mmdev.catalog import Catalog, read_header
+
+# a peripheral may be derived from one that comes after it
+DERIVED = '''<?xml version="1.0" encoding="utf-8"?>
+<device>
+  <name>DERIVED</name>
+  <peripherals>
+    <peripheral derivedFrom="UART1">
+      <name>UART2</name>
+      <baseAddress>0x40002000</baseAddress>
+    </peripheral>
+    <peripheral derivedFrom="UART0">
+      <name>UART1</name>
+      <baseAddress>0x40001000</baseAddress>
+    </peripheral>
+    <peripheral>
+      <name>UART0</name>
+      <groupName>UART</groupName>
+      <baseAddress>0x40000000</baseAddress>
+    </peripheral>
+    <peripheral derivedFrom="UART0">
+      <name>SPI0</name>
+      <groupName>SPI</groupName>
+      <baseAddress>0x40003000</baseAddress>
+    </peripheral>
+  </peripherals>
+</device>
+'''
+
+
+class ReadHeaderTest(unittest.TestCase):
+
+    def test_header(self):
+        header = read_header('data/ARM_Sample.svd')
+        self.assertEqual(header['name'], 'ARMCM3xxx')
+        self.assertIsNone(header['cpu'])
+        self.assertEqual(header['peripherals'],
+                         [('TIMER0', 'TIMER', 0x40010000),
+                          ('TIMER1', 'TIMER', 0x40010100),
+                          ('TIMER2', 'TIMER', 0x40010200)])
+
+    def test_derived_group(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'derived.svd')
+        with open(path, 'w') as fh:
+            fh.write(DERIVED)
+
+        self.assertEqual(read_header(path)['peripherals'],
+                         [('UART2', 'UART', 0x40002000),
+                          ('UART1', 'UART', 0x40001000),
+                          ('UART0', 'UART', 0x40000000),
+                          ('SPI0', 'SPI', 0x40003000)])
+
+
+class CatalogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        os.mkdir(os.path.join(self.tmpdir, 'st'))
+        self.arm = os.path.join(self.tmpdir, 'ARM_Sample.svd')
+        self.stm = os.path.join(self.tmpdir, 'st', 'STM32F20x.svd')
+        shutil.copy('data/ARM_Sample.svd', self.arm)
+        shutil.copy('data/STM32F20x.svd', self.stm)
+
+        self.catalog = Catalog()
+        self.addCleanup(self.catalog.close)
+        self.assertEqual(self.catalog.scan(self.tmpdir), (2, 0))
+
+    def test_lookup(self):
+        self.assertEqual(len(self.catalog), 2)
+        self.assertIn('STM32F20x', self.catalog)
+        self.assertEqual(self.catalog.devices(), ['ARMCM3xxx', 'STM32F20x'])
+        self.assertEqual(self.catalog.path('STM32F20x'), self.stm)
+        self.assertRaises(KeyError, self.catalog.path, 'LPC178x_7x')
+
+        self.assertEqual(self.catalog.find('USART*', address=0x40011000),
+                         [('STM32F20x', 'USART1', 0x40011000)])
+        self.assertEqual(self.catalog.find('TIMER*', device='ARMCM3xxx'),
+                         [('ARMCM3xxx', 'TIMER0', 0x40010000),
+                          ('ARMCM3xxx', 'TIMER1', 0x40010100),
+                          ('ARMCM3xxx', 'TIMER2', 0x40010200)])
+
+        header = self.catalog.header('ARMCM3xxx')
+        self.assertEqual(header['path'], self.arm)
+        self.assertEqual(header['peripherals'][1], ('TIMER1', 'TIMER', 0x40010100))
+
+    def test_rescan(self):
+        # nothing has changed
+        self.assertEqual(self.catalog.scan(self.tmpdir), (0, 0))
+
+        with open(self.arm) as fh:
+            svd = fh.read()
+        with open(self.arm, 'w') as fh:
+            fh.write(svd.replace('<baseAddress>0x40010200</baseAddress>',
+                                 '<baseAddress>0x40010300</baseAddress>'))
+        # the edit keeps the file's size, so make sure its mtime changes
+        st = os.stat(self.arm)
+        os.utime(self.arm, (st.st_atime, st.st_mtime + 10))
+        os.remove(self.stm)
+
+        self.assertEqual(self.catalog.scan(self.tmpdir), (1, 1))
+        self.assertEqual(self.catalog.devices(), ['ARMCM3xxx'])
+        self.assertEqual(self.catalog.find('TIMER2'), [('ARMCM3xxx', 'TIMER2', 0x40010300)])
+        self.assertEqual(self.catalog.find(address=0x40011000), [])
+
+    def test_from_devfile(self):
+        dev = self.catalog.from_devfile('ARMCM3xxx')
+        self.assertEqual(dev.TIMER1.address, 0x40010100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.transport import SWD
+
+RAM = 0x20000000
+
+
+class CapabilityTest(unittest.TestCase):
+    """
+    Two parts with the same SW-DP IDCODE, but MEM-APs that support different
+    access sizes.
+    """
+    def setUp(self):
+        self.memory = SimMemory()
+        self.wide = SimTarget(self.memory, sizes=(8, 16, 32), idr=0x24770011)
+        self.narrow = SimTarget(self.memory, sizes=(32,), idr=0x04770021)
+        self.assertEqual(self.wide.idcode, self.narrow.idcode)
+
+    def test_reconnect_uses_cache(self):
+        link = DAPLink(SWD(SimDataLink(self.wide)))
+        link.connect()
+        self.addCleanup(link.disconnect)
+        caps = link.capabilities
+        self.assertEqual(caps.sizes, (8, 16, 32))
+        self.assertEqual(caps.idr, 0x24770011)
+
+        link.connect()
+        self.assertIs(link.capabilities, caps)
+
+    def test_same_idcode_other_ap(self):
+        # the target behind a probe is swapped for another part
+        datalink = SimDataLink(self.wide)
+        link = DAPLink(SWD(datalink))
+        link.connect()
+        self.addCleanup(link.disconnect)
+        self.assertEqual(link.MEMAP.laneWidth, 8)
+
+        datalink.target = self.narrow
+        link.connect()
+        self.assertEqual(link.capabilities.sizes, (32,))
+        self.assertEqual(link.capabilities.idr, 0x04770021)
+        self.assertEqual(link.MEMAP.laneWidth, 32)
+
+        link.memWriteBlock(RAM, range(8))
+        self.assertEqual(link.memReadBlock(RAM, 8), range(8))
+
+    def test_not_shared_between_links(self):
+        first = DAPLink(SWD(SimDataLink(self.wide)))
+        first.connect()
+        self.addCleanup(first.disconnect)
+
+        second = DAPLink(SWD(SimDataLink(self.narrow)))
+        second.connect()
+        self.addCleanup(second.disconnect)
+        self.assertEqual(first.capabilities.sizes, (8, 16, 32))
+        self.assertEqual(second.capabilities.sizes, (32,))
+        self.assertEqual(second.MEMAP.laneWidth, 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
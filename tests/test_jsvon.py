@@ -0,0 +1,119 @@
+import json
+import os
+from StringIO import StringIO
+import shutil
+import tempfile
+import unittest
+
+import mmdev
+from mmdev.parsers.deviceparser import ParseException
+from mmdev.parsers.jsvon_parse import JSVONParser, dump_binary, _readint, _JSONReader
+
+
+def signature(dev):
+    # JSON objects are unordered, so compare the blocks in sorted order
+    return sorted((blk._typename, blk.mnemonic, sorted((k, str(v)) for k, v in blk.attrs.items()))
+                  for blk in dev.walk())
+
+
+class RoundTripTest(unittest.TestCase):
+    """
+    SVD -> JSON -> binary JSVON.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.svd = mmdev.from_devfile('data/ARM_Sample.svd')
+
+        self.jsonfile = os.path.join(self.tmpdir, 'ARM_Sample.json')
+        with open(self.jsonfile, 'w') as fh:
+            fh.write(self.svd.to_json(recursive=True, indent=1))
+        self.json = JSVONParser.from_devfile(self.jsonfile)
+
+    def test_json(self):
+        self.assertEqual(signature(self.json), signature(self.svd))
+
+    def test_binary_from_device(self):
+        binfile = os.path.join(self.tmpdir, 'ARM_Sample.jsvonb')
+        with open(binfile, 'wb') as fh:
+            dump_binary(self.json, fh)
+
+        dev = mmdev.from_devfile(binfile)
+        self.assertEqual(signature(dev), signature(self.svd))
+        self.assertEqual(dev.to_json(recursive=True), self.json.to_json(recursive=True))
+
+    def test_binary_from_document(self):
+        binfile = os.path.join(self.tmpdir, 'ARM_Sample.jsvonb')
+        with open(self.jsonfile) as fh, open(binfile, 'wb') as out:
+            dump_binary(json.load(fh), out)
+
+        self.assertEqual(signature(JSVONParser.from_binfile(binfile)), signature(self.svd))
+
+    def test_not_binary(self):
+        self.assertRaises(ParseException, JSVONParser.from_binfile, self.jsonfile)
+
+
+class JSONReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.text = mmdev.from_devfile('data/ARM_Sample.svd').to_json(recursive=True, indent=1)
+        self.doc = json.loads(self.text)
+
+    def read(self, reader, pos=0):
+        # decode the document, reading every object member by member
+        obj = {}
+        for key, pos in reader.members(pos):
+            if reader._char(reader._skip(pos)) == '{':
+                obj[key] = self.read(reader, pos)
+            else:
+                obj[key] = reader.value(pos)
+        return obj
+
+    def test_chunks(self):
+        for chunksize in (1, 2, 7, 64, 1 << 16):
+            self.assertEqual(self.read(_JSONReader(StringIO(self.text), chunksize)), self.doc)
+
+    def test_numbers_across_chunks(self):
+        text = '{"a": 123456789, "b" : [1, 22, 333], "c":true, "d": "\\u00e9x"}'
+        for chunksize in range(1, len(text) + 1):
+            self.assertEqual(self.read(_JSONReader(StringIO(text), chunksize)), json.loads(text))
+
+    def test_held_text(self):
+        # a device with many copies of its peripherals
+        (kind, node), = self.doc.items()
+        node['peripherals'] = dict(('%s_%d' % (name, i), pph)
+                                   for name, pph in node['peripherals'].items() for i in range(10))
+        text = json.dumps(self.doc)
+        reader = _JSONReader(StringIO(text), 1024)
+        held = 0
+        for kind, pos in reader.members(0):
+            for key, pos in reader.members(pos):
+                if key != 'peripherals':
+                    reader.value(pos)
+                    continue
+                for name, pos in reader.members(pos):
+                    reader.value(pos)
+                    held = max(held, len(reader.text))
+        self.assertLess(held, len(text) / 10)
+
+    def test_errors(self):
+        for text in ('', '[]', '{"a" 1}', '{"a": 1', '{"a": tru}'):
+            reader = _JSONReader(StringIO(text), 2)
+            self.assertRaises(ValueError, self.read, reader)
+
+
+class ReadIntTest(unittest.TestCase):
+
+    def test_formats(self):
+        for text, value in (('10', 10), (10, 10), ('0x10', 16), ('ff', 255), ('0b101', 5), ('0b', 0xb)):
+            self.assertEqual(_readint({'value': text}, 'value'), value)
+
+    def test_enumerated_value(self):
+        bf = mmdev.from_devfile('data/ARM_Sample.svd').TIMER0.CR.CAPEDGE
+        doc = json.loads(bf.to_json(recursive=True))
+        self.assertEqual(doc['bitField']['enumeratedValues']['BOTH']['value'], '0b10')
+        self.assertEqual(JSVONParser.parse_enumerated_value('BOTH', {'value': '0b10'})[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
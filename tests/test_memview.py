@@ -0,0 +1,152 @@
+import random
+import unittest
+
+from mmdev import memview
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/ARM_Sample.svd'
+RAM = 0x20000000
+
+
+def membytes(memory, addr, nbytes):
+    # read bytes straight from the simulated memory
+    return ''.join(chr((memory.read(a) >> ((a & 3) << 3)) & 0xff) for a in xrange(addr, addr + nbytes))
+
+
+_random = random.Random(0)
+
+def randbytes(nbytes):
+    return ''.join(chr(_random.randrange(256)) for i in xrange(nbytes))
+
+
+class MemoryViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimMemory()
+        self.memory.addRegion(RAM, 0x4000)
+        self.target = Target(DAPLink(SWD(SimDataLink(SimTarget(self.memory)))), DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+        self.mem = self.target.mem
+
+        # record the accesses made by typed views
+        self.accesses = accesses = []
+        read, write = self.target.scheduler.read, self.target.scheduler.write
+        def recordread(address, count=1, accessSize=32):
+            accesses.append(('read', address, count, accessSize))
+            return read(address, count, accessSize)
+        def recordwrite(address, data, accessSize=32):
+            accesses.append(('write', address, len(data), accessSize))
+            return write(address, data, accessSize)
+        self.target.scheduler.read, self.target.scheduler.write = recordread, recordwrite
+
+    def test_bytes(self):
+        data = randbytes(0x40)
+        self.mem[RAM:RAM + 0x40] = data
+        self.assertEqual(membytes(self.memory, RAM, 0x40), data)
+
+        # every combination of unaligned head and tail
+        for start in xrange(RAM, RAM + 8):
+            for stop in xrange(start, start + 12):
+                self.assertEqual(self.mem[start:stop], data[start - RAM:stop - RAM])
+
+    def test_unaligned_write(self):
+        for start in xrange(RAM + 1, RAM + 8):
+            for length in (1, 2, 3, 5, 9):
+                data = randbytes(length)
+                before = membytes(self.memory, RAM, 0x20)
+                self.mem[start:start + length] = data
+
+                offset = start - RAM
+                expected = before[:offset] + data + before[offset + length:]
+                self.assertEqual(membytes(self.memory, RAM, 0x20), expected)
+
+    def test_open_slice(self):
+        self.mem[RAM + 3:] = 'abc'
+        self.assertEqual(self.mem[RAM + 3:RAM + 6], 'abc')
+        self.assertRaises(ValueError, self.mem.__getitem__, slice(RAM, None))
+        self.assertRaises(ValueError, self.mem.__getitem__, slice(None, RAM))
+        self.assertRaises(ValueError, self.mem.__getitem__, slice(RAM, RAM + 8, 2))
+
+    def test_fill(self):
+        self.mem[RAM + 1:RAM + 7] = 0xaa
+        self.assertEqual(membytes(self.memory, RAM, 8), '\0' + '\xaa'*6 + '\0')
+        self.mem.u16[RAM:RAM + 8] = 0x1234
+        self.assertEqual(list(self.mem.u16[RAM:RAM + 8]), [0x1234]*4)
+
+    def test_resize(self):
+        self.assertRaises(ValueError, self.mem.__setitem__, slice(RAM, RAM + 4), 'abc')
+        self.assertRaises(ValueError, self.mem.u32.__setitem__, slice(RAM, RAM + 4), [1, 2])
+
+    def test_typed(self):
+        self.mem.u32[RAM:RAM + 16] = [0x11223344, 0x55667788, 1, 2]
+        self.assertEqual(list(self.mem.u32[RAM:RAM + 16]), [0x11223344, 0x55667788, 1, 2])
+        self.assertEqual(self.mem.u32[RAM + 4], 0x55667788)
+        self.assertEqual(list(self.mem.u16[RAM + 2:RAM + 6]), [0x1122, 0x7788])
+        self.assertEqual(list(self.mem.u8[RAM + 1:RAM + 3]), [0x33, 0x22])
+        self.assertEqual(self.mem.u8[RAM + 5], 0x77)
+
+        self.mem.u16[RAM + 2] = 0xabcd
+        self.mem.u8[RAM + 4:RAM + 6] = [0xee, 0xff]
+        self.assertEqual(list(self.mem.u32[RAM:RAM + 8]), [0xabcd3344, 0x5566ffee])
+
+    def test_access_width(self):
+        self.mem.u16[RAM:RAM + 8]
+        self.mem.u8[RAM + 3] = 1
+        self.mem.u16[RAM + 2:RAM + 6] = [1, 2]
+        self.assertEqual(self.accesses, [('read', RAM, 4, 16), ('write', RAM + 3, 1, 8),
+                                         ('write', RAM + 2, 2, 16)])
+
+    def test_alignment(self):
+        self.assertRaises(ValueError, self.mem.u32.__getitem__, RAM + 2)
+        self.assertRaises(ValueError, self.mem.u16.__getitem__, slice(RAM + 1, RAM + 5))
+        self.assertRaises(ValueError, self.mem.u32.__getitem__, slice(RAM, RAM + 6))
+        self.assertRaises(ValueError, self.mem.u16.__setitem__, RAM + 3, 1)
+
+    def test_chunks(self):
+        mem = memview.MemoryView(self.target, 16, chunkSize=0x10)
+        mem[RAM + 6:RAM + 0x2a] = range(0x12)
+        # the first chunk ends on a chunk boundary
+        self.assertEqual([a[1:3] for a in self.accesses],
+                         [(RAM + 6, 5), (RAM + 0x10, 8), (RAM + 0x20, 5)])
+        self.assertEqual(list(mem[RAM + 6:RAM + 0x2a]), range(0x12))
+
+    def test_tar_wrap(self):
+        # block transfers are split at 1 KB boundaries, as the MEM-AP only
+        # auto-increments the low bits of TAR
+        for start in (RAM + 0x3f0, RAM + 0x3f1):
+            data = randbytes(0x20)
+            self.mem[start:start + 0x20] = data
+            self.assertEqual(membytes(self.memory, start, 0x20), data)
+            self.assertEqual(self.mem[start:start + 0x20], data)
+
+        # a wrapped TAR would have written the tail to RAM + 0x400
+        self.mem.u32[RAM + 0x7f8:RAM + 0x808] = [1, 2, 3, 4]
+        self.assertEqual([self.memory.read(a) for a in range(RAM + 0x7f8, RAM + 0x808, 4)], [1, 2, 3, 4])
+        self.assertEqual(membytes(self.memory, RAM + 0x3f1, 0x20), data)
+
+        # typed views other than u32 go to the link without Bus32's chunking,
+        # so this one is split by the link
+        self.mem.u16[RAM + 0x1bfc:RAM + 0x1c04] = [1, 2, 3, 4]
+        self.assertEqual(list(self.mem.u16[RAM + 0x1bfc:RAM + 0x1c04]), [1, 2, 3, 4])
+        self.assertEqual(self.memory.read(RAM + 0x1800), 0)
+
+    def test_large(self):
+        data = randbytes(0x2900)
+        self.mem[RAM + 3:RAM + 3 + len(data)] = data
+        self.assertEqual(membytes(self.memory, RAM + 3, len(data)), data)
+        self.assertEqual(self.mem[RAM + 3:RAM + 3 + len(data)], data)
+
+    @unittest.skipUnless(memview.numpy is not None, "NumPy is not installed")
+    def test_numpy(self):
+        self.mem.u16[RAM:RAM + 4] = memview.numpy.array([1, 2], dtype='u2')
+        values = self.mem.u16[RAM:RAM + 4]
+        self.assertEqual(values.dtype, memview.numpy.dtype('u2'))
+        self.assertEqual(list(values), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import operator
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class RegisterWriteTest(unittest.TestCase):
+
+    def target(self, devfile=DEVFILE, **kwparse):
+        self.memory = SimMemory(bitband=True)
+        self.datalink = SimDataLink(SimTarget(self.memory))
+        tgt = Target(DAPLink(SWD(self.datalink)), devfile, raiseErr=False, **kwparse)
+        tgt.connect()
+        self.addCleanup(tgt.disconnect)
+
+        # record the accesses made
+        self.reads, self.writes = reads, writes = [], []
+        read, write = tgt.scheduler.read, tgt.scheduler.write
+        def recordread(address, count=1, accessSize=32):
+            reads.append(address)
+            return read(address, count, accessSize)
+        def recordwrite(address, data, accessSize=32):
+            writes.append((address, list(data)))
+            return write(address, data, accessSize)
+        tgt.scheduler.read, tgt.scheduler.write = recordread, recordwrite
+        return tgt
+
+    def test_write_masks_computed_once(self):
+        for kwparse in ({}, dict(bitband=True)):
+            reg = self.target('data/STM32F20x.svd', **kwparse).RCC.AHB1ENR
+            calls = []
+            calc = reg._calcwritemasks
+            reg._calcwritemasks = lambda: calls.append(1) or calc()
+
+            reg.GPIOAEN = 1
+            reg.GPIOBEN = 1
+            reg.GPIOAEN = 0
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(reg._writemasks(), (0, 0, reduce(operator.or_, (f.mask for f in reg.nodes))))
+
+    def test_compose(self):
+        cr = self.target().TIMER0.CR
+        cr.resetValue = 0x30
+        self.memory.write(cr.address, 0xff00)
+
+        self.assertEqual(cr.compose(EN=1, CNT='Toggle'), 0x30 | 1 | 2 << 2)
+        self.assertEqual(cr.compose(1), 0x30 | 1 << 31)
+        self.assertEqual(cr.compose(EN=1, base='read'), 0xff01)
+        self.assertEqual(self.writes, [])
+        self.assertEqual(self.reads, [cr.address])
+        self.assertRaises(ValueError, cr.compose, EN=1, base='other')
+
+    def test_pack_reset(self):
+        cr = self.target().TIMER0.CR
+        cr.resetValue = 0x30
+        self.memory.write(cr.address, 0xff00)
+
+        cr.pack(EN=1, MODE=0, base='reset')
+        self.assertEqual(self.reads, [])
+        self.assertEqual(self.writes, [(cr.address, [0x01])])
+        self.assertEqual(self.memory.read(cr.address), 0x01)
+
+    def test_pack_shadow(self):
+        cr = self.target().TIMER0.CR
+        self.memory.write(cr.address, 0xff00)
+
+        # the shadow isn't known yet, so the register is read once...
+        cr.pack(EN=1, base='shadow')
+        self.assertEqual(self.reads, [cr.address])
+        self.assertEqual(self.memory.read(cr.address), 0xff01)
+
+        # ...and after that, only written
+        del self.reads[:], self.writes[:]
+        cr.pack(EN=0, RST=1, base='shadow')
+        self.assertEqual(self.reads, [])
+        self.assertEqual(self.writes, [(cr.address, [0xff02])])
+        self.assertEqual(self.memory.read(cr.address), 0xff02)
+
+    def test_pack_read(self):
+        cr = self.target().TIMER0.CR
+        self.memory.write(cr.address, 0xff00)
+        cr.pack(EN=1)
+        self.assertEqual(self.reads, [cr.address])
+        self.assertEqual(self.writes, [(cr.address, [0xff01])])
+
+    def test_write_burst(self):
+        tgt = self.target()
+        timers = tgt.TIMER0, tgt.TIMER1, tgt.TIMER2
+        writes = [(t.CR.address, t.CR.compose(EN=1, MODE=i)) for i, t in enumerate(timers)]
+        writes.append((tgt.TIMER0.SR.address, 0x1234, 16))
+
+        transfers = []
+        transfer = self.datalink.transfer
+        self.datalink.transfer = lambda *args: transfers.append(1) or transfer(*args)
+        tgt.writeBurst(writes)
+
+        self.assertEqual(len(transfers), 1)
+        self.assertEqual(self.reads, [])
+        for i, t in enumerate(timers):
+            self.assertEqual(self.memory.read(t.CR.address), 1 | i << 4)
+        self.assertEqual(self.memory.read(tgt.TIMER0.SR.address) & 0xffff, 0x1234)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mmdev
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.devfile = os.path.join(self.tmpdir, 'ARM_Sample.svd')
+        shutil.copy(DEVFILE, self.devfile)
+
+    def edit(self):
+        with open(self.devfile) as fh:
+            svd = fh.read()
+        with open(self.devfile, 'w') as fh:
+            fh.write(svd.replace('<baseAddress>0x40010200</baseAddress>',
+                                 '<baseAddress>0x40010300</baseAddress>'))
+
+    def test_reload_after_edit(self):
+        dev = mmdev.from_devfile(self.devfile, reload=True)
+        timer0, timer1, timer2 = dev.TIMER0, dev.TIMER1, dev.TIMER2
+        cr = timer0.CR
+
+        self.edit()
+        added, removed = dev.reload()
+
+        self.assertIs(dev.TIMER0, timer0)
+        self.assertIs(dev.TIMER0.CR, cr)
+        self.assertIs(dev.TIMER1, timer1)
+        self.assertEqual(removed, (timer2,))
+        self.assertEqual(added, (dev.TIMER2,))
+        self.assertEqual(dev.TIMER2.address, 0x40010300)
+        self.assertIs(dev.TIMER2.parent, dev)
+
+    def test_reload_unchanged(self):
+        dev = mmdev.from_devfile(self.devfile, reload=True)
+        nodes = list(dev._nodes)
+
+        self.assertEqual(dev.reload(), ((), ()))
+        self.assertEqual(map(id, dev._nodes), map(id, nodes))
+
+    def test_no_cache_by_default(self):
+        dev = mmdev.from_devfile(self.devfile)
+        self.assertIsNone(dev._cache)
+        timer0 = dev.TIMER0
+
+        # without a cache, the first reload replaces every peripheral...
+        added, removed = dev.reload()
+        self.assertIsNot(dev.TIMER0, timer0)
+        self.assertEqual(len(added), len(removed))
+
+        # ...and keeps one for the next
+        timer0 = dev.TIMER0
+        self.edit()
+        added, removed = dev.reload()
+        self.assertIs(dev.TIMER0, timer0)
+        self.assertEqual([blk.mnemonic for blk in added], ['TIMER2'])
+
+    def test_bitband_from_cpu(self):
+        dev = mmdev.from_devfile(self.devfile, reload=True)
+        self.assertFalse(dev.bitband)
+
+        with open(self.devfile) as fh:
+            svd = fh.read()
+        with open(self.devfile, 'w') as fh:
+            fh.write(svd.replace('<addressUnitBits>', '<cpu><name>CM3</name><revision>r2p0</revision>'
+                                 '<endian>little</endian><mpuPresent>0</mpuPresent>'
+                                 '<fpuPresent>0</fpuPresent></cpu><addressUnitBits>', 1))
+        dev.reload()
+        self.assertEqual(dev.cpu.mnemonic, 'CM3')
+        self.assertTrue(dev.bitband)
+        self.assertEqual(dev.bitbandAddress(0x40010000, 0), 0x42200000)
+
+    def test_bitband_override_kept(self):
+        dev = mmdev.from_devfile(self.devfile, bitband=True)
+        dev.reload()
+        self.assertIsNone(dev.cpu)
+        self.assertTrue(dev.bitband)
+
+        dev = mmdev.from_devfile(self.devfile)
+        dev.bitband = True
+        dev.reload()
+        self.assertFalse(dev.bitband)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mmdev import sampler
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.sampler import Sampler, readplan
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class SimTargetCase(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimMemory()
+        self.target = Target(DAPLink(SWD(SimDataLink(SimTarget(self.memory)))), DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+        self.timer = self.target.TIMER0
+
+
+class ReadPlanTest(SimTargetCase):
+
+    def test_merge(self):
+        t = self.timer
+        plan, slots = readplan([t.PRESCALE_RD, t.COUNT, t.SR, t.CR, t.MATCH])
+        base = int(t.CR.address)
+        self.assertEqual(plan, [(base, 1, 32), (base + 0x04, 1, 16), (base + 0x20, 3, 32)])
+        self.assertEqual(slots, {base: 0, base + 0x04: 1, base + 0x20: 2, base + 0x24: 3,
+                                 base + 0x28: 4})
+
+    def test_merge_array(self):
+        reloads = list(self.timer.RELOAD)
+        plan, slots = readplan(reversed(reloads))
+        self.assertEqual(plan, [(int(reloads[0].address), len(reloads), 32)])
+
+    def test_gap(self):
+        t = self.timer
+        plan, slots = readplan([t.COUNT, t.PRESCALE_RD])
+        self.assertEqual(len(plan), 2)
+
+    def test_side_effects(self):
+        sr = self.timer.SR
+        sr.readAction = 'clear'
+        self.assertRaises(ValueError, readplan, [self.timer.CR, sr])
+        plan, slots = readplan([sr], sideEffects=True)
+        self.assertEqual(plan, [(int(sr.address), 1, 16)])
+
+        sr.readAction = None
+        sr.OV.readAction = 'clear'
+        self.assertRaises(ValueError, readplan, [sr])
+
+
+class SamplerTest(SimTargetCase):
+
+    def wait(self, smp, count):
+        deadline = time.time() + 5
+        while smp.count < count and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertGreaterEqual(smp.count, count)
+
+    def test_decode(self):
+        t = self.timer
+        self.memory.write(t.COUNT.address, 1234)
+        self.memory.write(t.SR.address, 0x0601, 2)
+        smp = Sampler(self.target, [t.COUNT, t.SR.RUN, t.SR.OV, t.SR.UN, t.SR.MATCH], rate=100)
+        self.assertEqual(smp.decode(smp.sample()), (1234, 1, 1, 1, 0))
+
+    def test_samples(self):
+        t = self.timer
+        smp = Sampler(self.target, [t.COUNT], rate=1000)
+        with smp:
+            it = smp.samples(timeout=1)
+            first = next(it)
+            self.memory.write(t.COUNT.address, 7)
+            for sample in it:
+                if sample.values == (7,):
+                    break
+            self.assertEqual(sample.values, (7,))
+            self.assertGreater(sample.seq, first.seq)
+            self.assertGreaterEqual(sample.time, first.time)
+
+    def test_wrap(self):
+        smp = Sampler(self.target, [self.timer.COUNT, self.timer.CR], rate=1e6, capacity=4)
+        with smp:
+            self.wait(smp, 10)
+        count = smp.count
+
+        history = smp.history()
+        self.assertEqual([s.seq for s in history], range(count - 4, count))
+
+        # a consumer from the start has missed all but the last capacity
+        self.assertEqual([s.seq for s in smp.samples(start=0, timeout=0)], range(count - 4, count))
+        self.assertEqual(smp.dropped, count - 4)
+        self.assertRaises(Sampler.Overrun, list, smp.samples(start=0, timeout=0, strict=True))
+
+    def test_side_effects(self):
+        self.timer.SR.readAction = 'clear'
+        self.assertRaises(ValueError, Sampler, self.target, [self.timer.SR.RUN], rate=100)
+        smp = Sampler(self.target, [self.timer.SR.RUN], rate=100, sideEffects=True)
+        self.assertEqual(len(smp.plan), 1)
+
+    def test_mapped_file(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        filename = os.path.join(tmpdir, 'samples')
+
+        self.memory.write(self.timer.COUNT.address, 42)
+        smp = Sampler(self.target, [self.timer.COUNT], rate=1000, capacity=8, filename=filename)
+        with smp:
+            self.wait(smp, 1)
+        self.assertEqual(smp.history()[0].values, (42,))
+        smp.close()
+        self.assertEqual(os.path.getsize(filename), smp._record.size * 8)
+
+    @unittest.skipUnless(sampler.numpy is not None, "NumPy is not installed")
+    def test_array(self):
+        self.memory.write(self.timer.COUNT.address, 42)
+        smp = Sampler(self.target, [self.timer.COUNT], rate=1000, capacity=8)
+        with smp:
+            self.wait(smp, 1)
+        self.assertEqual(smp.array['raw'][0][0], 42)
+        self.assertEqual(smp.array['seq'][0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.scheduler import Scheduler
+from mmdev.transport import SWD
+
+RAM = 0x20000000
+
+
+class TransactionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mem = SimMemory()
+        self.mem.addRegion(RAM, 0x1000)
+        self.link = DAPLink(SWD(SimDataLink(SimTarget(self.mem))))
+        self.link.connect()
+        self.scheduler = Scheduler(self.link)
+
+    def tearDown(self):
+        self.link.disconnect()
+
+    def test_other_threads_wait_for_transaction(self):
+        sched = self.scheduler
+        sched.write(RAM, [0x1])
+
+        def other():
+            sched.write(RAM, [0x55])
+        thread = threading.Thread(target=other)
+
+        with sched.transaction():
+            v = sched.read(RAM)[0]
+            thread.start()
+            # wait for the other thread's write to be queued
+            deadline = time.time() + 5
+            while not sched._pending and time.time() < deadline:
+                time.sleep(0.001)
+            self.assertTrue(sched._pending)
+            sched.write(RAM, [v | 0x100])
+            # the read-modify-write was not interleaved with the other write
+            self.assertEqual(sched.read(RAM), [0x101])
+        thread.join()
+
+        self.assertEqual(sched.read(RAM), [0x55])
+
+    def test_merges_outside_transactions(self):
+        sched = self.scheduler
+        threads = [threading.Thread(target=sched.write, args=(RAM + 4*i, [i]))
+                   for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sched.read(RAM, 8), range(8))
+
+
+if __name__ == '__main__':
+    unittest.main()
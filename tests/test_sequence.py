@@ -0,0 +1,141 @@
+import unittest
+
+from mmdev import utils
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink, DeviceLink
+from mmdev.sequence import Sequence, Variable, evaluate, _Expr
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class SequenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimMemory()
+        self.datalink = SimDataLink(SimTarget(self.memory))
+        self.target = Target(DAPLink(SWD(self.datalink)), DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+        self.timer = self.target.TIMER0
+
+        self.transfers = []
+        transfer = self.datalink.transfer
+        self.datalink.transfer = lambda *args: self.transfers.append(1) or transfer(*args)
+
+    def record(self):
+        t = self.timer
+        with self.target.record(base='reset') as seq:
+            t.CR.EN = 1
+            t.CR.MODE = seq.var(0)
+            t.MATCH = seq.var(1) << 4 | 1
+            seq.read(t.COUNT)
+            seq.poll(t.SR.RUN, 1, timeout=0.05)
+            t.INT = seq.var(1)
+            seq.read(t.CR.MODE)
+        return seq
+
+    def test_record(self):
+        t = self.timer
+        self.memory.write(t.CR.address, 0xff00)
+        seq = self.record()
+
+        self.assertFalse(self.target.recording)
+        self.assertEqual(self.transfers, [])
+        self.assertEqual(self.memory.read(t.CR.address), 0xff00)
+
+        # field writes are recorded from the reset value, without reads
+        cr = int(t.CR.address)
+        self.assertEqual([op[:2] for op in seq.ops],
+                         [('write', cr), ('write', cr), ('write', int(t.MATCH.address)),
+                          ('read', int(t.COUNT.address)), ('poll', int(t.SR.address)),
+                          ('write', int(t.INT.address)), ('read', cr)])
+        self.assertEqual(seq.ops[0][2], 1)
+        self.assertEqual(evaluate(seq.ops[1][2], (3,)), 3 << 4 | 1)
+
+    def test_replay(self):
+        t = self.timer
+        seq = self.record()
+        self.memory.write(t.COUNT.address, 42)
+        self.memory.write(t.SR.address, 1, 2)
+
+        self.assertEqual(seq(2, 0x10), [42, 2])
+        # one transfer before the poll and one after it (the poll reads on
+        # its own)
+        self.assertEqual(len(self.transfers), 2)
+        self.assertEqual(self.memory.read(t.CR.address), 2 << 4 | 1)
+        self.assertEqual(self.memory.read(t.MATCH.address), 0x101)
+        self.assertEqual(self.memory.read(t.INT.address) & 0xffff, 0x10)
+
+        self.memory.write(t.COUNT.address, 7)
+        self.assertEqual(seq(4, 0x20), [7, 4])
+        self.assertEqual(self.memory.read(t.CR.address), 4 << 4 | 1)
+        self.assertEqual(self.memory.read(t.MATCH.address), 0x201)
+
+    def test_compiled_once(self):
+        link = self.target.link
+        compiled = []
+        compile = link.compileSequence
+        link.compileSequence = lambda ops: compiled.append(1) or compile(ops)
+
+        self.memory.write(self.timer.SR.address, 1, 2)
+        seq = self.record()
+        seq(0, 0)
+        seq(1, 1)
+        self.assertEqual(len(compiled), 1)
+
+        seq.read(self.timer.CR)
+        seq(1, 1)
+        self.assertEqual(len(compiled), 2)
+
+    def test_poll_timeout(self):
+        seq = self.record()
+        self.assertRaises(Sequence.PollTimeout, seq, 1, 1)
+        # the writes before the poll were made
+        self.assertEqual(self.memory.read(self.timer.CR.address), 1 << 4 | 1)
+        self.assertEqual(self.memory.read(self.timer.INT.address), 0)
+
+    def test_generic_link(self):
+        # the unbatched implementation gives the same results
+        t = self.timer
+        seq = self.record()
+        self.memory.write(t.COUNT.address, 42)
+        self.memory.write(t.SR.address, 1, 2)
+        link = self.target.link
+
+        with self.target.transaction():
+            results = DeviceLink.runSequence(link, DeviceLink.compileSequence(link, seq.ops), (3, 5))
+        self.assertEqual(results, [42, 3])
+        self.assertEqual(self.memory.read(t.CR.address), 3 << 4 | 1)
+        self.assertEqual(self.memory.read(t.MATCH.address), 0x51)
+
+    def test_read_back_variable(self):
+        with self.target.record() as seq:
+            self.timer.CR = seq.var(0)
+            self.assertRaises(Sequence.SequenceException, getattr, self.timer.CR, 'value')
+
+
+class PlaceholderTest(unittest.TestCase):
+    """
+    HexValues combined with Variables defer to the Variable, so that register
+    values can be computed from placeholders while recording.
+    """
+    def test_asint(self):
+        self.assertEqual(utils._asint(utils.HexValue(5, 8)), 5)
+        self.assertIs(utils._asint(Variable(0)), NotImplemented)
+
+    def test_operators(self):
+        v, x = Variable(0), utils.HexValue(0xf0, 8)
+        for expr, value in ((x | v, 0xf3), (v | x, 0xf3), (x & v, 0x30), (v & x, 0x30),
+                            (x ^ v, 0xc3), (v ^ x, 0xc3), (x << v, 0xf0 << 0x33),
+                            (x >> v, 0), ((v << 4) | x, 0x3f0)):
+            self.assertIsInstance(expr, _Expr)
+            self.assertEqual(evaluate(expr, (0x33,)), value)
+
+    def test_not_a_variable(self):
+        self.assertRaises(TypeError, lambda: utils.HexValue(1, 8) | None)
+
+
+if __name__ == '__main__':
+    unittest.main()
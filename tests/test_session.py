@@ -0,0 +1,92 @@
+import threading
+import unittest
+
+import mmdev
+from mmdev import utils
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.session import SessionManager
+from mmdev.target import Target
+from mmdev.transport import SWD
+
+RAM = 0x20000000
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+def ramjob(target, value):
+    # a job has to be picklable to run in a process pool
+    target.mem.u32[RAM:RAM + 16] = [value + i for i in range(4)]
+    cr = target.TIMER0.CR
+    return list(target.mem.u32[RAM:RAM + 16]), cr.value == cr.resetValue
+
+
+def treejob(target):
+    # the target owns its whole tree, and nothing of it is shared
+    assert all(blk.root is target for blk in target.walk(build=False))
+    target.TIMER0.CR = 0x1234
+    return id(target.TIMER0), target.TIMER0.CR.shadow
+
+
+class SimulatedSessionTest(unittest.TestCase):
+
+    def check(self, report, value):
+        self.assertEqual(report.failed, [])
+        # the registers are seeded with their reset values
+        self.assertEqual(report.values, [([value + i for i in range(4)], True)] * len(report))
+
+    def test_ram_job(self):
+        session = SessionManager.simulated(DEVFILE, 2, raiseErr=False)
+        self.check(session.run(ramjob, 7), 7)
+
+    def test_ram_job_with_regions(self):
+        session = SessionManager.simulated(DEVFILE, 2, regions=[(RAM, 0x1000), (0x40010000, 0x100)],
+                                           raiseErr=False)
+        self.check(session.run(ramjob, 3), 3)
+
+    def test_parsed_once(self):
+        parses = []
+        from_devfile = utils.from_devfile
+        def count(devfile, *args, **kwargs):
+            # links parse their own descriptors too
+            if devfile == DEVFILE:
+                parses.append(threading.current_thread())
+            return from_devfile(devfile, *args, **kwargs)
+        utils.from_devfile = count
+        self.addCleanup(setattr, utils, 'from_devfile', from_devfile)
+
+        manager = SessionManager.simulated(DEVFILE, 4, raiseErr=False)
+        self.check(manager.run(ramjob, 1), 1)
+        self.check(manager.run(ramjob, 2), 2)
+        self.assertEqual(parses, [threading.current_thread()])
+
+    def test_targets_are_independent(self):
+        report = SessionManager.simulated(DEVFILE, 3, raiseErr=False).run(treejob)
+        self.assertEqual(report.failed, [])
+        self.assertEqual(len(set(v[0] for v in report.values)), 3)
+        self.assertEqual([v[1] for v in report.values], [0x1234] * 3)
+
+    def test_process_mode(self):
+        session = SessionManager.simulated(DEVFILE, 2, mode='process', raiseErr=False)
+        self.check(session.run(ramjob, 5), 5)
+
+
+class TargetFromDeviceTest(unittest.TestCase):
+
+    def test_target_from_device(self):
+        dev = mmdev.from_devfile(DEVFILE, raiseErr=False)
+        timer0 = dev.TIMER0
+        link = DAPLink(SWD(SimDataLink(SimTarget(SimMemory()))))
+        target = Target(link, dev)
+        target.connect()
+        self.addCleanup(target.disconnect)
+
+        self.assertIsInstance(target, Target)
+        self.assertIs(target.TIMER0, timer0)
+        self.assertIs(timer0.parent, target)
+        self.assertIs(timer0.CR.root, target)
+        target.TIMER0.CR = 5
+        self.assertEqual(target.read(int(timer0.CR.address)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
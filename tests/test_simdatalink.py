@@ -0,0 +1,75 @@
+import unittest
+
+import mmdev
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.transport import SWD, Transport
+
+RAM = 0x20000000
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class SimulatedLinkTest(unittest.TestCase):
+    """
+    Drives the whole DAP stack - DAPLink over SWD over SimDataLink - against
+    the simulated target.
+    """
+    def connect(self, memory, **swdOptions):
+        self.sim = SimTarget(memory)
+        link = DAPLink(SWD(SimDataLink(self.sim), **swdOptions))
+        link.connect()
+        self.addCleanup(link.disconnect)
+        return link
+
+    def test_memory(self):
+        link = self.connect(SimMemory())
+        link.memWrite(RAM + 4, 0xdeadbeef)
+        self.assertEqual(link.memRead(RAM + 4), 0xdeadbeef)
+        self.assertEqual(link.memRead(RAM + 6, 16), 0xdead)
+        link.memWrite(RAM + 5, 0x11, 8)
+        self.assertEqual(link.memRead(RAM + 4), 0xdead11ef)
+
+        link.memWriteBlock(RAM, range(256))
+        self.assertEqual(link.memReadBlock(RAM, 256), range(256))
+
+    def test_wait_retries(self):
+        for options in ({}, {'overrunDetect': False}):
+            link = self.connect(SimMemory(), **options)
+            link.memWriteBlock(RAM, range(16))
+            self.sim.injectWait(3, after=5)
+            self.assertEqual(link.memReadBlock(RAM, 16), range(16))
+            self.assertEqual(self.sim.stats['wait'], 3)
+
+    def test_regions_fault(self):
+        memory = SimMemory()
+        memory.addRegion(RAM, 0x1000)
+        link = self.connect(memory)
+        self.assertRaises(Transport.FaultResponse, link.memRead, RAM + 0x1000)
+        # the link recovers from the fault
+        link.memWrite(RAM, 1)
+        self.assertEqual(link.memRead(RAM), 1)
+
+    def test_load_seeds_reset_values(self):
+        dev = mmdev.from_devfile(DEVFILE, raiseErr=False)
+        memory = SimMemory()
+        memory.load(dev)
+        link = self.connect(memory)
+        for reg in (dev.TIMER0.CR, dev.TIMER0.RELOAD, dev.TIMER1.SR):
+            self.assertEqual(link.memRead(reg.address), reg.resetValue)
+        # seeding leaves the rest of the address space valid
+        link.memWrite(RAM, 0x1234)
+        self.assertEqual(link.memRead(RAM), 0x1234)
+
+    def test_load_regions(self):
+        dev = mmdev.from_devfile(DEVFILE, raiseErr=False)
+        memory = SimMemory()
+        memory.load(dev, regions=True)
+        memory.addRegion(RAM, 0x1000)
+        link = self.connect(memory)
+        self.assertEqual(link.memRead(dev.TIMER0.CR.address), dev.TIMER0.CR.resetValue)
+        self.assertEqual(link.memRead(RAM), 0)
+        self.assertRaises(Transport.FaultResponse, link.memRead, 0x30000000)
+
+
+if __name__ == '__main__':
+    unittest.main()
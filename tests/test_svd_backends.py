@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mmdev.parsers import SVDParser
+from mmdev.parsers.svd_parse import BACKENDS, get_backend
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+def available(name):
+    try:
+        get_backend(name)
+    except ImportError:
+        return False
+    return True
+
+
+def signature(dev):
+    return [(blk._typename, blk.mnemonic, sorted((k, str(v)) for k, v in blk.attrs.items()))
+            for blk in dev.walk()]
+
+
+class BackendTest(unittest.TestCase):
+
+    def test_backends_agree(self):
+        expected = signature(SVDParser(DEVFILE, backend='ElementTree'))
+        for name in BACKENDS:
+            if available(name):
+                self.assertEqual(signature(SVDParser(DEVFILE, backend=name)), expected, name)
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, get_backend, 'expat')
+
+
+@unittest.skipUnless(available('lxml'), "lxml is not installed")
+class LxmlTest(unittest.TestCase):
+    """
+    lxml reports comments and processing instructions as children of the
+    elements they are in, with a tag that isn't a string.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        with open(DEVFILE) as fh:
+            svd = fh.read()
+        for tag in ('<peripherals>', '<peripheral>', '<registers>', '<register>', '<fields>',
+                    '<field>', '<enumeratedValues>'):
+            svd = svd.replace(tag, tag + '<!-- comment --><?pi data?>')
+        self.devfile = os.path.join(self.tmpdir, 'ARM_Sample.svd')
+        with open(self.devfile, 'w') as fh:
+            fh.write(svd)
+        self.expected = signature(SVDParser(DEVFILE, backend='ElementTree'))
+
+    def test_comments_skipped(self):
+        self.assertEqual(signature(SVDParser(self.devfile, backend='lxml')), self.expected)
+
+    def test_pool(self):
+        # peripherals are sent to the pool as serialized elements
+        dev = SVDParser(self.devfile, backend='lxml', processes=2)
+        self.assertEqual(signature(dev), self.expected)
+
+    def test_cache(self):
+        # fingerprints don't depend on the comment objects
+        cache = {}
+        first = SVDParser(self.devfile, backend='lxml', cache=cache)
+        second = SVDParser(self.devfile, backend='lxml', cache=cache)
+        self.assertEqual(signature(second), self.expected)
+        self.assertEqual(map(id, first.nodes), map(id, second.nodes))
+
+
+if __name__ == '__main__':
+    unittest.main()
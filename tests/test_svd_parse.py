@@ -0,0 +1,194 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mmdev
+from mmdev.parsers import svd_parse
+from mmdev.parsers.svd_parse import RequiredValueError, _readint, _parseint
+
+DERIVED_SVD = """\
+<?xml version="1.0" encoding="utf-8"?>
+<device schemaVersion="1.1">
+  <name>DERIVED</name>
+  <description>Derived blocks</description>
+  <addressUnitBits>8</addressUnitBits>
+  <width>32</width>
+  <size>32</size>
+  <access>read-write</access>
+  <resetValue>0</resetValue>
+  <resetMask>0xFFFFFFFF</resetMask>
+  <peripherals>
+    <peripheral derivedFrom="P0">
+      <name>P2</name>
+      <baseAddress>0x40000200</baseAddress>
+    </peripheral>
+    <peripheral>
+      <name>P0</name>
+      <description>P0</description>
+      <baseAddress>0x40000000</baseAddress>
+      <addressBlock><offset>0</offset><size>0x100</size><usage>registers</usage></addressBlock>
+      <registers>
+        <register>
+          <name>A</name>
+          <description>A</description>
+          <addressOffset>0</addressOffset>
+          <fields>
+            <field>
+              <name>EN</name>
+              <description>EN</description>
+              <bitOffset>0</bitOffset>
+              <bitWidth>2</bitWidth>
+              <enumeratedValues>
+                <enumeratedValue><name>OFF</name><description>OFF</description><value>0</value></enumeratedValue>
+                <enumeratedValue><name>ON</name><description>ON</description><value>1</value></enumeratedValue>
+              </enumeratedValues>
+            </field>
+            <field derivedFrom="EN">
+              <name>EN2</name>
+              <bitOffset>4</bitOffset>
+            </field>
+          </fields>
+        </register>
+        <register derivedFrom="A">
+          <name>B</name>
+          <description>B</description>
+          <addressOffset>4</addressOffset>
+        </register>
+        <register derivedFrom="A">
+          <name>C</name>
+          <description>C</description>
+          <addressOffset>8</addressOffset>
+          <access>read-only</access>
+        </register>
+      </registers>
+    </peripheral>
+    <peripheral derivedFrom="P0">
+      <name>P1</name>
+      <baseAddress>0x40000100</baseAddress>
+    </peripheral>
+  </peripherals>
+</device>
+"""
+
+
+def signature(blk):
+    # the attributes of a block's subblocks, relative to the block
+    return [(sub._typename, sub.mnemonic, sorted((k, str(v)) for k, v in sub.attrs.items()
+                                                 if k != 'address'))
+            for sub in blk.walk()]
+
+
+class DerivedTest(unittest.TestCase):
+    """
+    Blocks derived from another block at the same level, which may come
+    before or after it in the file.
+    """
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        devfile = os.path.join(tmpdir, 'derived.svd')
+        with open(devfile, 'w') as fh:
+            fh.write(DERIVED_SVD)
+        self.dev = mmdev.from_devfile(devfile)
+
+    def test_peripherals(self):
+        dev = self.dev
+        # P2 is derived from a peripheral defined after it
+        for name, address in (('P0', 0x40000000), ('P1', 0x40000100), ('P2', 0x40000200)):
+            periph = getattr(dev, name)
+            self.assertIs(periph.parent, dev)
+            self.assertEqual(periph.address, address)
+            self.assertEqual([reg.address - address for reg in (periph.A, periph.B, periph.C)],
+                             [0, 4, 8])
+            self.assertEqual(signature(periph), signature(dev.P0))
+
+    def test_registers(self):
+        p0 = self.dev.P0
+        self.assertEqual(signature(p0.B), signature(p0.A))
+        self.assertEqual(p0.C.access, 'read-only')
+        # fields inherit the access of the register they're cloned into
+        for reg in (p0.A, p0.B):
+            self.assertEqual([f.access for f in reg.walk(d=1)], ['read-write']*2)
+        self.assertEqual([f.access for f in p0.C.walk(d=1)], ['read-only']*2)
+
+    def test_fields(self):
+        a = self.dev.P0.A
+        self.assertEqual(a.EN2.offset, 4)
+        self.assertEqual(a.EN2.mask, 0x30)
+        self.assertEqual(a.EN2.description, a.EN.description)
+        self.assertEqual(a.EN2.enumNames, {0: 'OFF', 1: 'ON'})
+        self.assertEqual(signature(a.EN2), signature(a.EN))
+
+    def test_clones(self):
+        # derived blocks are copies, each with its own parent
+        dev = self.dev
+        for top in (dev.P0, dev.P1, dev.P2):
+            for blk in top.walk():
+                self.assertIn(blk, blk.parent._nodes)
+                self.assertIs(blk.root, dev)
+
+        blocks = [blk for top in (dev.P0, dev.P1, dev.P2) for blk in top.walk()]
+        self.assertEqual(len(set(map(id, blocks))), len(blocks))
+
+        dev.P1.A.EN.description = 'changed'
+        self.assertEqual(dev.P0.A.EN.description, 'EN')
+        self.assertEqual(dev.P2.A.EN.description, 'EN')
+
+
+class ReadIntTest(unittest.TestCase):
+
+    literals = ('0x20', '0X1f', ' 0xFFFFFFFF ', '#0101', '#1x0x', '32', '0', 'true', 'False')
+
+    def setUp(self):
+        memo = svd_parse._intmemo.copy()
+        svd_parse._intmemo.clear()
+        self.addCleanup(svd_parse._intmemo.update, memo)
+        self.addCleanup(svd_parse._intmemo.clear)
+
+    def test_literals(self):
+        for x, value in zip(self.literals, (0x20, 0x1f, 0xffffffff, 5, 8, 32, 0, True, False)):
+            self.assertEqual(_parseint(x), value, x)
+            self.assertIs(type(_parseint(x)), type(value))
+            for i in range(2):
+                # the same, whether parsed or taken from the memo
+                result = _readint({'size': x}, 'size')
+                self.assertEqual(result, value, x)
+                self.assertIs(type(result), type(value))
+        self.assertEqual(sorted(svd_parse._intmemo), sorted(self.literals))
+
+    def test_memo(self):
+        _readint({'size': '0x20'}, 'size')
+        svd_parse._intmemo['0x20'] = 33
+        self.assertEqual(_readint({'size': '0x20'}, 'size'), 33)
+
+    def test_memo_bounded(self):
+        for i in range(svd_parse._INTMEMO_SIZE + 10):
+            self.assertEqual(_readint({'value': str(i)}, 'value'), i)
+        self.assertEqual(len(svd_parse._intmemo), svd_parse._INTMEMO_SIZE)
+        # values past the bound are still parsed
+        self.assertEqual(_readint({'value': '0x1234567'}, 'value'), 0x1234567)
+        self.assertNotIn('0x1234567', svd_parse._intmemo)
+
+    def test_inherited(self):
+        # values inherited from a parsed block are used as they are
+        value = object()
+        self.assertIs(_readint({}, 'size', parent={'size': value}), value)
+        self.assertEqual(_readint({}, 'size', parent={'size': '0x10'}), 0x10)
+        self.assertEqual(_readint({'size': '8'}, 'size', parent={'size': 16}), 8)
+
+    def test_missing(self):
+        self.assertEqual(_readint({}, 'size', 32), 32)
+        self.assertIsNone(_readint({}, 'size'))
+        self.assertRaises(RequiredValueError, _readint, {}, 'size', required=True)
+
+    def test_pop(self):
+        node = {'size': '8'}
+        _readint(node, 'size', pop=False)
+        self.assertEqual(node, {'size': '8'})
+        _readint(node, 'size')
+        self.assertEqual(node, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.transport import SWD, Transport
+
+RAM = 0x20000000
+
+
+class QueuedTransferTest(unittest.TestCase):
+    """
+    Queued requests after a WAIT or FAULT must not reach the target as
+    anything but the requests they are.
+    """
+    def connect(self, overrunDetect):
+        memory = SimMemory()
+        memory.addRegion(RAM, 0x100)
+        self.sim = SimTarget(memory)
+        self.memory = memory
+        link = DAPLink(SWD(SimDataLink(self.sim), overrunDetect=overrunDetect))
+        link.connect()
+        self.addCleanup(link.disconnect)
+        return link
+
+    def requests(self, link, fn, *args):
+        self.sim.stats.clear()
+        result = fn(*args)
+        return result, self.sim.stats['requests']
+
+    def test_wait(self):
+        for overrunDetect in (False, True):
+            link = self.connect(overrunDetect)
+            data = range(1, 17)
+            _, expected = self.requests(link, link.memWriteBlock, RAM, data)
+
+            self.sim.injectWait(2, after=4)
+            _, sent = self.requests(link, link.memWriteBlock, RAM, data[::-1])
+            self.assertEqual(self.sim.stats['wait'], 2)
+            self.assertEqual(link.memReadBlock(RAM, 16), data[::-1])
+            if not overrunDetect:
+                # only the WAITed requests were sent again, and nothing else
+                # was taken for a request
+                self.assertEqual(sent, expected + 2)
+
+    def test_fault(self):
+        for overrunDetect in (False, True):
+            link = self.connect(overrunDetect)
+            link.memWriteBlock(RAM + 0xF0, range(4))
+            self.sim.stats.clear()
+            self.assertRaises(Transport.FaultResponse, link.memWriteBlock, RAM + 0xF0, range(8))
+            if overrunDetect:
+                # the rest of the batch is clocked, and faults on the sticky flag
+                self.assertGreaterEqual(self.sim.stats['fault'], 1)
+            else:
+                self.assertEqual(self.sim.stats['fault'], 1)
+            self.assertEqual([self.memory.read(RAM + 0xF0 + 4*i) for i in range(4)], range(4))
+            # the target is still in step
+            link.memWrite(RAM, 0x1234)
+            self.assertEqual(link.memRead(RAM), 0x1234)
+
+
+class BatchTest(unittest.TestCase):
+
+    def connect(self, **options):
+        self.sim = SimTarget(SimMemory())
+        datalink = SimDataLink(self.sim)
+        link = DAPLink(SWD(datalink, **options))
+        link.connect()
+        self.addCleanup(link.disconnect)
+
+        # count the data link transfers, and the reads outside of them
+        self.transfers = transfers = []
+        self.reads = reads = []
+        transfer, read = datalink.transfer, datalink.read
+        def recordTransfer(segments):
+            transfers.append(len(segments))
+            datalink.read = read
+            try:
+                return transfer(segments)
+            finally:
+                datalink.read = recordRead
+        def recordRead(rlen):
+            reads.append(rlen)
+            return read(rlen)
+        datalink.transfer, datalink.read = recordTransfer, recordRead
+        return link
+
+    def test_batched_by_default(self):
+        link = self.connect()
+        self.assertTrue(link.transport.overrunDetect)
+        self.assertTrue(link.DP.CTRLSTAT.ORUNDETECT.value)
+        del self.transfers[:], self.reads[:]
+
+        link.memWriteBlock(RAM, range(64))
+        self.assertEqual(len(self.transfers), 1)
+        self.assertEqual(self.reads, [])
+        self.assertEqual(link.memReadBlock(RAM, 64), range(64))
+        self.assertEqual(len(self.transfers), 2)
+
+    def test_one_at_a_time(self):
+        link = self.connect(overrunDetect=False)
+        self.assertFalse(link.DP.CTRLSTAT.ORUNDETECT.value)
+        del self.transfers[:], self.reads[:]
+
+        link.memWriteBlock(RAM, range(64))
+        self.assertEqual(self.transfers, [])
+        # each ACK is read on its own
+        self.assertGreater(len(self.reads), 64)
+        self.assertEqual(link.memReadBlock(RAM, 64), range(64))
+
+
+if __name__ == '__main__':
+    unittest.main()
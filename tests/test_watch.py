@@ -0,0 +1,115 @@
+import logging
+import threading
+import unittest
+
+from mmdev.datalink import SimDataLink, SimTarget, SimMemory
+from mmdev.devicelink import DAPLink
+from mmdev.target import Target
+from mmdev.transport import SWD
+from mmdev.watch import Watcher
+
+DEVFILE = 'data/ARM_Sample.svd'
+
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = SimMemory()
+        self.target = Target(DAPLink(SWD(SimDataLink(SimTarget(self.memory)))), DEVFILE)
+        self.target.connect()
+        self.addCleanup(self.target.disconnect)
+        self.timer = self.target.TIMER0
+        self.watcher = Watcher(self.target)
+        self.calls = []
+
+    def record(self, blk, old, new):
+        self.calls.append((blk.mnemonic, old, new))
+
+    def test_changes(self):
+        t = self.timer
+        self.watcher.watch(t.COUNT, self.record)
+        self.watcher.watch(t.SR.OV, self.record)
+        self.watcher.watch(t.SR.RUN, self.record)
+        self.assertEqual(len(self.watcher.plan), 2)
+
+        # the first poll only records values
+        self.assertFalse(self.watcher.poll())
+        self.assertEqual(self.calls, [])
+        self.assertFalse(self.watcher.poll())
+
+        self.memory.write(t.COUNT.address, 5)
+        self.memory.write(t.SR.address, 1 << 10, 2)
+        self.assertTrue(self.watcher.poll())
+        self.assertEqual(sorted(self.calls), [('COUNT', 0, 5), ('OV', 0, 1)])
+
+        # a change to bits that aren't watched changes the register, but
+        # calls nothing back
+        del self.calls[:]
+        self.memory.write(t.SR.address, 1 << 10 | 1 << 9, 2)
+        self.assertTrue(self.watcher.poll())
+        self.assertEqual(self.calls, [])
+
+    def test_when(self):
+        sr = self.timer.SR
+        self.watcher.watch(sr.OV, self.record, when=1)
+        self.watcher.poll()
+        self.memory.write(sr.address, 1 << 10, 2)
+        self.watcher.poll()
+        self.memory.write(sr.address, 0, 2)
+        self.watcher.poll()
+        self.assertEqual(self.calls, [('OV', 0, 1)])
+
+    def test_cancel(self):
+        w = self.watcher.watch(self.timer.COUNT, self.record)
+        self.watcher.watch(self.timer.CR, self.record)
+        self.watcher.poll()
+        w.cancel()
+        self.assertEqual(len(self.watcher.plan), 1)
+
+        self.memory.write(self.timer.COUNT.address, 5)
+        self.watcher.poll()
+        self.assertEqual(self.calls, [])
+
+    def test_callback_exception(self):
+        def fail(blk, old, new):
+            raise ValueError('failed')
+        # the exception is logged
+        logger = logging.getLogger('mmdev.watch')
+        logger.disabled = True
+        self.addCleanup(setattr, logger, 'disabled', False)
+
+        self.watcher.watch(self.timer.COUNT, fail)
+        self.watcher.watch(self.timer.COUNT, self.record)
+        self.watcher.poll()
+        self.memory.write(self.timer.COUNT.address, 5)
+        self.watcher.poll()
+        self.assertEqual(self.calls, [('COUNT', 0, 5)])
+
+    def test_side_effects(self):
+        sr = self.timer.SR
+        sr.readAction = 'clear'
+        self.assertRaises(ValueError, self.watcher.watch, sr.OV, self.record)
+        self.assertEqual(self.watcher.watches, ())
+
+        self.watcher.watch(sr.OV, self.record, sideEffects=True)
+        self.assertEqual(len(self.watcher.plan), 1)
+
+    def test_thread(self):
+        changed = threading.Event()
+        def record(blk, old, new):
+            self.record(blk, old, new)
+            changed.set()
+        self.watcher.watch(self.timer.COUNT, record)
+
+        with self.watcher:
+            # wait for the first poll, so that the write is seen as a change
+            while not self.watcher.polls:
+                changed.wait(0.001)
+            self.memory.write(self.timer.COUNT.address, 9)
+            self.assertTrue(changed.wait(5))
+        self.assertEqual(self.calls, [('COUNT', 0, 9)])
+        self.assertFalse(self.watcher._running)
+
+
+if __name__ == '__main__':
+    unittest.main()